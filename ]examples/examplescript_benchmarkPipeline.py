@@ -0,0 +1,214 @@
+"""
+This file benchmarks the whole pipeline on a synthetic collection, no real data or GPU is needed:
+    1. Write a synthetic Inria-like collection to a temporary uabRepoPaths.dataPath (see uabSyntheticCollection)
+    2. Make the collection (channel split included) and open it again
+    3. Split the channels of a copy of the collection, map the GT to (0, 1) & compute the channel means
+    4. Extract patches with uabPatchExtr
+    5. Read batches of patches with uabDataReader
+    6. Run a few training steps of a tiny UnetModelCrop
+    7. Evaluate the model on the validation tiles
+The duration (wall & cpu) of every step and the derived throughputs are written to a JSON file so that runs on
+different commits can be compared.  Run it from the root of the repository:
+    python "]examples/examplescript_benchmarkPipeline.py" --out benchmark.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import numpy as np
+import tensorflow as tf
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import uabRepoPaths
+import uabDataReader
+import uabCrossValMaker
+import uabPreprocClasses
+import uabSyntheticCollection
+import uab_collectionFunctions
+import uab_DataHandlerFunctions
+import bohaoCustom.uabPreprocClasses as bPreproc
+from bohaoCustom import uabMakeNetwork_UNet
+
+parser = argparse.ArgumentParser(description='Time every step of the pipeline on a synthetic collection')
+parser.add_argument('--out', default='benchmark.json', help='JSON file to write the results to')
+parser.add_argument('--tiles', type=int, default=10, help='number of tiles of the collection')
+parser.add_argument('--tile-size', type=int, default=1000, help='side of a tile in pixels')
+parser.add_argument('--channels', type=int, default=3, help='number of channels of the image files')
+parser.add_argument('--im-ext', default='RGB.tif', help='extension (postfix & format) of the image files')
+parser.add_argument('--gt-ext', default='GT.tif', help='extension (postfix & format) of the GT files')
+parser.add_argument('--chip-size', type=int, default=252, help='patch size, must be a valid input of UnetModelCrop')
+parser.add_argument('--batch-size', type=int, default=5, help='mini-batch size')
+parser.add_argument('--read-batches', type=int, default=50, help='number of batches read to time the reader')
+parser.add_argument('--train-steps', type=int, default=5, help='number of training steps')
+parser.add_argument('--start-filter-num', type=int, default=4, help='filters at the first layer of the model')
+parser.add_argument('--tmp-dir', default=None, help='where to make the temporary data & results directories')
+parser.add_argument('--keep', action='store_true', help='keep the temporary directory')
+parser.add_argument('--shards', action='store_true', help='extract the patches into one shard per tile')
+args = parser.parse_args()
+
+# experiment settings
+chip_size = (args.chip_size, args.chip_size)
+tile_size = (args.tile_size, args.tile_size)
+batch_size = args.batch_size
+col_name = 'synthetic'
+valid_tiles = [1]               # tile number(s) used for validation, the other tiles are used for training
+
+results = {'config': vars(args),
+           'platform': {'python': platform.python_version(), 'numpy': np.__version__, 'tensorflow': tf.__version__,
+                        'machine': platform.machine(), 'cpus': os.cpu_count()},
+           'steps': {}}
+
+
+def timeStep(name, func, *fargs, **fkwargs):
+    # run func and record its wall & cpu time under results['steps'][name]
+    print('=== {} ==='.format(name))
+    start_wall, start_cpu = time.time(), time.process_time()
+    out = func(*fargs, **fkwargs)
+    results['steps'][name] = {'seconds': time.time() - start_wall, 'cpu_seconds': time.process_time() - start_cpu}
+    return out
+
+
+def addRate(name, count, unit):
+    # throughput of a step, e.g., tiles/s or patches/s
+    step = results['steps'][name]
+    step[unit] = count
+    step['{}_per_second'.format(unit)] = count / step['seconds'] if step['seconds'] > 0 else None
+
+
+def readBatches(reader, n_batches):
+    # read n_batches batches, call this in a graph of its own so that its queue runners are not started by training
+    with tf.Session() as sess:
+        coord = tf.train.Coordinator()
+        threads = tf.train.start_queue_runners(coord=coord, sess=sess)
+        try:
+            for _ in range(n_batches):
+                reader.readerAction(sess)
+        finally:
+            coord.request_stop()
+            coord.join(threads)
+
+
+root = uabSyntheticCollection.useTemporaryRepo(args.tmp_dir)
+try:
+    # 1. synthetic collection
+    timeStep('generate', uabSyntheticCollection.makeSyntheticCollection, col_name, nTiles=args.tiles,
+             tileSize=tile_size, nChannels=args.channels, imExt=args.im_ext, gtExt=args.gt_ext)
+    addRate('generate', args.tiles, 'tiles')
+
+    # 2. collection, the first time the multi-channel files are split
+    blCol = timeStep('collection_init', uab_collectionFunctions.uabCollection, col_name)
+    addRate('collection_init', args.tiles, 'tiles')
+    blCol = timeStep('collection_reopen', uab_collectionFunctions.uabCollection, col_name)
+    blCol.readMetadata()
+    n_chans = args.channels
+    gt_id = n_chans                 # the GT comes after the (split) image channels
+
+    # 3. tile-level preprocessing
+    if n_chans > 1:
+        # the channels of the collection are split already, time the split on a copy of the collection that is not
+        # split (its extension 0 is the multi-channel image) so that every tile is decoded & written
+        uabSyntheticCollection.makeSyntheticCollection(col_name + '_split', nTiles=args.tiles, tileSize=tile_size,
+                                                       nChannels=args.channels, imExt=args.im_ext, gtExt=args.gt_ext)
+        splitCol = uab_collectionFunctions.uabCollection(col_name + '_split', splitChans=0)
+        im_parts = args.im_ext.split('.')
+        splitObj = uabPreprocClasses.uabPreprocSplitAll(
+            0, [im_parts[0] + str(c) + '.' + im_parts[1] for c in range(n_chans)],
+            ['Channel %s Layer %d' % (im_parts[0], c) for c in range(n_chans)])
+        timeStep('channel_split', splitObj.run, splitCol)
+        addRate('channel_split', args.tiles, 'tiles')
+    opDetObj = bPreproc.uabOperTileDivide(255)
+    rescObj = uabPreprocClasses.uabPreprocMultChanOp([], 'GT_Divide.tif', 'Map GT to (0, 1)', [gt_id], opDetObj)
+    timeStep('gt_divide', rescObj.run, blCol)
+    addRate('gt_divide', args.tiles, 'tiles')
+    blCol.readMetadata()
+    gt_div_id = blCol.getExtensionIdByName('GT_Divide.tif')
+    img_mean = timeStep('channel_means', blCol.getChannelMeans, list(range(n_chans)))
+    addRate('channel_means', args.tiles * n_chans, 'tile_channels')
+
+    # make network
+    X = tf.placeholder(tf.float32, shape=[None, chip_size[0], chip_size[1], n_chans], name='X')
+    y = tf.placeholder(tf.int32, shape=[None, chip_size[0], chip_size[1], 1], name='y')
+    mode = tf.placeholder(tf.bool, name='mode')
+    model = uabMakeNetwork_UNet.UnetModelCrop({'X': X, 'Y': y},
+                                              trainable=mode,
+                                              model_name='benchmark',
+                                              input_size=chip_size,
+                                              batch_size=batch_size,
+                                              learn_rate=1e-4,
+                                              decay_step=1,
+                                              decay_rate=0.1,
+                                              epochs=1,
+                                              start_filter_num=args.start_filter_num)
+    model.create_graph('X', class_num=2, start_filter_num=args.start_filter_num)
+
+    # 4. patch extraction
+    extrObj = uab_DataHandlerFunctions.uabPatchExtr(list(range(n_chans)) + [gt_div_id],
+                                                    cSize=chip_size,
+                                                    numPixOverlap=int(model.get_overlap()),
+                                                    extSave=['jpg'] * n_chans + ['png'],
+                                                    isTrain=True,
+                                                    gtInd=n_chans,
+                                                    pad=int(model.get_overlap() / 2),
+                                                    shards=args.shards)
+    patchDir = timeStep('patch_extraction', extrObj.run, blCol)
+    idx, file_list = uabCrossValMaker.uabUtilGetFolds(patchDir, 'fileList.txt', 'force_tile')
+    addRate('patch_extraction', len(file_list), 'patches')
+    train_keys = sorted(set(idx) - set(valid_tiles))
+    file_list_train = uabCrossValMaker.make_file_list_by_key(idx, file_list, train_keys)
+    file_list_valid = uabCrossValMaker.make_file_list_by_key(idx, file_list, valid_tiles)
+
+    # 5. reader throughput
+    with tf.Graph().as_default():
+        readerObj = uabDataReader.ImageLabelReader([n_chans], list(range(n_chans)), patchDir, file_list_train,
+                                                   chip_size, tile_size, batch_size, dataAug='flip,rotate',
+                                                   block_mean=np.append([0], img_mean))
+        timeStep('reader', readBatches, readerObj, args.read_batches)
+    addRate('reader', args.read_batches * batch_size, 'patches')
+
+    # 6. training
+    with tf.name_scope('image_loader'):
+        dataReader_train = uabDataReader.ImageLabelReader([n_chans], list(range(n_chans)), patchDir, file_list_train,
+                                                          chip_size, tile_size, batch_size, dataAug='flip,rotate',
+                                                          block_mean=np.append([0], img_mean))
+        dataReader_valid = uabDataReader.ImageLabelReader([n_chans], list(range(n_chans)), patchDir, file_list_valid,
+                                                          chip_size, tile_size, batch_size, dataAug=' ',
+                                                          block_mean=np.append([0], img_mean))
+    n_train = args.train_steps * batch_size
+    model.train_config('X', 'Y', n_train, batch_size, chip_size, uabRepoPaths.modelPath, loss_type='xent')
+    timeStep('train', model.run,
+             train_reader=dataReader_train,
+             valid_reader=dataReader_valid,
+             pretrained_model_dir=None,
+             isTrain=True,
+             img_mean=img_mean,
+             verb_step=args.train_steps + 1,
+             save_epoch=1,
+             gpu=None,
+             tile_size=tile_size,
+             patch_size=chip_size)
+    addRate('train', n_train + batch_size, 'patches')
+
+    # 7. evaluation on the validation tiles
+    file_list_tile, parent_dir = blCol.getAllTileByDirAndExt(list(range(n_chans)))
+    file_list_truth, parent_dir_truth = blCol.getAllTileByDirAndExt(gt_div_id)
+    idx, file_list_tile = uabCrossValMaker.uabUtilGetFolds(None, file_list_tile, 'force_tile')
+    idx_truth, file_list_truth = uabCrossValMaker.uabUtilGetFolds(None, file_list_truth, 'force_tile')
+    file_list_valid = uabCrossValMaker.make_file_list_by_key(idx, file_list_tile, valid_tiles)
+    file_list_valid_truth = uabCrossValMaker.make_file_list_by_key(idx_truth, file_list_truth, valid_tiles)
+    iou = timeStep('evaluate', model.evaluate, file_list_valid, file_list_valid_truth, parent_dir, parent_dir_truth,
+                   chip_size, tile_size, batch_size, img_mean, model.ckdir, None, save_result=False, verb=False)
+    addRate('evaluate', len(file_list_valid), 'tiles')
+    results['iou'] = dict((k, [int(a) for a in v]) for k, v in iou.items())
+    results['tile_cache'] = blCol.tileCache.getStats()
+finally:
+    if not args.keep:
+        uabSyntheticCollection.removeTemporaryRepo(root)
+
+results['total_seconds'] = sum([a['seconds'] for a in results['steps'].values()])
+with open(args.out, 'w') as f:
+    json.dump(results, f, indent=2, sort_keys=True)
+for name, step in results['steps'].items():
+    print('{:<20s} {:8.2f}s'.format(name, step['seconds']))
+print('results written to {}'.format(args.out))
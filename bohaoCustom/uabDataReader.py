@@ -2,6 +2,8 @@ import os
 import numpy as np
 import uabUtilreader
 import util_functions
+import uabPatchReaders
+import uabPatchManifest
 
 
 def get_tile_and_patch_num(chip_files):
@@ -55,11 +57,8 @@ class ImageLabelReader(object):
         # need to separate the file names into their own vectors
 
         if isinstance(chipFiles, str):
-            filename = os.path.join(parentDir, chipFiles)
-            with open(filename) as file:
-                chipFiles = file.readlines()
-
-            chipFiles = [a.strip().split(' ') for a in chipFiles]
+            # uabPatchList if the list has a sidecar (see uabPatchManifest)
+            chipFiles = uabPatchManifest.loadFileList(parentDir, chipFiles)
 
         if nChannels is not list:
             self.nChannels = [nChannels for a in range(len(chipFiles[0]))]
@@ -82,9 +81,12 @@ class ImageLabelReader(object):
         # Can only use a queue if all the files are jpg/png otherwise need to use the slower data-reader
         self.fileExts = [a.split('.')[-1] for a in el1]
 
-        fnameList = []
-        for row in chipFiles:
-            fnameList.append([row[i] for i in procInds])
+        if isinstance(chipFiles, uabPatchManifest.uabPatchList):
+            fnameList = chipFiles.selectChannels(procInds)
+        else:
+            fnameList = []
+            for row in chipFiles:
+                fnameList.append([row[i] for i in procInds])
         self.readManager = self.readFromDiskIteratorTrain(parentDir, fnameList, batchSize, self.chip_size, padding, dataAug)
 
     def readerAction(self, sess=None):
@@ -104,7 +106,7 @@ class ImageLabelReader(object):
                     blockList = []
                     nDims = 0
                     for file in row:
-                        img = util_functions.uabUtilAllTypeLoad(os.path.join(image_dir, file))
+                        img = uabPatchReaders.loadPatch(image_dir, file)
                         if len(img.shape) == 2:
                             img = np.expand_dims(img, axis=2)
                         nDims += img.shape[2]
@@ -145,7 +147,7 @@ class ImageLabelReader(object):
                         blockList = []
                         nDims = 0
                         for file in row:
-                            img = util_functions.uabUtilAllTypeLoad(os.path.join(image_dir, file))
+                            img = uabPatchReaders.loadPatch(image_dir, file)
                             if len(img.shape) == 2:
                                 img = np.expand_dims(img, axis=2)
                             nDims += img.shape[2]
@@ -182,7 +184,7 @@ class ImageLabelReader(object):
                     blockList = []
                     nDims = 0
                     for file in row:
-                        img = util_functions.uabUtilAllTypeLoad(os.path.join(image_dir, file))
+                        img = uabPatchReaders.loadPatch(image_dir, file)
                         if len(img.shape) == 2:
                             img = np.expand_dims(img, axis=2)
                         nDims += img.shape[2]
@@ -219,11 +221,8 @@ class ImageLabelReader_City(object):
         # need to separate the file names into their own vectors
 
         if isinstance(chipFiles, str):
-            filename = os.path.join(parentDir, chipFiles)
-            with open(filename) as file:
-                chipFiles = file.readlines()
-
-            chipFiles = [a.strip().split(' ') for a in chipFiles]
+            # uabPatchList if the list has a sidecar (see uabPatchManifest)
+            chipFiles = uabPatchManifest.loadFileList(parentDir, chipFiles)
 
         if nChannels is not list:
             self.nChannels = [nChannels for a in range(len(chipFiles[0]))]
@@ -246,9 +245,12 @@ class ImageLabelReader_City(object):
         # Can only use a queue if all the files are jpg/png otherwise need to use the slower data-reader
         self.fileExts = [a.split('.')[-1] for a in el1]
 
-        fnameList = []
-        for row in chipFiles:
-            fnameList.append([row[i] for i in procInds])
+        if isinstance(chipFiles, uabPatchManifest.uabPatchList):
+            fnameList = chipFiles.selectChannels(procInds)
+        else:
+            fnameList = []
+            for row in chipFiles:
+                fnameList.append([row[i] for i in procInds])
         self.readManager = self.readFromDiskIteratorTrain(parentDir, fnameList, batchSize,
                                                           self.chip_size, padding, dataAug)
 
@@ -271,7 +273,7 @@ class ImageLabelReader_City(object):
                 city_name = ''.join([a for a in row[0].split('_')[0] if not a.isdigit()])
                 cityid_batch[cnt%batch_size] = self.city_dict[city_name]
                 for file in row:
-                    img = util_functions.uabUtilAllTypeLoad(os.path.join(image_dir, file))
+                    img = uabPatchReaders.loadPatch(image_dir, file)
                     if len(img.shape) == 2:
                         img = np.expand_dims(img, axis=2)
                     nDims += img.shape[2]
@@ -332,7 +334,7 @@ class ImageLabelReaderCitySampleControl(ImageLabelReader):
                 blockList = []
                 nDims = 0
                 for file in row:
-                    img = util_functions.uabUtilAllTypeLoad(os.path.join(image_dir, file))
+                    img = uabPatchReaders.loadPatch(image_dir, file)
                     if len(img.shape) == 2:
                         img = np.expand_dims(img, axis=2)
                     nDims += img.shape[2]
@@ -397,7 +399,7 @@ class ImageLabelReaderGroupSampleControl(ImageLabelReader):
                 blockList = []
                 nDims = 0
                 for file in row:
-                    img = util_functions.uabUtilAllTypeLoad(os.path.join(image_dir, file))
+                    img = uabPatchReaders.loadPatch(image_dir, file)
                     if len(img.shape) == 2:
                         img = np.expand_dims(img, axis=2)
                     nDims += img.shape[2]
@@ -449,7 +451,7 @@ class ImageLabelReaderPatchSampleControl(ImageLabelReader):
                 blockList = []
                 nDims = 0
                 for file in row:
-                    img = util_functions.uabUtilAllTypeLoad(os.path.join(image_dir, file))
+                    img = uabPatchReaders.loadPatch(image_dir, file)
                     if len(img.shape) == 2:
                         img = np.expand_dims(img, axis=2)
                     nDims += img.shape[2]
@@ -504,7 +506,7 @@ class ImageLabelReaderBuilding(ImageLabelReader):
                 blockList = []
                 nDims = 0
                 for file in row:
-                    img = util_functions.uabUtilAllTypeLoad(os.path.join(image_dir, file))
+                    img = uabPatchReaders.loadPatch(image_dir, file)
                     if len(img.shape) == 2:
                         img = np.expand_dims(img, axis=2)
                     nDims += img.shape[2]
@@ -563,7 +565,7 @@ class ImageLabelReaderBuildingCustom(ImageLabelReader):
                 blockList = []
                 nDims = 0
                 for file in row:
-                    img = util_functions.uabUtilAllTypeLoad(os.path.join(image_dir, file))
+                    img = uabPatchReaders.loadPatch(image_dir, file)
                     if len(img.shape) == 2:
                         img = np.expand_dims(img, axis=2)
                     nDims += img.shape[2]
@@ -1,35 +1,41 @@
-import os
-import imageio
+import functools
 import numpy as np
 import tensorflow as tf
-from tqdm import tqdm
-from shutil import rmtree
-from shutil import copyfile
 import util_functions
-import uabBlockparent
 import uab_DataHandlerFunctions
-from uabBlockparent import uabBlock
+
+
+def compute_missing_mask(rgb):
+    # white (no data) pixels of an rgb patch or tile: the three channels at 255
+    return np.sum(rgb, axis=2, dtype=np.int64) == 255 * 3
 
 
 def compute_missing_percentage(rgb):
-    stack = np.sum(rgb, axis=2)
+    mpixel_map = compute_missing_mask(rgb).astype(np.int64)
+    return np.sum(mpixel_map) / (mpixel_map.shape[0] * mpixel_map.shape[1]), 1 - mpixel_map
 
-    def white_pixel(a):
-        if a == 255 * 3:
-            return 1
-        else:
-            return 0
 
-    map_func = np.vectorize(white_pixel)
-    mpixel_map = map_func(stack)
-    return np.sum(mpixel_map) / (mpixel_map.shape[0] ** 2), 1 - mpixel_map
+def purge_missing_patches(tiles, coords, cSize, rgbInds=(0, 1, 2), gtInd=-1, missing_percent=0.2):
+    # selection of uabPatchExtrPurge (see uab_DataHandlerFunctions.selectPatchesWorker()): the locations with less than
+    # missing_percent of white pixels, the gt of the tile is set to 0 on the white pixels
+    missing = compute_missing_mask(np.dstack([tiles[i] for i in rgbInds]))
+    coords = np.asarray(coords, dtype=np.int64).reshape(-1, 2)
+    m_pcent = util_functions.uabUtilWindowSums(missing, coords[:, 0], coords[:, 1], cSize[0], cSize[1]) / \
+              (cSize[0] * cSize[1])
+    tiles = list(tiles)
+    gt = tiles[gtInd]
+    tiles[gtInd] = np.where(missing if gt.ndim == 2 else missing[:, :, np.newaxis], 0, gt).astype(gt.dtype)
+    return [(int(y), int(x)) for (y, x), m in zip(coords, m_pcent) if m < missing_percent], tiles
 
 
 class uabPatchExtrPurge(uab_DataHandlerFunctions.uabPatchExtr):
+    # extracts the patches of the grid with less than missing_percent of white pixels (no data) in the rgb channels (the
+    # first three channels), with the gt masked out on the white pixels.  The white pixels are found on the tiles before
+    # anything is written, the tiles are spread over a pool of processes
     fname = 'fileList.txt'
 
     def __init__(self, runChannels, name='RegPurge', cSize=(224, 224), numPixOverlap=0, pad=0, extSave=None,
-                 isTrain=False, gtInd=-1):
+                 isTrain=False, gtInd=-1, shards=False, missing_percent=0.2, nProc=None):
         super(uabPatchExtrPurge, self).__init__(runChannels, name)
         # chip size
         self.chipExtrSize = cSize
@@ -40,110 +46,12 @@ class uabPatchExtrPurge(uab_DataHandlerFunctions.uabPatchExtr):
         self.saveExts = extSave
         self.isTrain = isTrain
         self.gtInd = gtInd
+        self.shards = shards
+        self.missing_percent = missing_percent
+        # nProc -> number of processes the tiles are spread over (defaults to the number of cpus)
+        self.nProc = nProc
 
     def runAction(self, colObj):
-        # function to extract the chips from the tiles
-
-        gridList = self.makeGrid([colObj.tileSize[0] + self.pad, colObj.tileSize[1] + self.pad])
-
-        directory = self.getDirectoryPaths(colObj)
-        # extract chips for all the specified extensions
-
-        # precompute extensions
-        fileExts = []
-        for cnt, chanId in enumerate(self.runChannels):
-            ext, _ = colObj.getExtensionInfoById(chanId)
-            if (self.saveExts is not None):
-                sExt = ext.split('.')
-                fileExts.append(sExt[0] + '.' + self.saveExts[cnt])
-            else:
-                fileExts.append(ext)
-
-        f_temp = []
-        for i in range(len(fileExts)):
-            f_temp.append([])
-        for ind, tilename in enumerate(tqdm(colObj.dataListForRun)):
-            if self.isTrain:
-                # check if gt exists for this tile
-                try:
-                    colObj.loadTileDataByExtension(tilename, self.runChannels[self.gtInd])
-                except IOError:
-                    # skip this if there's not enough channels
-                    continue
-            for cnt, (ext, chanId) in enumerate(zip(fileExts, self.runChannels)):
-                cIm = colObj.loadTileDataByExtension(tilename, chanId)
-                if self.pad > 0:
-                    cIm = np.pad(cIm, ((self.pad, self.pad), (self.pad, self.pad)), 'symmetric')
-                nDims = cIm.shape
-                for coordList in gridList:
-                    # extract patches for all the channels at coordinate location.
-                    # This is done so that the file containing patch names can have all
-                    # the extracted patches of one location on a single line
-                    x1 = int(coordList[0])
-                    x2 = int(coordList[1])
-                    finNm = tilename + '_y%dx%d_%s' % (x1, x2, ext)
-
-                    fPath = os.path.join(directory, finNm)
-                    isExt = util_functions.read_or_new_pickle(fPath, toLoad=0)
-                    if (isExt == 0):
-                        # extract a patch from the image
-                        if (len(nDims) == 2):
-                            chipDat = cIm[x1:x1 + self.chipExtrSize[0], x2:x2 + self.chipExtrSize[1]]
-                        else:
-                            chipDat = cIm[x1:x1 + self.chipExtrSize[0], x2:x2 + self.chipExtrSize[1], :]
-
-                        util_functions.read_or_new_pickle(fPath, toSave=1, variable_to_save=chipDat)
-
-                    f_temp[cnt].append(finNm)
-
-            with open(os.path.join(directory, uabPatchExtrPurge.fname), 'w') as file:
-                for i in range(len(f_temp[0])):
-                    s = []
-                    for j in range(len(f_temp)):
-                        s.append(f_temp[j][i])
-                    file.write('{}\n'.format(' '.join(s)))
-
-        # make new dir
-        directory_new = uabBlock.getBlockDir(os.path.join(uabBlockparent.outputDirs['patchExt'], colObj.colName,
-                                                          self.algoName() + 'Purge'))
-        if not os.path.exists(directory_new):
-            os.makedirs(directory_new)
-
-        files = os.path.join(directory, 'fileList.txt')
-        with open(files, 'r') as f:
-            file_list = f.readlines()
-        file_list_new = []
-
-        for file in tqdm(file_list):
-            f_array = file.strip().split(' ')
-            rgb = []
-            for i in f_array[:3]:
-                rgb.append(imageio.imread(os.path.join(directory, i)))
-            rgb = np.dstack(rgb)
-            gt = imageio.imread(os.path.join(directory, f_array[-1]))
-            m_pcent, mask = compute_missing_percentage(rgb)
-
-            if m_pcent < 0.2:
-                file_list_new.append(file)
-                for i in f_array[:3]:
-                    copyfile(os.path.join(directory, i), os.path.join(directory_new, i))
-                if m_pcent > 0:
-                    gt_new = (gt * mask).astype(np.uint8)
-                    imageio.imsave(os.path.join(directory_new, f_array[-1]), gt_new)
-                else:
-                    copyfile(os.path.join(directory, f_array[-1]), os.path.join(directory_new, f_array[-1]))
-
-        files = os.path.join(directory_new, 'fileList.txt')
-        with open(files, 'w+') as f:
-            for file in file_list_new:
-                f.write(file)
-
-        # remove old directory
-        rmtree(directory)
-
-        files = os.path.join(directory_new, 'state.txt')
-        with open(files, 'w+') as f:
-            f.write('Finished\n')
-
-        # rename directory
-        os.rename(directory_new, directory)
+        # function to extract the chips of the locations with enough data from the tiles
+        select = functools.partial(purge_missing_patches, gtInd=self.gtInd, missing_percent=self.missing_percent)
+        self.extractSelected(colObj, select, self.nProc)
@@ -5,27 +5,24 @@ Created on Fri Dec  8 13:08:49 2017
 
 @author: jordan
 """
+import numpy as np
 import util_functions        
-
-# parent class for tile operations.  Has a name and an action
-class uabOperTileOps(object):
-    def __init__(self, defName):
-        self.defaultName = defName
-        
-    def getName(self):
-        raise NotImplementedError('Must be implemented by the subclass')
-    
-    def run(self, tiles):
-        raise NotImplementedError('Must be implemented by the subclass')
+from uabPreprocClasses import uabOperTileOps
 
 class uabOperTileDiffRescale(uabOperTileOps):
-    def __init__(self, rescFact, rescBias, defName = 'DiffResc'):
+    def __init__(self, rescFact, rescBias, defName = 'DiffResc', outDtype = None):
+        #outDtype -> dtype of the rescaled difference (e.g., np.float32 for DSMs), None keeps the dtype numpy makes
         super(uabOperTileDiffRescale, self).__init__(defName)
         self.rescFact = rescFact
         self.rescBias = rescBias
+        self.rowwise = True
+        self.outDtype = None if outDtype is None else np.dtype(outDtype)
     
     def getName(self):
-        return '%s_rF%s_rB%s' % (self.defaultName, util_functions.d2s(self.rescFact,3), util_functions.d2s(self.rescBias,3))
+        name = '%s_rF%s_rB%s' % (self.defaultName, util_functions.d2s(self.rescFact,3), util_functions.d2s(self.rescBias,3))
+        if self.outDtype is not None:
+            name += '_%s' % self.outDtype.name
+        return name
     
     def run(self, tiles):
         return self.rescFact * (tiles[1] - tiles[0]) + self.rescBias
\ No newline at end of file
@@ -0,0 +1,19 @@
+import os
+import sys
+import pytest
+
+#the modules of the repository are imported by name, as the example scripts do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uabRepoPaths
+import util_functions
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    #uabRepoPaths pointed to a temporary directory (see uabSyntheticCollection.useTemporaryRepo())
+    for attr, name in [('parentDir', ''), ('dataPath', 'data'), ('resPath', 'Results'), ('modelPath', 'Models'),
+                       ('evalPath', 'Eval')]:
+        monkeypatch.setattr(uabRepoPaths, attr, str(tmp_path / name))
+        util_functions.uabUtilMakeDirectoryName(str(tmp_path / name))
+    return tmp_path
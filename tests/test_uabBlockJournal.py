@@ -0,0 +1,87 @@
+import os
+import zlib
+import numpy as np
+import uabBlockJournal
+
+
+def readLines(blockDir):
+    with open(os.path.join(blockDir, uabBlockJournal.journalFile), 'r') as f:
+        return f.read().split('\n')[:-1]
+
+
+def testChecksum():
+    a = np.arange(12, dtype=np.int16).reshape(3, 4)
+    b = np.ones((2, 2), dtype=np.float32)
+    assert uabBlockJournal.arrayChecksum(a) == zlib.crc32(a.tobytes())
+    #not contiguous: the checksum of the data as saved
+    assert uabBlockJournal.arrayChecksum(a[:, ::2]) == zlib.crc32(np.ascontiguousarray(a[:, ::2]).tobytes())
+    assert uabBlockJournal.arrayChecksum(b, uabBlockJournal.arrayChecksum(a)) == zlib.crc32(a.tobytes() + b.tobytes())
+
+
+def testRecordReopen(tmp_path):
+    blockDir = str(tmp_path)
+    journal = uabBlockJournal.uabBlockJournal(blockDir, 'p1')
+    journal.record('austin1', 'RGB0', 0x1234)
+    journal.record('austin1', 'GT', 'abcdef01')
+    journal.record('chicago1', 'RGB0', 5)
+    assert readLines(blockDir)[0] == uabBlockJournal.paramsTag + 'p1'
+    journal = uabBlockJournal.uabBlockJournal(blockDir, 'p1')
+    assert journal.isDone('austin1', 'RGB0') and journal.isDone('austin1', 'GT') and journal.isDone('chicago1', 'RGB0')
+    assert not journal.isDone('chicago1', 'GT')
+    assert journal.getChecksum('austin1', 'RGB0') == '00001234'
+    assert journal.getChecksum('chicago1', 'RGB0') == '00000005'
+    assert journal.getChecksum('chicago1', 'GT') is None
+
+
+def testCutLine(tmp_path):
+    #a line cut by a crash is ignored, that unit is done again
+    blockDir = str(tmp_path)
+    journal = uabBlockJournal.uabBlockJournal(blockDir, 'p1')
+    journal.record('austin1', 'RGB0', 1)
+    with open(journal.path, 'a') as f:
+        f.write('austin1\tRGB1\t00')
+    journal = uabBlockJournal.uabBlockJournal(blockDir, 'p1')
+    assert journal.isDone('austin1', 'RGB0') and not journal.isDone('austin1', 'RGB1')
+    journal.record('austin1', 'RGB1', 2)
+    assert uabBlockJournal.uabBlockJournal(blockDir, 'p1').getChecksum('austin1', 'RGB1') == '00000002'
+
+
+def testOtherParams(tmp_path):
+    blockDir = str(tmp_path)
+    journal = uabBlockJournal.uabBlockJournal(blockDir, 'p1')
+    journal.record('austin1', 'RGB0', 1)
+    journal = uabBlockJournal.uabBlockJournal(blockDir, 'p2')
+    assert not journal.isDone('austin1', 'RGB0')
+    journal.record('chicago1', 'RGB0', 2)
+    assert readLines(blockDir) == [uabBlockJournal.paramsTag + 'p2', 'chicago1\tRGB0\t00000002']
+    journal = uabBlockJournal.uabBlockJournal(blockDir, 'p1')
+    assert not journal.isDone('chicago1', 'RGB0')
+
+
+def testNoHeader(tmp_path):
+    #journals written before the parameters were recorded may be of other parameters, their units are dropped
+    blockDir = str(tmp_path)
+    with open(os.path.join(blockDir, uabBlockJournal.journalFile), 'w') as f:
+        f.write('austin1\tRGB0\t00000001\n')
+    assert uabBlockJournal.uabBlockJournal(blockDir).isDone('austin1', 'RGB0')
+    journal = uabBlockJournal.uabBlockJournal(blockDir, 'p1')
+    assert not journal.isDone('austin1', 'RGB0')
+    journal.record('austin1', 'RGB1', 2)
+    assert readLines(blockDir) == [uabBlockJournal.paramsTag + 'p1', 'austin1\tRGB1\t00000002']
+
+
+def testForgetClear(tmp_path):
+    blockDir = str(tmp_path)
+    journal = uabBlockJournal.uabBlockJournal(blockDir, 'p1')
+    for tile in ['austin1', 'chicago1', 'kitsap1']:
+        for chan in ['RGB0', 'GT']:
+            journal.record(tile, chan, 1)
+    journal.forget(['chicago1', 'vienna1'])
+    journal = uabBlockJournal.uabBlockJournal(blockDir, 'p1')
+    assert sorted(journal.units) == [('austin1', 'GT'), ('austin1', 'RGB0'), ('kitsap1', 'GT'), ('kitsap1', 'RGB0')]
+    journal.clear()
+    assert readLines(blockDir) == [uabBlockJournal.paramsTag + 'p1']
+    assert uabBlockJournal.uabBlockJournal(blockDir, 'p1').units == {}
+    #clearing a block that never ran writes nothing
+    uabBlockJournal.uabBlockJournal(str(tmp_path / 'other'), 'p1').clear()
+    assert not os.path.exists(str(tmp_path / 'other'))
@@ -0,0 +1,75 @@
+import os
+import numpy as np
+import pytest
+import uabChunkStore
+import util_functions
+
+codecs = ['zlib'] + (['lz4'] if uabChunkStore.lz4 is not None else [])
+
+
+@pytest.mark.parametrize('codec', codecs)
+@pytest.mark.parametrize('shape, chunks', [((50, 70), (16, 16)), ((64, 32), (16, 16)), ((33, 45, 3), (10, 20)),
+                                           ((5, 7), (512, 512))])
+@pytest.mark.parametrize('dtype', [np.uint8, np.int16, np.float32, np.float64, np.bool_])
+def testRoundTrip(tmp_path, codec, shape, chunks, dtype):
+    data = np.random.RandomState(0).uniform(-100, 300, size=shape)
+    data = data > 100 if dtype == np.bool_ else data.astype(dtype)
+    path = str(tmp_path / 'tile_DSM.chk')
+    uabChunkStore.save(path, data, chunks, codec)
+    out = uabChunkStore.load(path)
+    assert out.dtype == data.dtype and out.shape == data.shape
+    np.testing.assert_array_equal(out, data)
+    assert uabChunkStore.probe(path) == (shape, np.dtype(dtype).str)
+
+
+def testWindows(tmp_path):
+    data = np.random.RandomState(1).randint(0, 1000, size=(50, 70, 2)).astype(np.int32)
+    arr = uabChunkStore.save(str(tmp_path / 'tile.chk'), data, (16, 16))
+    rng = np.random.RandomState(2)
+    windows = [(0, 50, 0, 70), (0, 1, 0, 1), (16, 32, 16, 32), (15, 17, 15, 17), (49, 50, 0, 70)]
+    windows += [tuple(sorted(rng.randint(0, 51, 2))) + tuple(sorted(rng.randint(0, 71, 2))) for _ in range(20)]
+    for y0, y1, x0, x1 in windows:
+        np.testing.assert_array_equal(arr[y0:y1, x0:x1], data[y0:y1, x0:x1])
+    #open slices & slices past the end, as numpy
+    np.testing.assert_array_equal(arr[40:, :10], data[40:, :10])
+    np.testing.assert_array_equal(arr[45:100, 60:100], data[45:100, 60:100])
+
+
+def testUnalignedWrites(tmp_path):
+    path = str(tmp_path / 'tile.chk')
+    arr = uabChunkStore.uabChunkedArray.create(path, (40, 30), np.float32, chunks=(16, 16))
+    ref = np.zeros((40, 30), dtype=np.float32)
+    #chunks that were never written read as zeros
+    np.testing.assert_array_equal(arr.read(), ref)
+    rng = np.random.RandomState(3)
+    for y0, y1, x0, x1 in [(3, 20, 5, 29), (0, 16, 0, 16), (10, 40, 0, 30), (17, 18, 2, 3)]:
+        block = rng.uniform(size=(y1 - y0, x1 - x0)).astype(np.float32)
+        arr[y0:y1, x0:x1] = block
+        ref[y0:y1, x0:x1] = block
+        np.testing.assert_array_equal(uabChunkStore.load(path), ref)
+    arr[0:5, 0:5] = 7
+    ref[0:5, 0:5] = 7
+    np.testing.assert_array_equal(uabChunkStore.load(path), ref)
+
+
+def testCreateReplaces(tmp_path):
+    path = str(tmp_path / 'tile.chk')
+    uabChunkStore.save(path, np.ones((40, 40), dtype=np.uint8), (16, 16))
+    uabChunkStore.save(path, np.full((10, 10), 2, dtype=np.int16), (16, 16))
+    np.testing.assert_array_equal(uabChunkStore.load(path), np.full((10, 10), 2, dtype=np.int16))
+    assert sorted(os.listdir(path)) == ['c0_0', uabChunkStore.headerFile]
+
+
+def testAllTypeSaveLoad(tmp_path):
+    data = np.random.RandomState(4).uniform(size=(600, 530)).astype(np.float32)
+    path = str(tmp_path / 'tile_DSM.chk')
+    util_functions.uabUtilAllTypeSave(path, data)
+    assert uabChunkStore.exists(path)
+    np.testing.assert_array_equal(util_functions.uabUtilAllTypeLoad(path), data)
+    np.testing.assert_array_equal(util_functions.uabUtilAllTypeWindowLoad(path, 500, 10, 100, 520),
+                                  data[500:600, 10:530])
+
+
+def testMissing(tmp_path):
+    with pytest.raises(IOError):
+        uabChunkStore.load(str(tmp_path / 'missing.chk'))
@@ -0,0 +1,55 @@
+import os
+import numpy as np
+import pytest
+import uabTileStats
+import uabSyntheticCollection
+import uab_collectionFunctions
+import util_functions
+
+
+@pytest.fixture
+def colObj(repo):
+    uabSyntheticCollection.makeSyntheticCollection('a', nTiles=4, tileSize=(60, 50))
+    colObj = uab_collectionFunctions.uabCollection('a')
+    colObj.readMetadata()
+    return colObj
+
+
+def testClassCounts(tmp_path):
+    gt = np.random.RandomState(4).randint(0, 3, size=(25, 30)).astype(np.uint8)
+    path = str(tmp_path / 'tile_GT.npy')
+    np.save(path, gt)
+    tile, counts = uabTileStats.classCountWorker(('tile', path))
+    np.testing.assert_array_equal(counts, [np.sum(gt == c) for c in range(3)])
+    assert uabTileStats.classCountWorker(('tile', str(tmp_path / 'missing.npy'))) == ('tile', None)
+
+
+def testCollectionCounts(colObj, monkeypatch):
+    counted = []
+    classCountWorker = uabTileStats.classCountWorker
+    monkeypatch.setattr(uabTileStats, 'classCountWorker', lambda args: counted.append(args[0]) or classCountWorker(args))
+    counts = colObj.getClassCounts(3, nProc=1)
+    assert sorted(counts) == sorted(colObj.tileList) == sorted(counted)
+    gts = dict((tile, util_functions.uabUtilAllTypeLoad(colObj.getTilePath(tile, 3))) for tile in colObj.tileList)
+    for tile, c in counts.items():
+        np.testing.assert_array_equal(c, np.bincount(gts[tile].ravel(), minlength=len(c)))
+
+    #stored: a new collection object reads the counts of the tiles that didn't change
+    tile = colObj.tileList[1]
+    path = colObj.getTilePath(tile, 3)
+    os.remove(path)
+    util_functions.uabUtilAllTypeSave(path, np.zeros_like(gts[tile]))
+    os.utime(path, ns=(1, 1))
+    del counted[:]
+    colObj = uab_collectionFunctions.uabCollection('a')
+    colObj.readMetadata()
+    counts = colObj.getClassCounts(3, nProc=1)
+    assert counted == [tile]
+    assert counts[tile][0] == counts[tile].sum() == gts[tile].size
+
+    proportions = colObj.getClassProportions(3)
+    total = np.sum([np.bincount(gt.ravel(), minlength=len(proportions)) for t, gt in gts.items() if t != tile], axis=0)
+    total[0] += gts[tile].size
+    np.testing.assert_allclose(proportions, total / total.sum())
+    perTile = colObj.getClassProportions(3, tiles=[tile], perTile=True)
+    assert list(perTile) == [tile] and perTile[tile][0] == 1
@@ -0,0 +1,89 @@
+import os
+import multiprocessing
+import uabCollectionStore
+
+
+def openStore(metaDir):
+    return uabCollectionStore.uabCollectionStore(str(metaDir), os.path.join(str(metaDir), 'collection.txt'))
+
+
+def readListing(metaDir):
+    with open(os.path.join(str(metaDir), 'collection.txt'), 'r') as f:
+        return [tuple(line.rstrip('\n').split('\t')) for line in f.readlines()]
+
+
+def testImportLegacy(tmp_path):
+    #lines of collection.txt are imported as they are (duplicates included) so that the ids don't change
+    lines = [('RGB.tif', 'Original_Tiles', 'Original Layer 0'), ('GT.tif', 'Original_Tiles', 'Original Layer 1'),
+             ('RGB0.tif', 'TilePreproc/TileChanSplit_chan0', 'Channel RGB Layer 0'),
+             ('GT.tif', 'Original_Tiles', 'Original Layer 1'), ('DSM.tif', 'Original_Tiles', '')]
+    with open(str(tmp_path / 'collection.txt'), 'w') as f:
+        f.write('\n'.join(['\t'.join(a) for a in lines]) + '\n\n')
+    store = openStore(tmp_path)
+    assert store.getExtensions() == lines
+    assert store.getExtensionId('RGB0.tif') == 2
+    assert store.getExtensionId('GT.tif', 'Original_Tiles') == 1
+    assert store.getExtensionId('NDVI.tif') is None
+    #the listing is imported once, the store is the reference afterwards
+    with open(str(tmp_path / 'collection.txt'), 'w') as f:
+        f.write('other.tif\tOriginal_Tiles\t\n')
+    assert openStore(tmp_path).getExtensions() == lines
+
+
+def testRegisterExtension(tmp_path):
+    store = openStore(tmp_path)
+    assert not store.hasExtensions()
+    assert store.registerExtension('RGB.tif', 'Original_Tiles', 'image') == 0
+    assert store.registerExtension('GT.tif', 'Original_Tiles', 'gt') == 1
+    #an extension that exists only gets its description updated
+    assert store.registerExtension('RGB.tif', 'Original_Tiles', 'image of the tile') == 0
+    #the same extension in another directory is another tile-map
+    assert store.registerExtension('RGB.tif', 'TilePreproc/Copy', 'copy') == 2
+    expected = [('RGB.tif', 'Original_Tiles', 'image of the tile'), ('GT.tif', 'Original_Tiles', 'gt'),
+                ('RGB.tif', 'TilePreproc/Copy', 'copy')]
+    assert store.getExtensions() == expected
+    assert readListing(tmp_path) == expected
+
+
+def testRollbackJournal(tmp_path):
+    #no WAL, it does not work on network file systems
+    store = openStore(tmp_path)
+    assert store.connect().execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+    store.conn.execute('PRAGMA journal_mode=WAL')
+    store.conn.close()
+    store = openStore(tmp_path)
+    assert store.connect().execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+
+
+def registerWorker(args):
+    metaDir, worker = args
+    store = openStore(metaDir)
+    for i in range(20):
+        #every process registers the shared extensions & its own ones
+        store.registerExtension('shared%d.tif' % (i % 5), 'TilePreproc/Shared', 'from %d' % worker)
+        store.registerExtension('own%d_%d.tif' % (worker, i), 'TilePreproc/Own%d' % worker, '')
+    return worker
+
+
+def testConcurrentRegistration(tmp_path):
+    openStore(tmp_path).registerExtension('RGB.tif', 'Original_Tiles', 'image')
+    nProc = 6
+    pool = multiprocessing.Pool(nProc)
+    try:
+        assert sorted(pool.map(registerWorker, [(str(tmp_path), w) for w in range(nProc)])) == list(range(nProc))
+    finally:
+        pool.close()
+        pool.join()
+    store = openStore(tmp_path)
+    exts = store.getExtensions()
+    keys = [(ext, dirn) for ext, dirn, _ in exts]
+    #no entry is lost or duplicated & the ids are the positions in the listing
+    assert len(keys) == len(set(keys)) == 1 + 5 + nProc * 20
+    assert exts[0] == ('RGB.tif', 'Original_Tiles', 'image')
+    for i, (ext, dirn) in enumerate(keys):
+        assert store.getExtensionId(ext, dirn) == i
+    assert readListing(tmp_path) == exts
+    #the extensions of a process are in the order it registered them
+    for w in range(nProc):
+        own = [ext for ext, dirn in keys if dirn == 'TilePreproc/Own%d' % w]
+        assert own == ['own%d_%d.tif' % (w, i) for i in range(20)]
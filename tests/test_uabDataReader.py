@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+#the readers make tensorflow queues
+pytest.importorskip('tensorflow')
+
+import uabDataReader
+import uabTileManifest
+import uabUtilreader
+import util_functions
+
+
+def testIteratorPadded(tmp_path, monkeypatch):
+    #tiles of the right size are read padded by window, one header is probed per tile (not per channel)
+    rng = np.random.RandomState(0)
+    rows = []
+    tiles = []
+    for t in range(2):
+        tile = [rng.randint(0, 256, (30, 40, 3)).astype(np.uint8), rng.randint(0, 2, (30, 40)).astype(np.uint8)]
+        row = ['t%d_RGB.tif' % t, 't%d_GT.npy' % t]
+        for name, data in zip(row, tile):
+            util_functions.uabUtilAllTypeSave(str(tmp_path / name), data)
+        rows.append(row)
+        tiles.append(tile)
+    probed = []
+    probeTile = uabTileManifest.probeTile
+    monkeypatch.setattr(uabTileManifest, 'probeTile', lambda path: probed.append(path) or probeTile(path))
+
+    reader = uabDataReader.ImageLabelReader.__new__(uabDataReader.ImageLabelReader)
+    reader.block_mean = None
+    padding = np.array((4, 6))
+    tileDim = np.array((30, 40))
+    #the iterator fills the same batch array again
+    batches = [batch.copy() for batch in reader.readFromDiskIteratorTest(str(tmp_path), rows, 3, tileDim, (20, 28),
+                                                                         overlap=0, padding=padding)]
+    assert len(probed) == len(rows)
+    expected = []
+    for tile in tiles:
+        block = np.dstack([t if t.ndim == 3 else t[:, :, np.newaxis] for t in tile]).astype(np.float32)
+        block = np.pad(block, [(4, 4), (6, 6), (0, 0)], mode='symmetric')
+        patches = list(uabUtilreader.patchify(block, tileDim + padding * 2, (20, 28)))
+        expected += [np.stack(patches[i:i + 3]) for i in range(0, len(patches), 3)]
+    assert len(batches) == len(expected)
+    for batch, ref in zip(batches, expected):
+        np.testing.assert_array_equal(batch, ref)
@@ -0,0 +1,231 @@
+import os
+import numpy as np
+import pytest
+
+#the extractors make a tf.train.Coordinator
+pytest.importorskip('tensorflow')
+
+import uabBlockJournal
+import uabPatchShards
+import uabPatchReaders
+import uabSyntheticCollection
+import uab_collectionFunctions
+import uab_DataHandlerFunctions
+import util_functions
+
+
+@pytest.fixture
+def colObj(repo):
+    uabSyntheticCollection.makeSyntheticCollection('a', nTiles=3, tileSize=(120, 100))
+    colObj = uab_collectionFunctions.uabCollection('a')
+    colObj.readMetadata()
+    return colObj
+
+
+def readRows(directory):
+    with open(os.path.join(directory, 'fileList.txt'), 'r') as f:
+        return [line.split() for line in f.read().split('\n') if line]
+
+
+def checkPatches(colObj, directory, chans, pad, cSize):
+    #every patch of fileList.txt is the crop of the padded tile
+    rows = readRows(directory)
+    for row in rows:
+        for name, chanId in zip(row, chans):
+            tile, y, x, _ = uabPatchShards.parsePatchName(name)
+            data = util_functions.uabUtilAllTypeLoad(colObj.getTilePath(tile, chanId))
+            expected = util_functions.uabUtilWindowFromArray(data, y - pad, x - pad, cSize[0], cSize[1])
+            np.testing.assert_array_equal(uabPatchReaders.loadPatch(directory, name), expected)
+    return rows
+
+
+@pytest.mark.parametrize('shards', [False, True])
+def testRand(colObj, shards):
+    np.random.seed(0)
+    block = uab_DataHandlerFunctions.uabPatchExtrRand([0, 1], cSize=(32, 24), numPerTile=6, pad=4, shards=shards,
+                                                      nThreads=2)
+    directory = block.run(colObj)
+    rows = checkPatches(colObj, directory, [0, 1], 4, (32, 24))
+    assert len(rows) == 6 * len(colObj.dataListForRun)
+    units = uabBlockJournal.uabBlockJournal(directory).units
+    assert len(units) == len(colObj.dataListForRun) * (1 if shards else 2)
+
+
+def testRandResume(colObj):
+    #a channel that was not recorded is written at the random locations of the channels of its tile that were
+    np.random.seed(0)
+    block = uab_DataHandlerFunctions.uabPatchExtrRand([0, 1], cSize=(32, 24), numPerTile=6, nThreads=2)
+    directory = block.run(colObj)
+    rows = readRows(directory)
+    tile = colObj.dataListForRun[1]
+    ext = uabPatchShards.parsePatchName(rows[0][1])[3]
+    journal = block.getJournal(colObj)
+    del journal.units[(tile, ext)]
+    journal.save()
+    for name in os.listdir(directory):
+        if name.startswith(tile) and name.endswith(ext):
+            os.remove(os.path.join(directory, name))
+    with open(os.path.join(directory, 'state.txt'), 'w') as f:
+        f.write('Incomplete\n')
+
+    np.random.seed(1)
+    block.run(colObj)
+    resumed = checkPatches(colObj, directory, [0, 1], 0, (32, 24))
+    assert sorted(resumed) == sorted(rows)
+    assert block.getJournal(colObj).isDone(tile, ext)
+
+
+def whiteOut(colObj):
+    #white (no data) pixels in the top left corner of the rgb tiles
+    for tile in colObj.dataListForRun:
+        for chanId in range(3):
+            path = colObj.getTilePath(tile, chanId)
+            data = util_functions.uabUtilAllTypeLoad(path)
+            data[:50, :60] = 255
+            os.remove(path)
+            util_functions.uabUtilAllTypeSave(path, data)
+
+
+def testPurgeMissing():
+    #the white fraction of every location from the window sums, as compute_missing_percentage() of the patches
+    from bohaoCustom import uabPatchExtrPurge
+    rng = np.random.RandomState(0)
+    rgb = rng.randint(250, 256, (60, 70, 3)).astype(np.uint8)
+    rgb[10:40, 5:30] = 255
+    gt = rng.randint(0, 2, (60, 70)).astype(np.uint8)
+    tiles = [rgb[:, :, 0], rgb[:, :, 1], rgb[:, :, 2], gt]
+    coords = [(y, x) for y in range(0, 45, 7) for x in range(0, 55, 9)]
+    selected, purged = uabPatchExtrPurge.purge_missing_patches(tiles, coords, (16, 16), missing_percent=0.2)
+    expected = [(y, x) for y, x in coords
+                if uabPatchExtrPurge.compute_missing_percentage(rgb[y:y + 16, x:x + 16])[0] < 0.2]
+    assert selected == expected and 0 < len(selected) < len(coords)
+    missing = uabPatchExtrPurge.compute_missing_mask(rgb)
+    np.testing.assert_array_equal(purged[-1], np.where(missing, 0, gt))
+    assert purged[-1].dtype == gt.dtype
+    #the rgb channels are left as they are
+    assert all([a is b for a, b in zip(purged[:3], tiles[:3])])
+
+
+@pytest.mark.parametrize('shards', [False, True])
+def testSelectResume(colObj, shards, monkeypatch):
+    #the tiles whose units are in the journal are not loaded again, the others only write their channels that are not
+    from bohaoCustom import uabPatchExtrPurge
+    whiteOut(colObj)
+    block = uabPatchExtrPurge.uabPatchExtrPurge([0, 1, 2, 3], cSize=(32, 24), numPixOverlap=8, gtInd=3,
+                                                shards=shards, nProc=1)
+    directory = block.run(colObj)
+    rows = readRows(directory)
+    assert 0 < len(rows) < len(block.makeGrid([120, 100])) * len(colObj.dataListForRun)
+    with open(os.path.join(directory, 'fileList.txt'), 'r') as f:
+        fileList = f.read()
+
+    tile = colObj.dataListForRun[1]
+    journal = block.getJournal(colObj)
+    unit = uabPatchShards.shardUnit if shards else uabPatchShards.parsePatchName(rows[0][2])[3]
+    del journal.units[(tile, unit)]
+    journal.save()
+    with open(os.path.join(directory, 'state.txt'), 'w') as f:
+        f.write('Incomplete\n')
+    loaded = []
+    saved = []
+    loadTileSource = uab_DataHandlerFunctions.loadTileSource
+    monkeypatch.setattr(uab_DataHandlerFunctions, 'loadTileSource',
+                        lambda source, pad: loaded.append(source) or loadTileSource(source, pad))
+    uabUtilAllTypeSave = util_functions.uabUtilAllTypeSave
+    monkeypatch.setattr(util_functions, 'uabUtilAllTypeSave',
+                        lambda path, data: saved.append(os.path.basename(path)) or uabUtilAllTypeSave(path, data))
+    block.run(colObj)
+    with open(os.path.join(directory, 'fileList.txt'), 'r') as f:
+        assert f.read() == fileList
+    assert [os.path.basename(source).startswith(tile) for source in loaded] == [True] * 4
+    if not shards:
+        #the patches of the channel were there already
+        assert saved == []
+    assert block.getJournal(colObj).isDone(tile, unit)
+
+
+def testClassSelectCandidates(colObj, monkeypatch):
+    #the tiles without enough pixels of the class are left out from the class counts, without loading them
+    from bohaoCustom import uabPatchExtrClassSelect
+    empty = colObj.dataListForRun[0]
+    path = colObj.getTilePath(empty, 3)
+    gt = util_functions.uabUtilAllTypeLoad(path)
+    os.remove(path)
+    util_functions.uabUtilAllTypeSave(path, np.zeros_like(gt))
+    colObj.manifest.refresh(colObj.getExtensionInfoById(3)[1])
+    kwargs = dict(cSize=(32, 24), numPixOverlap=8, pad=4, gtInd=1, class_label=255, select_percent=0.05, nProc=1)
+    block = uabPatchExtrClassSelect.uabPatchExtrClassSelect([0, 3], **kwargs)
+    assert sorted(block.getCandidateTiles(colObj)) == sorted(colObj.dataListForRun[1:])
+    loaded = []
+    loadTileSource = uab_DataHandlerFunctions.loadTileSource
+    monkeypatch.setattr(uab_DataHandlerFunctions, 'loadTileSource',
+                        lambda source, pad: loaded.append(source) or loadTileSource(source, pad))
+    rows = readRows(block.run(colObj))
+    assert len(rows) > 0 and not any([os.path.basename(source).startswith(empty) for source in loaded])
+
+    #the same patches as with all the tiles
+    monkeypatch.setattr(uabPatchExtrClassSelect.uabPatchExtrClassSelect, 'getCandidateTiles', lambda self, colObj: None)
+    allTiles = uabPatchExtrClassSelect.uabPatchExtrClassSelect([0, 3], name='All', **kwargs)
+    assert readRows(allTiles.run(colObj)) == rows
+
+
+@pytest.mark.parametrize('shape', [(40, 50), (40, 50, 3)])
+def testPatchViews(shape):
+    #views[y, x] is the crop of the patch at (y, x), without copying the tile
+    cIm = np.arange(np.prod(shape), dtype=np.int32).reshape(shape)
+    views = uab_DataHandlerFunctions.getPatchViews(cIm, (8, 10))
+    assert views.shape[:4] == (33, 41, 8, 10) and views.shape[4:] == shape[2:]
+    assert np.shares_memory(views, cIm) and not views.flags.writeable
+    for y in range(33):
+        for x in range(41):
+            np.testing.assert_array_equal(views[y, x], cIm[y:y + 8, x:x + 10])
+
+
+@pytest.mark.parametrize('pad', [0, 6])
+def testGrid(colObj, pad):
+    #the patches, their order in fileList.txt & the checksums of the journal are the crops of the padded tiles of the
+    #extraction patch by patch
+    chans = [0, 1, 3]
+    block = uab_DataHandlerFunctions.uabPatchExtr(chans, cSize=(32, 24), numPixOverlap=8, pad=pad, nThreads=2)
+    directory = block.run(colObj)
+    coords = [(int(y), int(x)) for y, x in block.makeGrid([120 + pad, 100 + pad])]
+    exts = block.getFileExts(colObj)
+    assert readRows(directory) == [[tile + '_y%dx%d_%s' % (y, x, ext) for ext in exts]
+                                   for tile in colObj.dataListForRun for y, x in coords]
+    journal = block.getJournal(colObj)
+    for tile in colObj.dataListForRun:
+        for chanId, ext in zip(chans, exts):
+            cIm = util_functions.uabUtilAllTypeLoad(colObj.getTilePath(tile, chanId))
+            if pad > 0:
+                cIm = np.pad(cIm, ((pad, pad), (pad, pad)), 'symmetric')
+            checksum = 0
+            for y, x in coords:
+                chipDat = cIm[y:y + 32, x:x + 24]
+                checksum = uabBlockJournal.arrayChecksum(chipDat, checksum)
+                name = tile + '_y%dx%d_%s' % (y, x, ext)
+                assert not uabPatchReaders.isSharded(directory, name)
+                np.testing.assert_array_equal(uabPatchReaders.loadPatch(directory, name), chipDat)
+            assert journal.units[(tile, ext)] == '%08x' % checksum
+
+
+@pytest.mark.parametrize('memmapTiles', [True, False])
+@pytest.mark.parametrize('pad', [0, 6])
+def testVirtual(colObj, memmapTiles, pad):
+    #the patches read from a virtual extraction are the patches saved by the extraction with the same grid
+    tile = colObj.dataListForRun[1]
+    os.remove(colObj.getTilePath(tile, 3))
+    colObj.manifest.refresh(colObj.getExtensionInfoById(3)[1])
+    kwargs = dict(cSize=(32, 24), numPixOverlap=8, pad=pad, isTrain=True, gtInd=2)
+    saved = uab_DataHandlerFunctions.uabPatchExtr([0, 1, 3], nThreads=2, **kwargs).run(colObj)
+    virtual = uab_DataHandlerFunctions.uabPatchExtrVirtual([0, 1, 3], memmapTiles=memmapTiles, **kwargs).run(colObj)
+    rows = readRows(saved)
+    #the tile without GT is skipped by both
+    assert readRows(virtual) == rows and not any([row[0].startswith(tile) for row in rows])
+    assert not [name for row in rows for name in row if os.path.exists(os.path.join(virtual, name))]
+    for row in rows:
+        for name in row:
+            assert uabPatchReaders.isSharded(virtual, name)
+            patch = uabPatchReaders.loadPatch(virtual, name)
+            expected = uabPatchReaders.loadPatch(saved, name)
+            assert patch.dtype == expected.dtype
+            np.testing.assert_array_equal(patch, expected)
@@ -0,0 +1,98 @@
+import os
+import numpy as np
+import pytest
+import uabCrossValMaker
+import uabPatchManifest
+
+exts = ['RGB0.jpg', 'GT_Divide.png']
+#tiles with their grids, in the order of the extraction
+tileCoords = [('austin1', [(0, 0), (0, 40), (36, 0), (36, 40)]), ('chicago12', [(5, 7)]), ('kitsap1', []),
+              ('austin2', [(10, 20), (10, 20)])]
+
+
+def textRows():
+    #rows of fileList.txt as the extractors wrote them before the sidecar
+    return [[tile + '_y%dx%d_%s' % (y, x, ext) for ext in exts] for tile, coords in tileCoords for y, x in coords]
+
+
+def readText(directory):
+    with open(os.path.join(directory, 'fileList.txt')) as file:
+        return [a.strip().split(' ') for a in file.readlines()]
+
+
+def writeManifest(directory):
+    manifest = uabPatchManifest.uabPatchManifestWriter(directory, 'fileList.txt', exts)
+    for tile, coords in tileCoords:
+        manifest.addTile(tile, coords)
+    return manifest.close()
+
+
+def makeOlder(path):
+    #mtime a few seconds before the list, whatever the resolution of the file system
+    mtime = os.path.getmtime(os.path.join(os.path.dirname(path), 'fileList.txt'))
+    os.utime(path, (mtime - 10, mtime - 10))
+
+
+def testRoundTrip(tmp_path):
+    directory = str(tmp_path)
+    rows = writeManifest(directory)
+    assert sorted(os.listdir(directory)) == ['fileList.npz', 'fileList.txt']
+    assert readText(directory) == textRows()
+    patchList = uabPatchManifest.loadFileList(directory, 'fileList.txt')
+    assert isinstance(patchList, uabPatchManifest.uabPatchList)
+    assert len(patchList) == len(rows) == len(textRows())
+    assert list(patchList) == [patchList[i] for i in range(len(patchList))] == textRows()
+    #the tiles without a patch are kept in the tile table
+    assert list(patchList.tiles) == [tile for tile, _ in tileCoords]
+    assert list(patchList.getTileNames()) == [row[0].split('_')[0] for row in textRows()]
+    assert list(patchList.getTileRows()) == [0, 4, 5]
+
+    #selections of rows & channels are the same names as selecting the text rows
+    keep = [5, 0, 3]
+    assert list(uabPatchManifest.selectRows(patchList, keep)) == [textRows()[i] for i in keep]
+    assert list(patchList[1:4]) == textRows()[1:4]
+    assert list(patchList.selectChannels([1])) == [[row[1]] for row in textRows()]
+
+
+def testStale(tmp_path):
+    directory = str(tmp_path)
+    writeManifest(directory)
+    #a list edited by hand after the extraction is read as text
+    edited = textRows()[:2]
+    with open(os.path.join(directory, 'fileList.txt'), 'w') as file:
+        file.write(''.join(['{}\n'.format(' '.join(row)) for row in edited]))
+    makeOlder(os.path.join(directory, 'fileList.npz'))
+    assert uabPatchManifest.loadFileList(directory, 'fileList.txt') == edited
+
+    #a list saved as text drops the sidecar of the previous list
+    uabPatchManifest.saveFileList(directory, 'fileList.txt', edited[:1])
+    assert os.listdir(directory) == ['fileList.txt']
+    assert uabPatchManifest.loadFileList(directory, 'fileList.txt') == edited[:1]
+
+
+def testAbort(tmp_path):
+    #an interrupted extraction leaves the previous list & sidecar as they were
+    directory = str(tmp_path)
+    writeManifest(directory)
+    manifest = uabPatchManifest.uabPatchManifestWriter(directory, 'fileList.txt', exts)
+    manifest.addTile('austin3', [(1, 1)])
+    manifest.abort()
+    assert sorted(os.listdir(directory)) == ['fileList.npz', 'fileList.txt']
+    assert readText(directory) == textRows()
+    assert list(uabPatchManifest.loadFileList(directory, 'fileList.txt')) == textRows()
+
+
+@pytest.mark.parametrize('xval', [uabCrossValMaker.uabXvalByCity, uabCrossValMaker.uabXvalByTile,
+                                  uabCrossValMaker.uabXvalByForceTile])
+def testFolds(tmp_path, xval):
+    #the folds & selections of a list with a sidecar are those of its text rows
+    directory = str(tmp_path)
+    writeManifest(directory)
+    folds, patchList = xval().getFolds(directory, 'fileList.txt')
+    textFolds, rows = xval().getFolds(directory, readText(directory))
+    assert folds == textFolds
+    for key in set(folds):
+        selected = uabCrossValMaker.make_file_list_by_key(np.array(folds), patchList, key)
+        assert list(selected) == [row for row, fold in zip(rows, textFolds) if fold == key]
+        filtered = uabCrossValMaker.make_file_list_by_key(folds, patchList, key, filter_list='y36')
+        assert list(filtered) == [row for row, fold in zip(rows, textFolds) if fold == key and 'y36' not in row[0]]
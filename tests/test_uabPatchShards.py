@@ -0,0 +1,95 @@
+import os
+import numpy as np
+import uabBlockJournal
+import uabPatchShards
+import uabPatchReaders
+import util_functions
+
+
+def makeTiles():
+    rng = np.random.RandomState(0)
+    return [rng.randint(0, 256, (40, 50, 3)).astype(np.uint8), rng.randint(0, 2, (40, 50)).astype(np.uint8)]
+
+
+exts = ['RGB.png', 'GT.png']
+cSize = (8, 10)
+#a random grid can repeat a location
+coords = [(0, 0), (5, 7), (32, 40), (5, 7)]
+
+
+def patchName(tile, y, x, ext):
+    return tile + '_y%dx%d_%s' % (y, x, ext)
+
+
+def testShardRoundTrip(tmp_path):
+    directory = str(tmp_path)
+    tiles = makeTiles()
+    checksum = uabPatchShards.writeShard(directory, 't_1', tiles, coords, cSize, exts)
+    assert sorted(os.listdir(directory)) == ['t_1_shard.npy', 't_1_shard.npz']
+    assert uabPatchShards.getShardCoords(directory, 't_1') == coords
+    shard = uabPatchShards.uabPatchShard(*uabPatchShards.getShardPaths(directory, 't_1'))
+    assert shard.data.dtype == np.uint8 and shard.data.shape == (len(coords), 8, 10, 4)
+    rows = 0
+    for row in range(len(coords)):
+        rows = uabBlockJournal.arrayChecksum(shard.data[row], rows)
+    assert rows == checksum
+    for y, x in coords:
+        for ext, tile in zip(exts, tiles):
+            name = patchName('t_1', y, x, ext)
+            assert uabPatchReaders.isSharded(directory, name)
+            patch = uabPatchReaders.loadPatch(directory, name)
+            assert patch.dtype == tile.dtype
+            np.testing.assert_array_equal(patch, tile[y:y + cSize[0], x:x + cSize[1]])
+
+
+def testMixedDtypes(tmp_path):
+    directory = str(tmp_path)
+    tiles = [np.arange(2000, dtype=np.uint8).reshape(40, 50), np.linspace(-1, 1, 2000, dtype=np.float32).reshape(40, 50)]
+    uabPatchShards.writeShard(directory, 't_1', tiles, coords, cSize, ['A.png', 'B.npy'])
+    for y, x in coords:
+        for ext, tile in zip(['A.png', 'B.npy'], tiles):
+            patch = uabPatchReaders.loadPatch(directory, patchName('t_1', y, x, ext))
+            assert patch.dtype == tile.dtype
+            np.testing.assert_array_equal(patch, tile[y:y + cSize[0], x:x + cSize[1]])
+
+
+def testRewrittenShard(tmp_path):
+    #the reader opens a shard again once it was rewritten
+    directory = str(tmp_path)
+    tiles = makeTiles()
+    uabPatchShards.writeShard(directory, 't_1', tiles, coords, cSize, exts)
+    name = patchName('t_1', 0, 0, 'GT.png')
+    np.testing.assert_array_equal(uabPatchReaders.loadPatch(directory, name), tiles[1][:8, :10])
+    tiles[1] = 1 - tiles[1]
+    uabPatchShards.writeShard(directory, 't_1', tiles, [(0, 0)], cSize, exts)
+    np.testing.assert_array_equal(uabPatchReaders.loadPatch(directory, name), tiles[1][:8, :10])
+
+
+def testCopyPatches(tmp_path):
+    src, dst = str(tmp_path / 'src'), str(tmp_path / 'dst')
+    os.makedirs(src)
+    os.makedirs(dst)
+    tiles = makeTiles()
+    #t_1 in a shard, t_2 one file per patch
+    uabPatchShards.writeShard(src, 't_1', tiles, coords, cSize, exts)
+    for y, x in coords:
+        for ext, tile in zip(exts, tiles):
+            util_functions.uabUtilAllTypeSave(os.path.join(src, patchName('t_2', y, x, ext)), tile[y:y + cSize[0], x:x + cSize[1]])
+    kept = [(32, 40), (0, 0)]
+    rows = [[patchName(tile, y, x, ext) for ext in exts] for tile in ['t_1', 't_2'] for y, x in kept]
+    #a patch that is changed by the selection (e.g., purged labels)
+    purged = patchName('t_1', 0, 0, 'GT.png')
+    uabPatchShards.copyPatches(src, dst, rows, {purged: np.zeros(cSize, dtype=np.uint8)})
+
+    #only the rows that are kept, in their order
+    assert uabPatchShards.getShardCoords(dst, 't_1') == kept
+    assert sorted([f for f in os.listdir(dst) if f.startswith('t_2')]) == sorted([n for row in rows[2:] for n in row])
+    for row in rows:
+        for name in row:
+            tile, y, x, ext = uabPatchShards.parsePatchName(name)
+            expected = tiles[exts.index(ext)][y:y + cSize[0], x:x + cSize[1]]
+            if name == purged:
+                expected = np.zeros(cSize, dtype=np.uint8)
+            np.testing.assert_array_equal(uabPatchReaders.loadPatch(dst, name), expected)
+    #the source is left as it is
+    np.testing.assert_array_equal(uabPatchReaders.loadPatch(src, purged), tiles[1][:8, :10])
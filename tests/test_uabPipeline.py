@@ -0,0 +1,106 @@
+import os
+import numpy as np
+import pytest
+import uabPipeline
+import uabPreprocClasses
+import uabSyntheticCollection
+import uab_collectionFunctions
+import util_functions
+
+
+class uabOperTileHalfFailing(uabPreprocClasses.uabOperTileOps):
+    #half of a tile, fails on the failOn-th tile it makes (an interrupted run)
+
+    def __init__(self, failOn=None):
+        super(uabOperTileHalfFailing, self).__init__('HalfFail')
+        self.failOn = failOn
+        self.calls = 0
+
+    def getName(self):
+        return self.defaultName
+
+    def run(self, tiles):
+        self.calls += 1
+        if self.failOn is not None and self.calls >= self.failOn:
+            raise RuntimeError('interrupted')
+        return (tiles[0] // 2).astype(np.uint8)
+
+
+@pytest.fixture
+def collection(repo):
+    uabSyntheticCollection.makeSyntheticCollection('a', nTiles=4, tileSize=(80, 60))
+    colObj = uab_collectionFunctions.uabCollection('a')
+    colObj.readMetadata()
+    return colObj
+
+
+def getStamps(block, colObj):
+    stamps = {}
+    for tile in colObj.dataListForRun:
+        path = block.getTileOutputPaths(colObj, tile)['R_Half.tif']
+        if os.path.exists(path):
+            st = os.stat(path)
+            stamps[tile] = (st.st_ino, st.st_mtime_ns)
+    return stamps
+
+
+@pytest.mark.parametrize('maxParallel', [1, 2])
+def testResumeFromJournal(collection, maxParallel, monkeypatch):
+    op = uabOperTileHalfFailing(failOn=3)
+    block = uabPreprocClasses.uabPreprocMultChanOp([], 'R_Half.tif', 'half red', [0], op, nProc=1)
+
+    def run():
+        pipe = uabPipeline.uabPipeline(collection, maxParallel=maxParallel)
+        pipe.add(block)
+        return pipe.run()
+
+    with pytest.raises(RuntimeError):
+        run()
+    done = getStamps(block, collection)
+    journal = block.getJournal(collection)
+    assert len(done) == 2 and all([journal.isDone(tile, 'R_Half.tif') for tile in done])
+
+    op.failOn = None
+    op.calls = 0
+    #files decoded by the resumed run (in this process with maxParallel = 1)
+    loaded = []
+    load = util_functions.uabUtilAllTypeLoad
+    monkeypatch.setattr(util_functions, 'uabUtilAllTypeLoad', lambda path: loaded.append(path) or load(path))
+    run()
+    monkeypatch.setattr(util_functions, 'uabUtilAllTypeLoad', load)
+    #the tiles of the interrupted run are kept, only the others are made
+    after = getStamps(block, collection)
+    assert sorted(after) == sorted(collection.dataListForRun)
+    assert dict((tile, after[tile]) for tile in done) == done
+    if maxParallel == 1:
+        #the tiles in the journal are neither made nor read again
+        assert op.calls == len(collection.dataListForRun) - len(done)
+        assert not [path for path in loaded if 'R_Half' in path]
+        assert len(loaded) == len(collection.dataListForRun) - len(done)
+    for tile in collection.dataListForRun:
+        red = util_functions.uabUtilAllTypeLoad(collection.getTilePath(tile, 0))
+        out = util_functions.uabUtilAllTypeLoad(block.getTileOutputPaths(collection, tile)['R_Half.tif'])
+        np.testing.assert_array_equal(out, red // 2)
+
+
+def testChangedInputs(collection):
+    #a finished block whose inputs changed for a tile only makes that tile again
+    block = uabPreprocClasses.uabPreprocMultChanOp([], 'R_Half.tif', 'half red', [0], uabOperTileHalfFailing(),
+                                                   nProc=1)
+    pipe = uabPipeline.uabPipeline(collection)
+    pipe.add(block)
+    pipe.run()
+    before = getStamps(block, collection)
+    tile = collection.dataListForRun[1]
+    red = collection.getTilePath(tile, 0)
+    data = util_functions.uabUtilAllTypeLoad(red)
+    os.remove(red)
+    util_functions.uabUtilAllTypeSave(red, 255 - data)
+    collection.invalidateTileCache(collection.getExtensionInfoById(0)[1])
+    pipe = uabPipeline.uabPipeline(collection)
+    pipe.add(block)
+    pipe.run()
+    after = getStamps(block, collection)
+    assert [t for t in collection.dataListForRun if after[t] != before[t]] == [tile]
+    out = util_functions.uabUtilAllTypeLoad(block.getTileOutputPaths(collection, tile)['R_Half.tif'])
+    np.testing.assert_array_equal(out, (255 - data) // 2)
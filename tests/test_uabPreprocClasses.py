@@ -0,0 +1,165 @@
+import os
+import numpy as np
+import pytest
+import uabPreprocClasses
+import uabSyntheticCollection
+import uab_collectionFunctions
+import util_functions
+import bohaoCustom.uabPreprocClasses as bPreproc
+import danielCustom.uabPreprocClasses as dPreproc
+
+
+class uabOperTileSum(uabPreprocClasses.uabOperTileOps):
+    #sum of the tiles it is given, whatever their number
+
+    def __init__(self):
+        super(uabOperTileSum, self).__init__('Sum')
+        self.rowwise = True
+        self.outDtype = np.int16
+
+    def getName(self):
+        return self.defaultName
+
+    def run(self, tiles):
+        return sum([t.astype(np.int16) for t in tiles])
+
+
+@pytest.fixture
+def colObj(repo):
+    uabSyntheticCollection.makeSyntheticCollection('a', nTiles=3, tileSize=(60, 50))
+    colObj = uab_collectionFunctions.uabCollection('a')
+    colObj.readMetadata()
+    return colObj
+
+
+def loadTile(colObj, tile, eid):
+    return util_functions.uabUtilAllTypeLoad(colObj.getTilePath(tile, eid))
+
+
+def removeTile(colObj, tile, eid):
+    os.remove(colObj.getTilePath(tile, eid))
+    colObj.manifest.refresh(colObj.getExtensionInfoById(eid)[1])
+
+
+def madeTiles(block, colObj):
+    return dict((tile, util_functions.uabUtilAllTypeLoad(path)) for tile in colObj.dataListForRun
+                for path in block.getTileOutputPaths(colObj, tile).values() if os.path.exists(path))
+
+
+def testStreamedMissingChannel(colObj):
+    #a tile without GT is made from the channels that exist, whether a channel of the operator is streamed or not
+    tile = colObj.dataListForRun[0]
+    removeTile(colObj, tile, 3)
+    half = uabPreprocClasses.uabPreprocMultChanOp([], 'R_Half.tif', 'half red', [0], bPreproc.uabOperTileDivide(2),
+                                                  nProc=1)
+    saved = uabPreprocClasses.uabPreprocMultChanOp([], 'Sum.npy', 'sum', [0, 3], uabOperTileSum(), nProc=1)
+    streamed = uabPreprocClasses.uabPreprocMultChanOp([], 'HalfSum.npy', 'sum', [half, 3], uabOperTileSum(), nProc=1)
+    saved.run(colObj)
+    streamed.run(colObj)
+    sums, halfSums = madeTiles(saved, colObj), madeTiles(streamed, colObj)
+    assert sorted(sums) == sorted(halfSums) == sorted(colObj.dataListForRun)
+    for t in colObj.dataListForRun:
+        red = loadTile(colObj, t, 0)
+        gt = 0 if t == tile else loadTile(colObj, t, 3).astype(np.int16)
+        np.testing.assert_array_equal(sums[t], red + gt)
+        np.testing.assert_array_equal(halfSums[t], (red / 2).astype(np.uint8) + gt)
+    assert uabPreprocClasses.hasChannelTile(colObj, tile, streamed)
+
+    #no channel at all: the tile is skipped
+    removeTile(colObj, tile, 0)
+    assert not uabPreprocClasses.hasChannelTile(colObj, tile, streamed)
+    assert not uabPreprocClasses.hasChannelTile(colObj, tile, half)
+
+
+def chainOps():
+    #rowwise operators with their output dtypes, same expressions as run() over the full tiles
+    return [dPreproc.uabOperTileDiffRescale(0.5, 10, outDtype=np.float32), bPreproc.uabOperTileDivide(3)]
+
+
+@pytest.mark.parametrize('chunkRows', [1, 7, 60, 100, None])
+def testRunChunked(chunkRows):
+    rng = np.random.RandomState(0)
+    tiles = [rng.randint(0, 256, (60, 50, 3)).astype(np.uint8), rng.randint(0, 256, (60, 50, 3)).astype(np.uint8)]
+    for op in [uabOperTileSum(), dPreproc.uabOperTileDiffRescale(2, 3)] + chainOps():
+        expected = op.run(tiles)
+        if op.outDtype is not None:
+            expected = expected.astype(op.outDtype)
+        out = op.runChunked(tiles, chunkRows)
+        assert out.dtype == expected.dtype
+        np.testing.assert_array_equal(out, expected)
+
+
+@pytest.mark.parametrize('chunkRows', [1, 7, None])
+def testChain(chunkRows):
+    #a chain is the same as running its operators one after the other over the full tiles
+    rng = np.random.RandomState(0)
+    tiles = [rng.randint(0, 256, (60, 50)).astype(np.uint8), rng.randint(0, 256, (60, 50)).astype(np.uint8)]
+    diff, divide = chainOps()
+    expected = divide.run([diff.run(tiles).astype(np.float32)])
+    chain = diff.then(divide)
+    assert chain.rowwise and chain.getName() == '%s-%s' % (diff.getName(), divide.getName())
+    out = chain.runChunked(tiles, chunkRows)
+    assert out.dtype == expected.dtype == np.uint8
+    np.testing.assert_array_equal(out, expected)
+    #chains are flattened
+    nested = uabPreprocClasses.uabOperTileChain([chain, uabOperTileSum()])
+    assert len(nested.ops) == 3 and nested.outDtype == np.int16
+    np.testing.assert_array_equal(nested.runChunked(tiles, chunkRows), expected.astype(np.int16))
+    #an operator that is not rowwise gets the whole tile
+    filt = uabPreprocClasses.uabOperTileFilter('uniform', 5)
+    spatial = chain.then(filt)
+    assert not spatial.rowwise
+    np.testing.assert_array_equal(spatial.runChunked(tiles, chunkRows), filt.run([expected]))
+
+
+def testMultChanOpChunks(colObj, monkeypatch):
+    #the tiles of a chained operator run over small chunks are the tiles of the operators run over the full tiles
+    monkeypatch.setattr(uabPreprocClasses.uabOperTileOps, 'chunkBytes', 500)
+    diff, divide = chainOps()
+    chained = uabPreprocClasses.uabPreprocMultChanOp([], 'Chain.npy', 'chain', [0, 1], diff.then(divide), nProc=1)
+    chained.run(colObj)
+    made = madeTiles(chained, colObj)
+    assert sorted(made) == sorted(colObj.dataListForRun)
+    for tile in colObj.dataListForRun:
+        tiles = [loadTile(colObj, tile, 0), loadTile(colObj, tile, 1)]
+        np.testing.assert_array_equal(made[tile], divide.run([diff.run(tiles).astype(np.float32)]))
+
+
+@pytest.mark.parametrize('windowable', [True, False])
+@pytest.mark.parametrize('ext', ['npy', 'chk'])
+def testBlockwiseHalo(colObj, windowable, ext, monkeypatch):
+    #windows stitched with the halo of the filters are the filters run over the full tiles
+    if not windowable:
+        #tiles decoded once & cut into windows in memory
+        monkeypatch.setattr(util_functions, 'uabUtilIsWindowable', lambda path: False)
+    ops = [uabPreprocClasses.uabOperTileFilter('uniform', 5), uabPreprocClasses.uabOperTileFilter('median', 3),
+           uabPreprocClasses.uabOperTileFilter('gaussian', 1.5),
+           uabPreprocClasses.uabOperTileFilter('maximum', 3).then(uabPreprocClasses.uabOperTileFilter('minimum', 3))]
+    for i, op in enumerate(ops):
+        full = uabPreprocClasses.uabPreprocMultChanOp([], 'Full%d.npy' % i, 'full', [0], op, nProc=1)
+        #windows smaller than the halo of the gaussian & not dividing the tiles
+        blocks = uabPreprocClasses.uabPreprocBlockwiseOp([], 'Block%d.%s' % (i, ext), 'blocks', [0], op,
+                                                         window=(16, 13), nProc=1)
+        assert blocks.halo == op.halo > 0
+        full.run(colObj)
+        blocks.run(colObj)
+        expected, made = madeTiles(full, colObj), madeTiles(blocks, colObj)
+        assert sorted(made) == sorted(colObj.dataListForRun)
+        for tile in colObj.dataListForRun:
+            assert made[tile].dtype == expected[tile].dtype
+            np.testing.assert_array_equal(made[tile], expected[tile])
+
+
+def testBlockwiseNoHalo(colObj):
+    #without a halo the windows are filtered on their own: the stitched tile differs at the borders of the windows
+    op = uabPreprocClasses.uabOperTileFilter('uniform', 5)
+    full = uabPreprocClasses.uabPreprocMultChanOp([], 'Full.npy', 'full', [0], op, nProc=1)
+    blocks = uabPreprocClasses.uabPreprocBlockwiseOp([], 'Block.npy', 'blocks', [0], op, window=(16, 13), halo=0,
+                                                     nProc=1)
+    full.run(colObj)
+    blocks.run(colObj)
+    tile = colObj.dataListForRun[0]
+    expected, made = madeTiles(full, colObj)[tile], madeTiles(blocks, colObj)[tile]
+    assert np.any(made != expected)
+    #the pixels farther than the support from the borders of the windows are the same
+    np.testing.assert_array_equal(made[2:14, 2:11], expected[2:14, 2:11])
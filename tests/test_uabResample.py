@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+import uabResample
+
+
+@pytest.fixture(params=[64 * 1024**2, 2048], ids=['oneBand', 'bands'])
+def bandBytes(request, monkeypatch):
+    #small bands split a tile into many bands of output rows, the result must not change
+    monkeypatch.setattr(uabResample, 'bandBytes', request.param)
+    return request.param
+
+
+def resample(img, factor, mode):
+    return uabResample.resampleTile(lambda y0, y1: img[y0:y1], img.shape, img.dtype, factor, mode)
+
+
+def referenceArea(img, k):
+    outH, outW = -(-img.shape[0] // k), -(-img.shape[1] // k)
+    out = np.zeros((outH, outW) + img.shape[2:])
+    for i in range(outH):
+        for j in range(outW):
+            out[i, j] = img[i * k:(i + 1) * k, j * k:(j + 1) * k].astype(np.float64).mean(axis=(0, 1))
+    return out
+
+
+def referenceLinear(img, factor):
+    #triangle filter of half width max(factor, 1) centered on every output pixel, pixels outside the tile repeat the edge
+    scale = max(factor, 1.0)
+
+    def axisWeights(size):
+        nOut = int(np.ceil(size / factor - 1e-9))
+        weights = np.zeros((nOut, size))
+        for i in range(nOut):
+            center = (i + 0.5) * factor
+            taps = {}
+            for j in range(int(np.floor(center - scale)), int(np.ceil(center + scale)) + 1):
+                w = max(0.0, 1 - abs((j + 0.5 - center) / scale))
+                taps[min(max(j, 0), size - 1)] = taps.get(min(max(j, 0), size - 1), 0.0) + w
+            total = sum(taps.values())
+            for j, w in taps.items():
+                weights[i, j] = w / total
+        return weights
+
+    wy, wx = axisWeights(img.shape[0]), axisWeights(img.shape[1])
+    return np.einsum('ij,jk...,lk->il...', wy, img.astype(np.float64), wx)
+
+
+def referenceMajority(labels, k):
+    outH, outW = -(-labels.shape[0] // k), -(-labels.shape[1] // k)
+    out = np.zeros((outH, outW), dtype=labels.dtype)
+    for i in range(outH):
+        for j in range(outW):
+            values, counts = np.unique(labels[i * k:(i + 1) * k, j * k:(j + 1) * k], return_counts=True)
+            #np.unique sorts the labels, argmax takes the first (smallest) of the ties
+            out[i, j] = values[np.argmax(counts)]
+    return out
+
+
+@pytest.mark.parametrize('shape', [(40, 36), (43, 37), (41, 38, 3)])
+@pytest.mark.parametrize('k', [1, 2, 3, 4])
+def testArea(shape, k, bandBytes):
+    img = np.random.RandomState(0).uniform(-100, 100, size=shape)
+    out = resample(img, k, 'area')
+    np.testing.assert_allclose(out, referenceArea(img, k), rtol=1e-12, atol=1e-9)
+    #integer tiles are rounded to the nearest value
+    img = np.random.RandomState(1).randint(0, 256, size=shape).astype(np.uint8)
+    out = resample(img, k, 'area')
+    assert out.dtype == np.uint8
+    np.testing.assert_array_equal(out, np.rint(referenceArea(img, k)).astype(np.uint8))
+
+
+@pytest.mark.parametrize('shape', [(40, 36), (43, 37), (30, 25, 2)])
+@pytest.mark.parametrize('factor', [0.5, 1.0, 1.5, 2, 2.5, 4])
+def testLinear(shape, factor, bandBytes):
+    img = np.random.RandomState(2).uniform(0, 100, size=shape)
+    out = resample(img, factor, 'linear')
+    assert out.shape[:2] == tuple([int(np.ceil(s / factor)) for s in shape[:2]])
+    np.testing.assert_allclose(out, referenceLinear(img, factor), rtol=1e-5, atol=1e-4)
+
+
+@pytest.mark.parametrize('factor', [0.5, 1.5, 2.5, 3])
+def testLinearMatchesPil(factor):
+    #away from the borders (PIL drops the taps outside of the image instead of repeating the edge)
+    Image = pytest.importorskip('PIL.Image')
+    img = np.random.RandomState(3).uniform(0, 100, size=(60, 90)).astype(np.float32)
+    out = resample(img, factor, 'linear')
+    ref = np.array(Image.fromarray(img, 'F').resize((out.shape[1], out.shape[0]), Image.BILINEAR))
+    m = int(np.ceil(2 * max(factor, 1) / factor)) + 1
+    np.testing.assert_allclose(out[m:-m, m:-m], ref[m:-m, m:-m], rtol=1e-5, atol=1e-4)
+
+
+@pytest.mark.parametrize('shape', [(40, 36), (43, 37)])
+@pytest.mark.parametrize('k', [2, 3, 5])
+def testMajority(shape, k, bandBytes):
+    labels = np.random.RandomState(4).randint(0, 4, size=shape).astype(np.uint8)
+    np.testing.assert_array_equal(resample(labels, k, 'majority'), referenceMajority(labels, k))
+
+
+def testMajorityTies():
+    labels = np.array([[3, 1], [1, 3]], dtype=np.uint8)
+    assert resample(labels, 2, 'majority')[0, 0] == 1
+
+
+@pytest.mark.parametrize('factor', [0.5, 1.5, 2, 3])
+def testNearest(factor, bandBytes):
+    labels = np.random.RandomState(5).randint(0, 10, size=(41, 35)).astype(np.uint8)
+    iy = [min(int((i + 0.5) * factor), 40) for i in range(int(np.ceil(41 / factor)))]
+    ix = [min(int((j + 0.5) * factor), 34) for j in range(int(np.ceil(35 / factor)))]
+    np.testing.assert_array_equal(resample(labels, factor, 'nearest'), labels[np.ix_(iy, ix)])
+
+
+def testIntegerFactorsOnly():
+    with pytest.raises(ValueError):
+        resample(np.zeros((10, 10)), 1.5, 'area')
+    with pytest.raises(ValueError):
+        resample(np.zeros((10, 10), dtype=np.uint8), 2.5, 'majority')
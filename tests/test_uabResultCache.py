@@ -0,0 +1,160 @@
+import os
+import stat
+import errno
+import numpy as np
+import pytest
+import uabBlockJournal
+import uabResultCache
+import uabPreprocClasses
+import uabSyntheticCollection
+import uab_collectionFunctions
+import util_functions
+import bohaoCustom.uabPreprocClasses as bPreproc
+
+
+@pytest.fixture
+def collections(repo):
+    #two collections with the same data
+    for colN in ['a', 'b']:
+        uabSyntheticCollection.makeSyntheticCollection(colN, nTiles=3, tileSize=(120, 100))
+    return repo
+
+
+def openCollection(colN):
+    colObj = uab_collectionFunctions.uabCollection(colN)
+    colObj.readMetadata()
+    return colObj
+
+
+def halfBlock(ext='R_Half.tif', descr='half red', chans=(0,)):
+    return uabPreprocClasses.uabPreprocMultChanOp([], ext, descr, list(chans), bPreproc.uabOperTileDivide(2), nProc=1)
+
+
+def isWritable(path):
+    return bool(os.stat(path).st_mode & stat.S_IWUSR)
+
+
+def checkOutputs(block, colObj):
+    #the outputs are the red channel divided by 2 & the journal has the checksums of the data
+    journal = block.getJournal(colObj)
+    for tile in colObj.dataListForRun:
+        path = block.getTileOutputPaths(colObj, tile)[block.ext]
+        red = util_functions.uabUtilAllTypeLoad(colObj.getTilePath(tile, 0))
+        out = util_functions.uabUtilAllTypeLoad(path)
+        np.testing.assert_array_equal(out, (red / 2).astype(np.uint8))
+        assert journal.getChecksum(tile, block.ext) == '%08x' % uabBlockJournal.arrayChecksum(out)
+
+
+def testHashPath(tmp_path):
+    path = str(tmp_path / 'f.bin')
+    with open(path, 'wb') as f:
+        f.write(b'x' * 3000)
+    h = uabResultCache.hashPath(path, blockSize=1000)
+    assert h == uabResultCache.hashPath(path)
+    chunked = str(tmp_path / 'tile.chk')
+    util_functions.uabUtilAllTypeSave(chunked, np.arange(20, dtype=np.int16).reshape(4, 5))
+    h = uabResultCache.hashPath(chunked)
+    util_functions.uabUtilAllTypeSave(chunked, np.arange(20, dtype=np.int16).reshape(4, 5) + 1)
+    assert uabResultCache.hashPath(chunked) != h
+
+
+def testPutFetch(collections):
+    cache = uabResultCache.uabResultCache()
+    colA, colB = openCollection('a'), openCollection('b')
+    blockA = halfBlock()
+    pathA = blockA.run(colA, cache=cache)
+    checkOutputs(blockA, colA)
+    #the outputs of the block are hard linked into the cache (no copy), read-only
+    cached = [os.path.join(root, f) for root, _, files in os.walk(cache.cacheDir) for f in files
+              if f != uabResultCache.entryFile]
+    assert len(cached) == len(colA.dataListForRun)
+    assert not any([isWritable(p) for p in cached])
+    assert sorted([os.stat(blockA.getTileOutputPaths(colA, tile)['R_Half.tif']).st_ino
+                   for tile in colA.dataListForRun]) == sorted([os.stat(p).st_ino for p in cached])
+
+    #the same block on the same data is taken from the cache
+    blockB = halfBlock()
+    pathB = blockB.run(colB, cache=cache)
+    assert pathA != pathB
+    checkOutputs(blockB, colB)
+    assert sorted([os.stat(blockB.getTileOutputPaths(colB, tile)['R_Half.tif']).st_ino
+                   for tile in colB.dataListForRun]) == sorted([os.stat(p).st_ino for p in cached])
+
+
+def testChangedInput(collections):
+    cache = uabResultCache.uabResultCache()
+    colA, colB = openCollection('a'), openCollection('b')
+    halfBlock().run(colA, cache=cache)
+    tile = colB.dataListForRun[0]
+    red = colB.getTilePath(tile, 0)
+    data = util_functions.uabUtilAllTypeLoad(red)
+    os.remove(red)
+    util_functions.uabUtilAllTypeSave(red, 255 - data)
+    block = halfBlock()
+    assert set(cache.fetch(block, colB, colB.dataListForRun)) == {tile}
+    block.run(colB, cache=cache)
+    checkOutputs(block, colB)
+
+
+def testMissingInput(collections):
+    cache = uabResultCache.uabResultCache()
+    colA = openCollection('a')
+    tile = colA.dataListForRun[0]
+    os.remove(colA.getTilePath(tile, 0))
+    block = halfBlock()
+    assert cache.getTileKey(block, colA, tile) is None
+    assert cache.fetch(block, colA, [tile]) == {tile: None}
+
+
+def testContentKey(collections):
+    #the names of the outputs & the extension ids don't change the key, the format of the outputs does
+    cache = uabResultCache.uabResultCache()
+    colA, colB = openCollection('a'), openCollection('b')
+    tile = colA.dataListForRun[0]
+    key = cache.getTileKey(halfBlock(), colA, tile)
+    assert cache.getTileKey(halfBlock('R_Div2.tif', 'red / 2'), colB, tile) == key
+    assert halfBlock(chans=(0,)).getContentParams(colA) == halfBlock(chans=(2,)).getContentParams(colA)
+    assert cache.getTileKey(halfBlock('R_Half.npy'), colA, tile) != key
+    assert cache.getTileKey(halfBlock(chans=(1,)), colA, tile) != key
+
+    halfBlock().run(colA, cache=cache)
+    block = halfBlock('R_Div2.tif', 'red / 2')
+    assert cache.fetch(block, colB, colB.dataListForRun) == {}
+    checkOutputs(block, colB)
+
+
+def testOtherFileSystem(collections, monkeypatch):
+    #no hard links (e.g., the cache on another file system): the outputs are put by copy & fetched as symbolic links
+    def noLink(src, dst):
+        raise OSError(errno.EXDEV, 'Invalid cross-device link')
+    monkeypatch.setattr(os, 'link', noLink)
+    cache = uabResultCache.uabResultCache()
+    colA, colB = openCollection('a'), openCollection('b')
+    blockA = halfBlock()
+    blockA.run(colA, cache=cache)
+    checkOutputs(blockA, colA)
+    #the outputs of the block stay as they are, the cache has read-only copies
+    for tile in colA.dataListForRun:
+        out = blockA.getTileOutputPaths(colA, tile)['R_Half.tif']
+        assert os.stat(out).st_nlink == 1 and isWritable(out)
+    blockB = halfBlock()
+    blockB.run(colB, cache=cache)
+    checkOutputs(blockB, colB)
+    for tile in colB.dataListForRun:
+        assert os.path.islink(blockB.getTileOutputPaths(colB, tile)['R_Half.tif'])
+
+
+def testCollectionLimits(collections):
+    #the tiles of a stretch with the percentiles of the whole collection depend on the other tiles
+    cache = uabResultCache.uabResultCache()
+    colA, colB = openCollection('a'), openCollection('b')
+    other = colB.getTilePath(colB.dataListForRun[1], 0)
+    data = util_functions.uabUtilAllTypeLoad(other)
+    os.remove(other)
+    util_functions.uabUtilAllTypeSave(other, np.full_like(data, 255))
+    tile = colA.dataListForRun[0]
+    for perTile in [False, True]:
+        block = uabPreprocClasses.uabPreprocPercentileStretch([0], 'R_Str.tif', 'stretch', perTile=perTile, nProc=1)
+        keys = [cache.getTileKey(block, colObj, tile) for colObj in [colA, colB]]
+        #not with the percentiles of every tile
+        assert (keys[0] == keys[1]) == perTile
@@ -0,0 +1,110 @@
+import os
+import pickle
+import numpy as np
+import pytest
+import uabTileCache
+import uabSyntheticCollection
+import uab_collectionFunctions
+import util_functions
+
+
+@pytest.fixture
+def collection(repo):
+    uabSyntheticCollection.makeSyntheticCollection('a', nTiles=2, tileSize=(60, 50))
+    return repo
+
+
+def openCollection(**kwargs):
+    colObj = uab_collectionFunctions.uabCollection('a', **kwargs)
+    colObj.readMetadata()
+    return colObj
+
+
+def testMemmapLoads(collection):
+    colObj = openCollection(memmapCache=True)
+    for tile in colObj.dataListForRun:
+        for extId in range(len(colObj.extDS)):
+            data = colObj.loadTileDataByExtension(tile, extId)
+            #a read-only memory map, not a copy in memory
+            assert isinstance(data, np.memmap) and not data.flags.writeable
+            np.testing.assert_array_equal(data, util_functions.uabUtilAllTypeLoad(colObj.getTilePath(tile, extId)))
+            assert colObj.loadTileDataByExtension(tile, extId, cached=True).filename == data.filename
+
+
+def testMemmapSource(tmp_path):
+    cache = uabTileCache.uabTileMemmapCache(str(tmp_path / 'meta'))
+    src = str(tmp_path / 't_A.tif')
+    util_functions.uabUtilAllTypeSave(src, np.arange(200, dtype=np.uint8).reshape(10, 20))
+    first = cache.load(src, 'Orig')
+    np.testing.assert_array_equal(first, np.arange(200).reshape(10, 20))
+    stamp = os.stat(cache.getCachePath('Orig', 't_A.tif')).st_mtime_ns
+    #transcoded once
+    cache.load(src, 'Orig')
+    assert os.stat(cache.getCachePath('Orig', 't_A.tif')).st_mtime_ns == stamp
+    #remade when the source changes
+    util_functions.uabUtilAllTypeSave(src, np.zeros((12, 5), dtype=np.uint8))
+    np.testing.assert_array_equal(cache.load(src, 'Orig'), np.zeros((12, 5)))
+    #npy sources are mapped as they are
+    npy = str(tmp_path / 't_B.npy')
+    np.save(npy, np.ones((3, 4), dtype=np.float32))
+    assert cache.load(npy, 'Orig').filename == os.path.abspath(npy)
+    cache.clear('Orig')
+    assert not os.path.exists(os.path.dirname(cache.getCachePath('Orig', 't_A.tif')))
+    with pytest.raises(IOError):
+        cache.load(str(tmp_path / 'missing_A.tif'), 'Orig')
+
+
+def testLRUEviction():
+    cache = uabTileCache.uabTileLRUCache(300)
+    for key in 'abc':
+        cache.put(key, np.zeros(100, dtype=np.uint8))
+    assert cache.curBytes == 300 and cache.evictions == 0
+    #'a' becomes the most recently used, 'b' goes first
+    assert cache.get('a') is not None
+    cache.put('d', np.zeros(150, dtype=np.uint8))
+    assert list(cache.entries) == ['a', 'd'] and cache.curBytes == 250 and cache.evictions == 2
+    assert cache.get('b') is None and cache.get('c') is None
+    #a new array for a key replaces the old one
+    cache.put('a', np.zeros(50, dtype=np.uint8))
+    assert cache.curBytes == 200 and cache.get('a').nbytes == 50
+    #too large to be cached, read-only all the same
+    big = cache.put('e', np.zeros(400, dtype=np.uint8))
+    assert not big.flags.writeable and cache.get('e') is None and cache.curBytes == 200
+    cache.invalidate(lambda key: key == 'd')
+    assert cache.getStats() == {'hits': 2, 'misses': 3, 'evictions': 2, 'entries': 1, 'bytes': 50, 'maxBytes': 300}
+    cache.invalidate()
+    assert cache.curBytes == 0 and not cache.entries
+
+
+def testLRUDisabled():
+    cache = uabTileCache.uabTileLRUCache(0)
+    cache.put('a', np.zeros(10, dtype=np.uint8))
+    assert cache.get('a') is None and cache.curBytes == 0
+
+
+def testWorkerBudget(collection):
+    colObj = openCollection(cacheBytes=30000)
+    colObj.loadTileDataByExtension(colObj.dataListForRun[0], 0)
+    assert colObj.tileCache.curBytes > 0
+    #one process
+    assert pickle.loads(pickle.dumps(colObj)).tileCache.maxBytes == 30000
+    #the processes of a pool share the budget
+    with uabTileCache.sharedBetween(3):
+        copy = pickle.loads(pickle.dumps(colObj))
+    assert copy.tileCache.maxBytes == 10000 and copy.tileCache.curBytes == 0
+    assert uabTileCache.workerShares == 1
+    assert colObj.tileCache.maxBytes == 30000
+
+
+@pytest.mark.parametrize('memmapCache', [False, True])
+def testLoadTileWindow(collection, memmapCache):
+    colObj = openCollection(memmapCache=memmapCache)
+    pad = 6
+    for tile in colObj.dataListForRun:
+        for extId in range(len(colObj.extDS)):
+            full = util_functions.uabUtilAllTypeLoad(colObj.getTilePath(tile, extId))
+            padded = np.pad(full, [(pad, pad), (pad, pad)] + [(0, 0)] * (full.ndim - 2), mode='symmetric')
+            np.testing.assert_array_equal(colObj.loadTilePadded(tile, extId, pad), padded)
+            for y, x, h, w in [(5, 7, 20, 15), (-pad, 40, 12, 16), (50, -3, 16, 10)]:
+                np.testing.assert_array_equal(colObj.loadTileWindow(tile, extId, y, x, h, w),
+                                              padded[y + pad:y + pad + h, x + pad:x + pad + w])
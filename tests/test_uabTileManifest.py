@@ -0,0 +1,124 @@
+import os
+import time
+import numpy as np
+import pytest
+import uabTileManifest
+import util_functions
+
+
+def writeTiles(dirn, tiles):
+    #tiles -> {file name: data}
+    util_functions.uabUtilMakeDirectoryName(dirn)
+    for fileName, data in tiles.items():
+        util_functions.uabUtilAllTypeSave(os.path.join(dirn, fileName), data)
+
+
+def ageDirectory(dirn, seconds=60):
+    #an old directory, not within the mtime tick of the listing
+    past = time.time() - seconds
+    os.utime(dirn, (past, past))
+
+
+@pytest.fixture
+def noDecoding(monkeypatch):
+    #headers only, any decoding of pixel data fails
+    def decode(path):
+        raise AssertionError('%s was decoded' % path)
+    monkeypatch.setattr(util_functions, 'uabUtilAllTypeLoad', decode)
+
+
+@pytest.mark.parametrize('fileName, data', [
+    ('t_A.npy', np.zeros((30, 20), dtype=np.float32)),
+    ('t_A.npy', np.zeros((30, 20, 4), dtype=np.int16)),
+    ('t_A.tif', np.zeros((30, 20), dtype=np.uint8)),
+    ('t_A.tif', np.zeros((30, 20, 3), dtype=np.uint8)),
+    ('t_A.tif', np.zeros((30, 20), dtype=np.uint16)),
+    ('t_A.tif', np.zeros((30, 20), dtype=np.float32)),
+    ('t_A.png', np.zeros((30, 20), dtype=np.uint8)),
+    ('t_A.png', np.zeros((30, 20, 3), dtype=np.uint8)),
+    ('t_A.jpg', np.zeros((30, 20, 3), dtype=np.uint8)),
+    ('t_A.chk', np.zeros((30, 20), dtype=np.float64)),
+])
+def testProbeTile(tmp_path, fileName, data):
+    path = str(tmp_path / fileName)
+    util_functions.uabUtilAllTypeSave(path, data)
+    decoded = util_functions.uabUtilAllTypeLoad(path)
+    assert uabTileManifest.probeTile(path) == (decoded.shape, decoded.dtype.str)
+
+
+def testProbeWithoutDecoding(tmp_path, noDecoding):
+    for fileName, data in [('t_A.npy', np.zeros((5, 6), np.uint8)), ('t_A.tif', np.zeros((5, 6), np.float32))]:
+        path = str(tmp_path / fileName)
+        if fileName.endswith('npy'):
+            np.save(path, data)
+        else:
+            uabTileManifest.tifffile.imwrite(path, data)
+        assert uabTileManifest.probeTile(path) == (data.shape, data.dtype.str)
+
+
+@pytest.fixture
+def tileDir(tmp_path):
+    dataDir, metaDir = str(tmp_path / 'data'), str(tmp_path / 'meta')
+    util_functions.uabUtilMakeDirectoryName(metaDir)
+    writeTiles(os.path.join(dataDir, 'Orig'), dict(('t%d_RGB.tif' % i, np.zeros((20 + i, 10, 3), dtype=np.uint8))
+                                                   for i in range(4)))
+    writeTiles(os.path.join(dataDir, 'Orig'), {'t0_GT.tif': np.zeros((20, 10), dtype=np.uint8)})
+    return dataDir, metaDir
+
+
+@pytest.fixture
+def probes(monkeypatch):
+    #names of the files probed
+    probed = []
+    probe = uabTileManifest.probeTile
+    monkeypatch.setattr(uabTileManifest, 'probeTile', lambda path: probed.append(os.path.basename(path)) or probe(path))
+    return probed
+
+
+def testIncrementalRefresh(tileDir, probes):
+    dataDir, metaDir = tileDir
+    manifest = uabTileManifest.uabTileManifest(dataDir, metaDir)
+    records = manifest.getRecords('Orig')
+    assert sorted(records) == ['t0_GT.tif'] + ['t%d_RGB.tif' % i for i in range(4)]
+    assert records['t2_RGB.tif']['shape'] == (22, 10, 3) and records['t2_RGB.tif']['tile'] == 't2'
+    assert len(probes) == 5
+    #another session reads the saved records, nothing is probed again
+    del probes[:]
+    manifest = uabTileManifest.uabTileManifest(dataDir, metaDir)
+    assert manifest.getRecords('Orig') == records
+    assert manifest.getTileNames('Orig') == ['t0', 't1', 't2', 't3']
+    assert sorted(manifest.getExtensions('Orig', 't0')) == ['GT.tif', 'RGB.tif']
+    assert probes == []
+    #a tile rewritten in place, a new tile, a removed tile & a file that is not a tile
+    writeTiles(os.path.join(dataDir, 'Orig'), {'t1_RGB.tif': np.zeros((50, 40), dtype=np.uint16),
+                                               't4_RGB.tif': np.zeros((5, 5, 3), dtype=np.uint8)})
+    os.remove(os.path.join(dataDir, 'Orig', 't3_RGB.tif'))
+    with open(os.path.join(dataDir, 'Orig', 'bad_RGB.tif'), 'w') as f:
+        f.write('not a tiff')
+    records = manifest.refresh('Orig')
+    assert sorted(probes) == ['bad_RGB.tif', 't1_RGB.tif', 't4_RGB.tif']
+    assert sorted(records) == ['t0_GT.tif', 't0_RGB.tif', 't1_RGB.tif', 't2_RGB.tif', 't4_RGB.tif']
+    assert records['t1_RGB.tif']['shape'] == (50, 40) and records['t1_RGB.tif']['dtype'] == np.dtype(np.uint16).str
+    #force probes everything
+    del probes[:]
+    manifest.refresh('Orig', force=True)
+    assert len(probes) == 6
+
+
+def testMissingFiles(tileDir, probes, monkeypatch):
+    #looking up the files that don't exist (e.g., GT of test tiles) does not list the directory again
+    dataDir, metaDir = tileDir
+    ageDirectory(os.path.join(dataDir, 'Orig'))
+    manifest = uabTileManifest.uabTileManifest(dataDir, metaDir)
+    manifest.getRecords('Orig')
+    listings = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, 'scandir', lambda path: listings.append(path) or scandir(path))
+    assert manifest.getRecord('Orig', 't0', 'GT.tif')['shape'] == (20, 10)
+    for i in range(1, 4):
+        assert manifest.getRecord('Orig', 't%d' % i, 'GT.tif') is None
+    assert listings == []
+    #a file written since the listing is found
+    writeTiles(os.path.join(dataDir, 'Orig'), {'t1_GT.tif': np.zeros((21, 10), dtype=np.uint8)})
+    assert manifest.getRecord('Orig', 't1', 'GT.tif')['shape'] == (21, 10)
+    assert len(listings) == 1
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+import uabTileStats
+
+
+@pytest.fixture(autouse=True)
+def smallChunks(monkeypatch):
+    #several row chunks per array, so the chunk merges are exercised
+    monkeypatch.setattr(uabTileStats, 'chunkRows', 7)
+
+
+def referenceStats(values):
+    values = np.asarray(values, dtype=np.float64).ravel()
+    return {'count': values.size, 'mean': values.mean(), 'std': values.std(), 'min': values.min(), 'max': values.max()}
+
+
+def checkStats(stats, ref):
+    assert stats['count'] == ref['count']
+    assert stats['mean'] == pytest.approx(ref['mean'], rel=1e-12, abs=1e-9)
+    assert stats['min'] == ref['min']
+    assert stats['max'] == ref['max']
+    std = np.sqrt(stats['m2'] / stats['count']) if 'm2' in stats else stats['std']
+    assert std == pytest.approx(ref['std'], rel=1e-9)
+
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.int16, np.float32, np.float64])
+def testArrayStats(dtype):
+    rng = np.random.RandomState(0)
+    img = (rng.normal(100, 30, size=(45, 31)) if np.dtype(dtype).kind == 'f' else rng.randint(0, 250, size=(45, 31)))
+    img = img.astype(dtype)
+    stats = uabTileStats.arrayStats(img, uabTileStats.dtypeHistRange(dtype) or (img.min(), img.max()))
+    checkStats(stats, referenceStats(img))
+    assert stats['hist'].sum() == img.size
+
+
+def testMergeStats():
+    #partials of tiles of different sizes merge to the statistics of all the pixels
+    rng = np.random.RandomState(1)
+    tiles = [rng.normal(m, s, size=shape) for m, s, shape in [(0, 1, (10, 20)), (1e3, 5, (3, 3)), (-50, 100, (64, 1))]]
+    partials = [uabTileStats.arrayStats(t, (-500, 1500)) for t in tiles]
+    merged = uabTileStats.emptyStats()
+    for part in partials:
+        merged = uabTileStats.mergeStats(merged, part)
+    allValues = np.concatenate([t.ravel() for t in tiles])
+    checkStats(merged, referenceStats(allValues))
+    #the order of the merges does not matter
+    checkStats(uabTileStats.mergeStats(partials[2], uabTileStats.mergeStats(partials[1], partials[0])),
+               referenceStats(allValues))
+    #empty partials (missing channels) are ignored
+    checkStats(uabTileStats.mergeStats(uabTileStats.emptyStats(), partials[0]), referenceStats(tiles[0]))
+    checkStats(uabTileStats.mergeStats(partials[0], uabTileStats.emptyStats()), referenceStats(tiles[0]))
+
+
+def testSummarizeStats():
+    rng = np.random.RandomState(2)
+    tiles = [rng.randint(0, 256, size=(20 + i, 17)).astype(np.uint8) for i in range(4)]
+    summary = uabTileStats.summarizeStats([uabTileStats.arrayStats(t, (0, 256)) for t in tiles] +
+                                          [uabTileStats.emptyStats()], (0, 256))
+    allValues = np.concatenate([t.ravel() for t in tiles])
+    checkStats(summary, referenceStats(allValues))
+    np.testing.assert_array_equal(summary['hist'], np.bincount(allValues, minlength=256))
+    np.testing.assert_array_equal(summary['hist_edges'], np.arange(257))
+
+
+def testHistograms():
+    rng = np.random.RandomState(3)
+    img = rng.randint(-2000, 2000, size=(33, 40)).astype(np.int16)
+    histRange = uabTileStats.dtypeHistRange(np.int16)
+    hist = uabTileStats.arrayStats(img, histRange)['hist']
+    np.testing.assert_array_equal(hist, np.histogram(img, bins=256, range=histRange)[0])
+    #values outside of the range of a float histogram go to the end bins
+    img = rng.uniform(-1, 2, size=(20, 20))
+    hist = uabTileStats.arrayStats(img, (0, 1))['hist']
+    ref = np.histogram(np.clip(img, 0, np.nextafter(1, 0)), bins=256, range=(0, 1))[0]
+    np.testing.assert_array_equal(hist, ref)
+    assert hist[0] == np.sum(img < 1.0 / 256) and hist[-1] == np.sum(img >= 255.0 / 256)
+
+
+@pytest.mark.parametrize('percentiles', [(0, 100), (2, 98), (25, 50, 75), (0.5, 99.5)])
+def testPercentilesUint8(percentiles):
+    #one bin per value: the percentiles are values of the data (inverted cdf)
+    img = np.random.RandomState(5).randint(40, 210, size=(37, 29)).astype(np.uint8)
+    hist = uabTileStats.arrayStats(img, (0, 256))['hist']
+    ref = [np.percentile(img, p, method='inverted_cdf') for p in percentiles]
+    assert uabTileStats.histPercentiles(hist, (0, 256), percentiles) == ref
+
+
+def testPercentilesFloat():
+    #interpolated inside the bins: within one bin of the percentiles of the data
+    img = np.random.RandomState(6).normal(5, 2, size=(60, 50))
+    histRange = (img.min(), img.max())
+    hist = uabTileStats.arrayStats(img, histRange)['hist']
+    width = (histRange[1] - histRange[0]) / 256
+    percentiles = [0, 1, 10, 50, 90, 99, 100]
+    out = uabTileStats.histPercentiles(hist, histRange, percentiles)
+    np.testing.assert_allclose(out, np.percentile(img, percentiles), atol=width)
+    assert out == sorted(out)
+
+
+def testPercentilesEmpty():
+    assert uabTileStats.histPercentiles(np.zeros(256), (0, 256), [2, 98]) == [0.0, 0.0]
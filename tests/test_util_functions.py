@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+import util_functions
+
+
+def referenceWindowSums(arr, ys, xs, h, w):
+    return np.array([arr[y:y + h, x:x + w].sum(dtype=np.float64 if arr.dtype.kind == 'f' else np.int64)
+                     for y, x in zip(ys, xs)])
+
+
+@pytest.mark.parametrize('dtype', [np.bool_, np.uint8, np.int16, np.float32, np.float64])
+def testWindowSums(dtype):
+    rng = np.random.RandomState(0)
+    arr = rng.uniform(-50, 250, size=(57, 43))
+    arr = arr > 100 if dtype == np.bool_ else arr.astype(dtype)
+    h, w = 11, 7
+    #every corner of the array, the whole array & random windows
+    ys = [0, 0, 57 - h, 57 - h] + list(rng.randint(0, 57 - h + 1, size=50))
+    xs = [0, 43 - w, 0, 43 - w] + list(rng.randint(0, 43 - w + 1, size=50))
+    for ys, xs, h, w in [(ys, xs, h, w), ([0], [0], 57, 43)]:
+        sums = util_functions.uabUtilWindowSums(arr, ys, xs, h, w)
+        ref = referenceWindowSums(arr, ys, xs, h, w)
+        if arr.dtype.kind == 'f':
+            np.testing.assert_allclose(sums, ref, rtol=1e-9, atol=1e-6)
+        else:
+            np.testing.assert_array_equal(sums, ref)
+
+
+def testWindowSumsNoWindow():
+    assert util_functions.uabUtilWindowSums(np.ones((5, 5), dtype=bool), [], [], 2, 2).shape == (0,)
+
+
+def makeTile(shape, fmt):
+    rng = np.random.RandomState(1)
+    tile = rng.randint(0, 256, size=shape).astype(np.uint8)
+    if fmt == 'npy':
+        return tile.astype(np.float32) / 3
+    return tile
+
+
+#inside, at each border (virtual padding), across two borders & the whole padded tile
+windows = [(3, 4, 10, 12), (-5, 0, 12, 9), (0, -7, 8, 15), (25, 30, 12, 14), (-6, -6, 45, 50), (-2, 38, 6, 8)]
+
+
+@pytest.mark.parametrize('fmt', ['npy', 'tif', 'chk', 'png'])
+@pytest.mark.parametrize('shape', [(33, 38), (33, 38, 3)])
+def testWindowLoad(tmp_path, monkeypatch, fmt, shape):
+    path = str(tmp_path / ('t_A.' + fmt))
+    tile = makeTile(shape, fmt)
+    util_functions.uabUtilAllTypeSave(path, tile)
+    full = util_functions.uabUtilAllTypeLoad(path)
+    np.testing.assert_array_equal(full, tile)
+    pad = 10
+    padded = np.pad(full, [(pad, pad), (pad, pad)] + [(0, 0)] * (full.ndim - 2), mode='symmetric')
+    if fmt != 'png':
+        #npy, chunked & tiff tiles are read by window, never decoded in full
+        def fullLoad(fileName):
+            raise AssertionError('%s decoded in full' % fileName)
+        monkeypatch.setattr(util_functions, 'uabUtilAllTypeLoad', fullLoad)
+    for y, x, h, w in windows:
+        window = util_functions.uabUtilAllTypeWindowLoad(path, y, x, h, w)
+        assert window.dtype == full.dtype
+        np.testing.assert_array_equal(window, padded[y + pad:y + pad + h, x + pad:x + pad + w])
+
+
+def testWindowLoadMissing(tmp_path):
+    for fmt in ['npy', 'tif', 'chk', 'png']:
+        with pytest.raises(IOError):
+            util_functions.uabUtilAllTypeWindowLoad(str(tmp_path / ('missing.' + fmt)), 0, 0, 4, 4)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only journal of the completed units of work of a block (journal.txt in the directory of the block).
+
+A unit is the output of one channel of one tile, e.g., all the patches of the RGB0 channel of a tile or the tile made by
+a preprocessing block.  A block records a unit once all of its files are written:
+    tile <tab> channel <tab> checksum <newline>
+where the checksum is the crc32 of the data that was saved.  When an interrupted block runs again, the units in the
+journal are skipped from the journal alone: their files are not stat'ed, opened or decoded.  A line that was cut by a
+crash is ignored, so that unit is simply done again.
+
+Forget the units whose outputs are removed (forget()), otherwise they are skipped although their files are gone.
+
+The journal starts with the hash of the parameters of the block (#params line).  Units recorded with other parameters
+(e.g., a patch extractor with another overlap, which writes to the same directory) are dropped when the journal is
+opened, and uabBlock.run(forcerun=1) clears the journal.
+"""
+
+import os
+import zlib
+import numpy as np
+
+journalFile = 'journal.txt'
+#first line of a journal: hash of the parameters of the block
+paramsTag = '#params\t'
+
+
+def arrayChecksum(arr, checksum=0):
+    #crc32 of the data of an array, pass the previous checksum to checksum several arrays in a row
+    return zlib.crc32(np.ascontiguousarray(arr).view(np.uint8).ravel(), checksum)
+
+
+class uabBlockJournal(object):
+
+    def __init__(self, blockDir, params=None):
+        #params -> hash of the parameters of the block, units recorded with another hash are not done
+        self.path = os.path.join(blockDir, journalFile)
+        self.params = params
+        #{(tile, channel): checksum}
+        self.units = {}
+        try:
+            with open(self.path, 'r') as f:
+                data = f.read()
+        except IOError:
+            data = ''
+        lines = data.split('\n')[:-1]
+        if len(lines) > 0 and lines[0].startswith(paramsTag):
+            stored = lines[0][len(paramsTag):]
+            lines = lines[1:]
+        else:
+            stored = None
+        #the file is rewritten (with the header) at the next record if the units were dropped or it has no header
+        self.stale = params is not None and stored != params
+        if self.stale and data:
+            return
+        for line in lines:
+            a = line.split('\t')
+            if len(a) == 3:
+                self.units[(a[0], a[1])] = a[2]
+        #a line cut by a crash: rewrite the journal at the next record instead of appending to the cut line
+        if data and not data.endswith('\n'):
+            self.stale = True
+
+    def isDone(self, tile, channel):
+        return (tile, channel) in self.units
+
+    def getChecksum(self, tile, channel):
+        return self.units.get((tile, channel))
+
+    def record(self, tile, channel, checksum):
+        #append a completed unit, call this after all of its files are written
+        checksum = '%08x' % checksum if not isinstance(checksum, str) else checksum
+        self.units[(tile, channel)] = checksum
+        if self.stale:
+            self.save()
+            return
+        with open(self.path, 'a') as f:
+            f.write('{}\t{}\t{}\n'.format(tile, channel, checksum))
+
+    def save(self):
+        #rewrite the whole journal
+        tmpPath = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tmpPath, 'w') as f:
+            if self.params is not None:
+                f.write('{}{}\n'.format(paramsTag, self.params))
+            for (tile, channel), checksum in self.units.items():
+                f.write('{}\t{}\t{}\n'.format(tile, channel, checksum))
+        os.replace(tmpPath, self.path)
+        self.stale = False
+
+    def forget(self, tiles):
+        #drop all the units of these tiles
+        tiles = set(tiles)
+        if not any([tile in tiles for tile, _ in self.units]):
+            return
+        self.units = dict((key, val) for key, val in self.units.items() if key[0] not in tiles)
+        self.save()
+
+    def clear(self):
+        #drop all the units, e.g., when a block is forced to run again
+        self.units = {}
+        if os.path.exists(self.path):
+            self.save()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of the blocks.
+
+uabBlock.runAtomic() profiles every run of a block: wall & cpu time (of this process and of the worker processes it
+waited for), tiles/s, the files & bytes that went through uabUtilAllTypeLoad/uabUtilAllTypeSave (sizes of the arrays,
+see util_functions.ioCounters) and the peak resident memory.  Tiles processed by uabBlock.mapTiles() and the loops
+wrapped in timeTile() are timed one by one.  Every run appends one JSON line to profile.jsonl in the directory of the
+block and a summary is printed at the end, so stages can be compared between datasets & runs:
+    {"block": ..., "start": ..., "wall_seconds": ..., "cpu_seconds": ..., "cpu_seconds_workers": ..., "tiles": ...,
+     "tiles_per_second": ..., "files_read": ..., "bytes_read": ..., "files_written": ..., "bytes_written": ...,
+     "peak_rss_bytes": ..., "peak_rss_bytes_workers": ..., "tile_seconds": {"count", "mean", "max", "slowest"}}
+Peak memory is the peak of the process (and of its largest worker) so far, not only of this block.  Cpu time & memory of
+workers require the resource module (not available on Windows), they are None otherwise.
+"""
+
+import os
+import sys
+import json
+import time
+from contextlib import contextmanager
+import util_functions
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+profileFile = 'profile.jsonl'
+#profiles of the blocks that are running in this process, the last one is the innermost
+activeProfiles = []
+
+
+def getRusage(who):
+    #(cpu seconds, peak rss in bytes) of this process or of its terminated children
+    if resource is None:
+        return None, None
+    usage = resource.getrusage(who)
+    #ru_maxrss is in kilobytes on linux and in bytes on mac
+    rss = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    return usage.ru_utime + usage.ru_stime, rss
+
+
+def formatBytes(n):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if abs(n) < 1024:
+            return '%.1f %s' % (n, unit)
+        n /= 1024.0
+    return '%.1f TB' % n
+
+
+def getCurrent():
+    #profile of the block that is running, None outside of a block
+    return activeProfiles[-1] if activeProfiles else None
+
+
+@contextmanager
+def timeTile(tile):
+    #time the processing of one tile for the running block (does nothing outside of a block)
+    start = time.time()
+    yield
+    profile = getCurrent()
+    if profile is not None:
+        profile.tileDone(tile, time.time() - start)
+
+
+def profiledWorker(args):
+    #pool worker used by uabBlock.mapTiles(): run the worker & send back its duration and I/O along with its result
+    #(worker, name of the job, job) -> (result, name of the job, seconds, I/O counts)
+    worker, name, job = args
+    ioStart = dict(util_functions.ioCounters)
+    start = time.time()
+    res = worker(job)
+    io = dict((key, util_functions.ioCounters[key] - ioStart[key]) for key in ioStart)
+    return res, name, time.time() - start, io
+
+
+class uabBlockProfile(object):
+
+    def __init__(self, name, blockDir):
+        self.name = name
+        self.path = os.path.join(blockDir, profileFile)
+        self.tileSeconds = {}
+        #I/O of the worker processes, reported by profiledWorker()
+        self.workerIO = dict((key, 0) for key in util_functions.ioCounters)
+        self.record = None
+
+    def start(self):
+        self.startTime = time.time()
+        self.startCpu = time.process_time()
+        self.startWorkerCpu = getRusage(resource.RUSAGE_CHILDREN)[0] if resource is not None else None
+        self.startIO = dict(util_functions.ioCounters)
+        activeProfiles.append(self)
+
+    def tileDone(self, tile, seconds):
+        if tile is None:
+            return
+        self.tileSeconds[tile] = self.tileSeconds.get(tile, 0) + seconds
+
+    def addWorkerIO(self, io):
+        for key, val in io.items():
+            self.workerIO[key] += val
+
+    def stop(self, nTiles):
+        """
+        Stop measuring
+        :param nTiles: number of tiles the block ran on
+        :return: the record of this run (dictionary)
+        """
+        activeProfiles.remove(self)
+        wall = time.time() - self.startTime
+        _, rss = getRusage(resource.RUSAGE_SELF) if resource is not None else (None, None)
+        workerCpu, workerRss = getRusage(resource.RUSAGE_CHILDREN) if resource is not None else (None, None)
+        self.record = {'block': self.name,
+                       'start': self.startTime,
+                       'wall_seconds': wall,
+                       'cpu_seconds': time.process_time() - self.startCpu,
+                       'cpu_seconds_workers': workerCpu - self.startWorkerCpu if workerCpu is not None else None,
+                       'tiles': nTiles,
+                       'tiles_per_second': nTiles / wall if wall > 0 else None,
+                       'peak_rss_bytes': rss,
+                       'peak_rss_bytes_workers': workerRss}
+        for key in util_functions.ioCounters:
+            self.record[key] = util_functions.ioCounters[key] - self.startIO[key] + self.workerIO[key]
+        if self.tileSeconds:
+            slowest = max(self.tileSeconds, key=self.tileSeconds.get)
+            self.record['tile_seconds'] = {'count': len(self.tileSeconds),
+                                           'mean': sum(self.tileSeconds.values()) / len(self.tileSeconds),
+                                           'max': self.tileSeconds[slowest],
+                                           'slowest': slowest}
+        return self.record
+
+    def save(self):
+        #append the record of this run to profile.jsonl of the block
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(self.record, sort_keys=True) + '\n')
+
+    def printSummary(self):
+        r = self.record
+        lines = ['Finished %s in %.1fs (cpu %.1fs%s)' %
+                 (r['block'], r['wall_seconds'], r['cpu_seconds'],
+                  ', workers %.1fs' % r['cpu_seconds_workers'] if r['cpu_seconds_workers'] else ''),
+                 '    %d tiles, %.2f tiles/s' % (r['tiles'], r['tiles_per_second'] or 0),
+                 '    read %d files (%s), wrote %d files (%s)' %
+                 (r['files_read'], formatBytes(r['bytes_read']), r['files_written'], formatBytes(r['bytes_written']))]
+        if r['peak_rss_bytes'] is not None:
+            lines.append('    peak memory %s (largest worker %s)' %
+                         (formatBytes(r['peak_rss_bytes']), formatBytes(r['peak_rss_bytes_workers'])))
+        if 'tile_seconds' in r:
+            lines.append('    %.2fs per tile on average, slowest %s (%.2fs)' %
+                         (r['tile_seconds']['mean'], r['tile_seconds']['slowest'], r['tile_seconds']['max']))
+        print('\n'.join(lines))
@@ -22,16 +22,80 @@ Methods you must implement
 (4) makeDirectoryPaths
     make the folder strucutre for the particular kind of block.  Here is an example for patch-extraction.  Returns a valid path starting after the results path
     Results/PatchExt/[PatchExtName]/[CollectionName]/files_ext.tif...
+
+Methods used to run blocks in a pipeline (see uabPipeline), override them if the defaults don't fit
+(1) getInputs
+    extension ids the block reads.  Default: runChannels
+(2) getOutputs
+    extensions (extension, directory, description) the block adds to the collection.  Default: none
+(3) removeTileOutputs
+    remove the outputs of some tiles so that they get remade.  Default: nothing is removed
+(4) getTileOutputPaths
+    paths of the outputs of a tile by extension, lets uabResultCache share them.  Default: None (not cached)
+
+Resuming: runAction() should record every (tile, channel) it completes in the journal of the block (getJournal(), see
+uabBlockJournal) and skip the units that are in there, so that a block that was interrupted resumes without checking
+the files it wrote already.  run(forcerun=1) clears the journal, so a forced run makes every unit again.
 """
 import uabRepoPaths
 import os
+import json
+import hashlib
+import multiprocessing
+from tqdm import tqdm
 import util_functions
+import uabBlockJournal
+import uabBlockProfile
+import uabTileCache
 
 #dictionary that holds the 
 outputDirs = {'preproc':'TilePreproc', 'patchExt':'PatchExtr'}
 
+#cap on the number of processes of mapTiles() in this process, set by uabPipeline for blocks that run side by side so
+#that their pools share the cpus (None: no cap)
+maxWorkers = None
+
+def blockParamValue(val):
+    #JSON-compatible description of a block parameter
+    if isinstance(val, (list, tuple)):
+        return [blockParamValue(a) for a in val]
+    if isinstance(val, dict):
+        return dict((str(k), blockParamValue(v)) for k, v in val.items())
+    if hasattr(val, 'tolist'):
+        #numpy arrays & scalars
+        return val.tolist()
+    try:
+        json.dumps(val)
+        return val
+    except TypeError:
+        if hasattr(val, 'getName'):
+            return '%s(%s)' % (type(val).__name__, val.getName())
+        return type(val).__name__
+
+def inputParamValue(val):
+    #extension ids in a parameter become 'input', they differ between collections & uabResultCache keys the inputs by
+    #their content.  Streamed blocks (described by blockParamValue()) are kept
+    if isinstance(val, (list, tuple)):
+        return [inputParamValue(a) for a in val]
+    if isinstance(val, int) and not isinstance(val, bool):
+        return 'input'
+    return val
+
+def jobName(job):
+    #name of a job of uabBlock.mapTiles() in the profile, the tile if the job starts with it
+    if isinstance(job, tuple) and len(job) > 0 and isinstance(job[0], str):
+        return job[0]
+    return None
+
 class uabBlock(object):
     
+    #parameters that don't change the result of a block, left out of its fingerprint
+    nonResultParams = ['nProc']
+    #parameters that only name the outputs of a block, left out of the keys of uabResultCache as well
+    namingParams = ['name', 'ext', 'descr']
+    #parameters that hold extension ids of the collection, see inputParamValue()
+    inputParams = ['runChannels']
+    
     def __init__(self, runChannels, name):
         self.name = name  
         #channels on which to run this block.  Get the channel indexes from the meta-data file associated with the collection
@@ -53,8 +117,9 @@ class uabBlock(object):
         nm = self.algoName()
         return nm.replace('.','p')
     
-    def run(self, colObj, forcerun=0):
+    def run(self, colObj, forcerun=0, cache=None):
         #Check if the result that exists is finished.  If you want to overwrite a result, set forcerun == 1
+        #cache is an optional uabResultCache, tiles made before from the same inputs & parameters are taken from it
         
         #get the path from this block for the results
         postDirs = self.getDirectoryPaths(colObj)
@@ -63,26 +128,138 @@ class uabBlock(object):
         stateFile = os.path.join(path, 'state.txt')
         stateExist = os.path.exists(stateFile)
         
+        if(forcerun == 1):
+            #everything is made again, the journal of the previous runs doesn't count
+            self.getJournal(colObj).clear()
         if(forcerun == 1 or stateExist == 0):
-            self.runAtomic(colObj, stateFile)
+            self.runAtomic(colObj, stateFile, cache)
         else:
             with open(stateFile, 'r') as f:
                 a = f.readlines()
                 if(a[0].strip() != 'Finished'):
-                    self.runAtomic(colObj, stateFile)
+                    self.runAtomic(colObj, stateFile, cache)
         
         return path
     
-    def runAtomic(self, colObj, stateFile):
+    def runAtomic(self, colObj, stateFile, cache=None):
         #checking the state file and running the block
         print(('Start running %s' % self.getName()))
         with open(stateFile, 'w') as f:
             f.write('Incomplete\n')
+        self.setBlockState(colObj, os.path.dirname(stateFile), 'Incomplete')
         
-        self.runAction(colObj)
+        #time, I/O & memory of this run go to profile.jsonl in the block directory
+        profile = uabBlockProfile.uabBlockProfile(self.getName(), os.path.dirname(stateFile))
+        profile.start()
+        try:
+            #tiles in the cache are linked into place & journaled, the block then skips them
+            cacheKeys = None
+            if(cache is not None and isinstance(colObj.dataListForRun, list) and
+                    self.getTileOutputPaths(colObj, colObj.dataListForRun[0]) is not None):
+                cacheKeys = cache.fetch(self, colObj, colObj.dataListForRun)
+            self.runAction(colObj)
+            if(cacheKeys is not None):
+                cache.put(self, colObj, cacheKeys)
+        finally:
+            profile.stop(len(colObj.dataListForRun) if isinstance(colObj.dataListForRun, list) else 0)
+        profile.save()
+        profile.printSummary()
         
         with open(stateFile, 'w') as f:
             f.write('Finished\n')
+        self.setBlockState(colObj, os.path.dirname(stateFile), 'Finished')
+    
+    def getInputs(self):
+        #extension ids this block reads
+        if type(self.runChannels) is not list:
+            return [self.runChannels]
+        return list(self.runChannels)
+    
+    def getOutputs(self):
+        #extensions [extension, directory, description] this block adds to the collection
+        return []
+    
+    def getOutputDirs(self):
+        #directories (relative to the data directory of the collection) of the extensions made by this block
+        return []
+    
+    def removeTileOutputs(self, colObj, tiles):
+        #remove the outputs of these tiles so that the next run remakes them.  Blocks that can't tell which outputs
+        #belong to a tile remove nothing
+        pass
+    
+    def getTileOutputPaths(self, colObj, tile):
+        #{extension: path} of the outputs of a tile, None if the outputs of the block don't go by tile
+        return None
+    
+    def getJournal(self, colObj):
+        #journal of the (tile, channel) units this block completed on this collection
+        #units recorded with other parameters (that don't change the directory of the block) are not done
+        return uabBlockJournal.uabBlockJournal(self.getBlockDir(self.getDirectoryPaths(colObj)), self.getParamsHash())
+    
+    def mapTiles(self, worker, jobs, nProc=None, desc=None):
+        """
+        Run worker(job) for every job in a pool of processes, e.g., one job per tile in runAction()
+        :param worker: function at the top level of a module (it has to be pickled)
+        :param jobs: list of picklable arguments for the worker, tuples starting with the tile name are profiled by tile
+        :param nProc: number of processes, defaults to self.nProc or else the number of cpus (at most maxWorkers).  1 runs
+                      in this process
+        :param desc: description shown by the progress bar
+        :return: iterator over the results of the worker, in the order they finish
+        """
+        if nProc is None:
+            nProc = getattr(self, 'nProc', None) or multiprocessing.cpu_count()
+        if maxWorkers is not None:
+            nProc = min(nProc, maxWorkers)
+        nProc = max(1, min(nProc, len(jobs)))
+        profile = uabBlockProfile.getCurrent()
+        if(nProc == 1):
+            for job in tqdm(jobs, desc=desc):
+                with uabBlockProfile.timeTile(jobName(job)):
+                    res = worker(job)
+                yield res
+        else:
+            pool = multiprocessing.Pool(nProc)
+            #the jobs are pickled until the last one is sent, the collections in them share the budget of the tile cache
+            try:
+                with uabTileCache.sharedBetween(nProc):
+                    #the workers report their duration & I/O to the profile of this block
+                    profJobs = [(worker, jobName(job), job) for job in jobs]
+                    for res, name, seconds, io in tqdm(pool.imap_unordered(uabBlockProfile.profiledWorker, profJobs),
+                                                       total=len(jobs), desc=desc):
+                        if profile is not None:
+                            profile.tileDone(name, seconds)
+                            profile.addWorkerIO(io)
+                        yield res
+            finally:
+                pool.close()
+                pool.join()
+    
+    def getParams(self):
+        #parameters of this block as a JSON-compatible dictionary
+        #objects (e.g., tile operators) are described by their class & name
+        return dict((key, blockParamValue(val)) for key, val in vars(self).items() if not key.startswith('_'))
+    
+    def getParamsHash(self):
+        #hash of the parameters that change the result of this block
+        params = dict((key, val) for key, val in self.getParams().items() if key not in self.nonResultParams)
+        return hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+    
+    def getContentParams(self, colObj):
+        #parameters that change the content of the outputs of a tile, without the names & extension ids of a collection.
+        #Blocks whose tiles depend on more than their input tiles add it (e.g., statistics of the collection)
+        params = {}
+        for key, val in self.getParams().items():
+            if key in self.nonResultParams or key in self.namingParams:
+                continue
+            params[key] = inputParamValue(val) if key in self.inputParams else val
+        return params
+    
+    def setBlockState(self, colObj, path, state):
+        #record the parameters & state of this block in the meta-data store of the collection
+        store = getattr(colObj, 'store', None)
+        if store is not None:
+            store.setBlockState(path, self.getName(), self.getParams(), state)
     
     
     
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Chunked, compressed on-disk format for (preprocessed) tiles.
+
+A chunked tile is a directory whose name ends with chunkExt (e.g., TileName_DSMDiff.chk):
+    TileName_DSMDiff.chk/
+        header.json     shape, dtype, chunk size & codec of the array
+        c0_0, c0_1, ... one compressed file per chunk (chunk row _ chunk column)
+Chunks that were never written read as zeros.
+
+Any block saves to this format by using an extension ending with '.chk' (uabUtilAllTypeSave() & uabUtilAllTypeLoad()
+dispatch on it) and uabCollection.loadTileWindow() only decompresses the chunks that intersect the window.  Since every
+chunk is its own file, different processes can write disjoint chunk-aligned windows of the same tile in parallel.
+Writes that are not aligned to the chunk grid read-modify-write the chunks at the border and must not overlap between
+processes.
+
+The codec is lz4 (frame format) if the lz4 package is installed, zlib otherwise.  The codec is stored in the header so
+files can be read on machines with either.
+"""
+
+import os
+import json
+import zlib
+import numpy as np
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+chunkExt = 'chk'
+headerFile = 'header.json'
+defaultChunks = (512, 512)
+
+
+def defaultCodec():
+    return 'lz4' if lz4 is not None else 'zlib'
+
+
+def compress(data, codec):
+    if codec == 'lz4':
+        return lz4.frame.compress(data)
+    return zlib.compress(data, 1)
+
+
+def decompress(data, codec):
+    if codec == 'lz4':
+        if lz4 is None:
+            raise IOError('This tile was written with lz4, install the lz4 package to read it')
+        return lz4.frame.decompress(data)
+    return zlib.decompress(data)
+
+
+def isChunked(path):
+    return path.endswith('.' + chunkExt)
+
+
+def exists(path):
+    return os.path.isfile(os.path.join(path, headerFile))
+
+
+def writeAtomic(path, data, mode='wb'):
+    tmpPath = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmpPath, mode) as f:
+        f.write(data)
+    os.replace(tmpPath, path)
+
+
+class uabChunkedArray(object):
+    """
+    Array stored as compressed chunks.  Supports numpy-style reads & writes of 2-D windows:
+        arr = uabChunkedArray.create(path, shape, dtype)
+        arr[0:512, :] = data
+        window = arr[100:200, 300:400]
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(os.path.join(path, headerFile), 'r') as f:
+                header = json.load(f)
+        except (IOError, ValueError):
+            raise IOError('Problem loading this data tile')
+        self.shape = tuple(header['shape'])
+        self.dtype = np.dtype(header['dtype'])
+        self.chunks = tuple(header['chunks'])
+        self.codec = header['codec']
+
+    @classmethod
+    def create(cls, path, shape, dtype, chunks=defaultChunks, codec=None):
+        #make a new (empty) chunked array, an existing one at this path is replaced
+        if codec is None:
+            codec = defaultCodec()
+        if os.path.isdir(path):
+            for name in os.listdir(path):
+                os.remove(os.path.join(path, name))
+        else:
+            os.makedirs(path)
+        header = {'shape': list(shape), 'dtype': np.dtype(dtype).str, 'chunks': list(chunks), 'codec': codec}
+        writeAtomic(os.path.join(path, headerFile), json.dumps(header), mode='w')
+        return cls(path)
+
+    def chunkPath(self, cy, cx):
+        return os.path.join(self.path, 'c%d_%d' % (cy, cx))
+
+    def chunkShape(self, cy, cx):
+        ch, cw = self.chunks
+        return (min(ch, self.shape[0] - cy * ch), min(cw, self.shape[1] - cx * cw)) + self.shape[2:]
+
+    def readChunk(self, cy, cx):
+        shape = self.chunkShape(cy, cx)
+        try:
+            with open(self.chunkPath(cy, cx), 'rb') as f:
+                data = f.read()
+        except IOError:
+            return np.zeros(shape, dtype=self.dtype)
+        return np.frombuffer(decompress(data, self.codec), dtype=self.dtype).reshape(shape)
+
+    def writeChunk(self, cy, cx, data):
+        data = np.ascontiguousarray(data, dtype=self.dtype)
+        assert data.shape == self.chunkShape(cy, cx)
+        writeAtomic(self.chunkPath(cy, cx), compress(data.tobytes(), self.codec))
+
+    def chunkRange(self, y0, y1, x0, x1):
+        ch, cw = self.chunks
+        return range(y0 // ch, -(-y1 // ch)), range(x0 // cw, -(-x1 // cw))
+
+    @staticmethod
+    def windowBounds(key, shape):
+        ys, xs = key
+        y0, y1, _ = ys.indices(shape[0])
+        x0, x1, _ = xs.indices(shape[1])
+        return y0, y1, x0, x1
+
+    def __getitem__(self, key):
+        y0, y1, x0, x1 = uabChunkedArray.windowBounds(key, self.shape)
+        ch, cw = self.chunks
+        out = np.zeros((y1 - y0, x1 - x0) + self.shape[2:], dtype=self.dtype)
+        cys, cxs = self.chunkRange(y0, y1, x0, x1)
+        for cy in cys:
+            for cx in cxs:
+                chunk = self.readChunk(cy, cx)
+                a0, a1 = max(cy * ch, y0), min((cy + 1) * ch, y1)
+                b0, b1 = max(cx * cw, x0), min((cx + 1) * cw, x1)
+                out[a0 - y0:a1 - y0, b0 - x0:b1 - x0] = chunk[a0 - cy * ch:a1 - cy * ch, b0 - cx * cw:b1 - cx * cw]
+        return out
+
+    def __setitem__(self, key, data):
+        y0, y1, x0, x1 = uabChunkedArray.windowBounds(key, self.shape)
+        ch, cw = self.chunks
+        data = np.broadcast_to(np.asarray(data, dtype=self.dtype), (y1 - y0, x1 - x0) + self.shape[2:])
+        cys, cxs = self.chunkRange(y0, y1, x0, x1)
+        for cy in cys:
+            for cx in cxs:
+                a0, a1 = max(cy * ch, y0), min((cy + 1) * ch, y1)
+                b0, b1 = max(cx * cw, x0), min((cx + 1) * cw, x1)
+                part = data[a0 - y0:a1 - y0, b0 - x0:b1 - x0]
+                if part.shape[:2] == self.chunkShape(cy, cx)[:2]:
+                    self.writeChunk(cy, cx, part)
+                else:
+                    chunk = self.readChunk(cy, cx).copy()
+                    chunk[a0 - cy * ch:a1 - cy * ch, b0 - cx * cw:b1 - cx * cw] = part
+                    self.writeChunk(cy, cx, chunk)
+
+    def read(self):
+        #the whole array
+        return self[0:self.shape[0], 0:self.shape[1]]
+
+
+def save(path, data, chunks=defaultChunks, codec=None):
+    arr = uabChunkedArray.create(path, data.shape, data.dtype, chunks, codec)
+    arr[0:data.shape[0], 0:data.shape[1]] = data
+    return arr
+
+
+def load(path):
+    return uabChunkedArray(path).read()
+
+
+def probe(path):
+    #shape & dtype from the header, used by uabTileManifest
+    arr = uabChunkedArray(path)
+    return arr.shape, arr.dtype.str
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Meta-data store of a collection (meta_data/collection.db, SQLite).
+
+Holds the extensions (tile-maps) of the collection with their directories & descriptions, the parameters, state &
+input fingerprint (see uabPipeline) of the blocks that ran on it, the per-tile class pixel counts of the ground truth
+tile-maps and the content hashes of tile files (see uabResultCache).  Writes happen in IMMEDIATE transactions and
+SQLite serializes them across threads, processes & users, so several blocks can register their outputs at the same time
+without interleaving or duplicating entries.  The store keeps SQLite's default rollback journal, which only needs file
+locks: WAL mode needs shared memory between the processes, which network file systems (where collections are shared)
+don't provide.  The id of an extension is its position in the order of registration, which is the order of the lines of
+the old collection.txt.  Registering an extension that already exists (same extension & directory) only updates its
+description.
+
+collection.txt is not read anymore once the store exists.  For older collections it is imported (as is, duplicate lines
+included, so that extension ids don't change) the first time the store is opened.  It is rewritten from the store after
+every change so that it stays available as a human readable listing.
+"""
+
+import os
+import json
+import time
+import sqlite3
+
+schema = '''
+CREATE TABLE IF NOT EXISTS extensions (id INTEGER PRIMARY KEY AUTOINCREMENT, ext TEXT NOT NULL, dir TEXT NOT NULL,
+                                       descr TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS extensionsByName ON extensions (ext, dir);
+CREATE TABLE IF NOT EXISTS blocks (dir TEXT PRIMARY KEY, name TEXT, params TEXT, state TEXT, updated REAL,
+                                   fingerprint TEXT);
+CREATE TABLE IF NOT EXISTS classCounts (ext TEXT NOT NULL, dir TEXT NOT NULL, tile TEXT NOT NULL, counts TEXT NOT NULL,
+                                        mtime INTEGER, PRIMARY KEY (ext, dir, tile));
+CREATE TABLE IF NOT EXISTS fileHashes (path TEXT PRIMARY KEY, mtime INTEGER, nbytes INTEGER, hash TEXT NOT NULL);
+'''
+
+
+class uabCollectionStore(object):
+
+    dbFilename = 'collection.db'
+
+    def __init__(self, metaDir, legacyFile=None):
+        #metaDir -> meta-data directory of the collection
+        #legacyFile -> collection.txt, imported if the store is new & kept up to date as a listing
+        self.path = os.path.join(metaDir, uabCollectionStore.dbFilename)
+        self.legacyFile = legacyFile
+        self.conn = None
+        self.pid = None
+        db = self.connect()
+        db.executescript(schema)
+        if 'fingerprint' not in [a[1] for a in db.execute('PRAGMA table_info(blocks)')]:
+            #stores made before blocks had fingerprints
+            self.write(lambda db: db.execute('ALTER TABLE blocks ADD COLUMN fingerprint TEXT'))
+        if legacyFile is not None and os.path.exists(legacyFile):
+            self.write(self.importLegacy)
+
+    def connect(self):
+        #one connection per process, connections must not be shared across a fork
+        if self.conn is None or self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.path, timeout=120, isolation_level=None)
+            if self.conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal':
+                #stores made in WAL mode go back to the rollback journal, if no other process has the store open
+                try:
+                    self.conn.execute('PRAGMA journal_mode=DELETE')
+                except sqlite3.OperationalError:
+                    pass
+            self.pid = os.getpid()
+        return self.conn
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['conn'] = None
+        return state
+
+    def write(self, func, *args):
+        #run func(db, *args) in a write transaction
+        db = self.connect()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            out = func(db, *args)
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        return out
+
+    def importLegacy(self, db):
+        if db.execute('SELECT COUNT(*) FROM extensions').fetchone()[0] > 0:
+            return
+        with open(self.legacyFile, 'r') as f:
+            lines = [line.rstrip('\n').split('\t') for line in f.readlines() if len(line.strip()) > 0]
+        for a in lines:
+            db.execute('INSERT INTO extensions (ext, dir, descr) VALUES (?, ?, ?)',
+                       (a[0], a[1], a[2] if len(a) > 2 else ''))
+
+    def exportLegacy(self):
+        if self.legacyFile is None:
+            return
+        tmpPath = '%s.%d.tmp' % (self.legacyFile, os.getpid())
+        with open(tmpPath, 'w') as f:
+            for ext, dirn, descr in self.getExtensions():
+                f.write('{}\t{}\t{}\n'.format(ext, dirn, descr))
+        os.replace(tmpPath, self.legacyFile)
+
+    def hasExtensions(self):
+        return self.connect().execute('SELECT COUNT(*) FROM extensions').fetchone()[0] > 0
+
+    def registerExtension(self, ext, dirn, descr):
+        """
+        Add an extension to the collection or update its description if it exists already
+        :return: id of the extension
+        """
+        def register(db):
+            row = db.execute('SELECT id FROM extensions WHERE ext = ? AND dir = ? ORDER BY id LIMIT 1',
+                             (ext, dirn)).fetchone()
+            if row is None:
+                db.execute('INSERT INTO extensions (ext, dir, descr) VALUES (?, ?, ?)', (ext, dirn, descr))
+            else:
+                db.execute('UPDATE extensions SET descr = ? WHERE id = ?', (descr, row[0]))
+            #in the transaction, so that the listings are written in the order of the registrations
+            self.exportLegacy()
+        self.write(register)
+        return self.getExtensionId(ext, dirn)
+
+    def getExtensions(self):
+        #list of (ext, dir, description) ordered by extension id
+        return [tuple(a) for a in self.connect().execute('SELECT ext, dir, descr FROM extensions ORDER BY id')]
+
+    def getExtensionId(self, ext, dirn=None):
+        #position of an extension in getExtensions(), None if it doesn't exist
+        db = self.connect()
+        if dirn is None:
+            row = db.execute('SELECT id FROM extensions WHERE ext = ? ORDER BY id LIMIT 1', (ext,)).fetchone()
+        else:
+            row = db.execute('SELECT id FROM extensions WHERE ext = ? AND dir = ? ORDER BY id LIMIT 1',
+                             (ext, dirn)).fetchone()
+        if row is None:
+            return None
+        return db.execute('SELECT COUNT(*) FROM extensions WHERE id < ?', (row[0],)).fetchone()[0]
+
+    def setBlockState(self, dirn, name, params, state):
+        #record the parameters & state (e.g., 'Incomplete', 'Finished') of a block by its output directory
+        self.write(lambda db: db.execute('INSERT INTO blocks (dir, name, params, state, updated) VALUES (?, ?, ?, ?, ?) '
+                                         'ON CONFLICT (dir) DO UPDATE SET name = excluded.name, '
+                                         'params = excluded.params, state = excluded.state, updated = excluded.updated',
+                                         (dirn, name, json.dumps(params, sort_keys=True), state, time.time())))
+
+    def setBlockFingerprint(self, dirn, fingerprint):
+        #fingerprint (JSON-compatible) of the parameters & inputs of the last complete run of a block
+        self.write(lambda db: db.execute('UPDATE blocks SET fingerprint = ? WHERE dir = ?',
+                                         (json.dumps(fingerprint, sort_keys=True), dirn)))
+
+    def getBlockState(self, dirn):
+        #returns {'name', 'params', 'state', 'updated', 'fingerprint'} of a block or None
+        row = self.connect().execute('SELECT name, params, state, updated, fingerprint FROM blocks WHERE dir = ?',
+                                     (dirn,)).fetchone()
+        if row is None:
+            return None
+        return {'name': row[0], 'params': json.loads(row[1]), 'state': row[2], 'updated': row[3],
+                'fingerprint': json.loads(row[4]) if row[4] is not None else None}
+
+    def getBlocks(self):
+        return [{'dir': a[0], 'name': a[1], 'state': a[2]} for a in
+                self.connect().execute('SELECT dir, name, state FROM blocks ORDER BY updated')]
+
+    def setClassCounts(self, ext, dirn, countsByTile):
+        #countsByTile -> {tile: (counts, mtime of the GT file)}
+        self.write(lambda db: db.executemany('INSERT OR REPLACE INTO classCounts (ext, dir, tile, counts, mtime) '
+                                             'VALUES (?, ?, ?, ?, ?)',
+                                             [(ext, dirn, tile, json.dumps([int(a) for a in counts]), mtime)
+                                              for tile, (counts, mtime) in countsByTile.items()]))
+
+    def getClassCounts(self, ext, dirn):
+        #returns {tile: (counts list, mtime of the GT file)}
+        rows = self.connect().execute('SELECT tile, counts, mtime FROM classCounts WHERE ext = ? AND dir = ?',
+                                      (ext, dirn))
+        return dict((tile, (json.loads(counts), mtime)) for tile, counts, mtime in rows)
+
+    def setFileHashes(self, hashes):
+        #hashes -> {path: (hash of the content, mtime in ns, size in bytes)}
+        self.write(lambda db: db.executemany('INSERT OR REPLACE INTO fileHashes (path, mtime, nbytes, hash) '
+                                             'VALUES (?, ?, ?, ?)',
+                                             [(path, mtime, nbytes, h) for path, (h, mtime, nbytes) in hashes.items()]))
+
+    def getFileHash(self, path, mtime, nbytes):
+        #content hash of a file if it was recorded for this mtime & size, None otherwise
+        row = self.connect().execute('SELECT hash FROM fileHashes WHERE path = ? AND mtime = ? AND nbytes = ?',
+                                     (path, mtime, nbytes)).fetchone()
+        return None if row is None else row[0]
@@ -16,10 +16,16 @@ The assumption of file names:
     3. The patch id follows file names
 
 The file names in fileList can be only the file name of path to the file name, the functions will handle this
+
+Lists of patch extractors come with a sidecar (see uabPatchManifest), they are loaded as a uabPatchList.  Their folds
+are computed on the first row of every tile & spread to the rows of the tile, make_file_list_by_key() returns a
+uabPatchList as well.
 """
 
 import os
 import re
+import numpy as np
+import uabPatchManifest
 
 def uabUtilGetFolds(parentDir, fileList, xvalType):
     if 'city' == xvalType:
@@ -74,11 +80,13 @@ def make_file_list_by_key(idx, file_list, key, filter_list=None):
     if type(key) is not list:
         key = [key]
     if filter_list is None:
+        if isinstance(file_list, uabPatchManifest.uabPatchList):
+            return file_list.select(np.isin(idx, key))
         return [file_list[a] for a in range(len(file_list)) if idx[a] in key]
     else:
         if type(filter_list) is not list:
             filter_list = [filter_list]
-        file_list_return = []
+        keep = []
         for a in range(len(file_list)):
             if idx[a] in key:
                 check_flag = 0
@@ -94,20 +102,22 @@ def make_file_list_by_key(idx, file_list, key, filter_list=None):
                             check_flag = 1
                             break
                 if check_flag == 0:
-                    file_list_return.append(file_list[a])
-        return file_list_return
+                    keep.append(a)
+        return uabPatchManifest.selectRows(file_list, keep)
     
 
 class uabXvalParent(object):
     def getFolds(self, parentDir, fileList):
         if(isinstance(fileList, str)):
-            filename = os.path.join(parentDir,fileList) 
-            with open(filename) as file:
-                chipFiles = file.readlines()
-            
-            chipFiles = [a.strip().split(' ') for a in chipFiles]
+            chipFiles = uabPatchManifest.loadFileList(parentDir, fileList)
         else:
             chipFiles = fileList
+        if isinstance(chipFiles, uabPatchManifest.uabPatchList):
+            # one fold per tile, computed on its first row
+            tileRows = chipFiles.getTileRows()
+            tileFolds = np.zeros(len(chipFiles.tiles), dtype=np.int64)
+            tileFolds[chipFiles.tileIdx[tileRows]] = self.computeFolds([chipFiles[i] for i in tileRows])
+            return tileFolds[chipFiles.tileIdx].tolist(), chipFiles
         return self.computeFolds(chipFiles), chipFiles
     
     def computeFolds(self, chipFiles):
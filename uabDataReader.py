@@ -14,7 +14,10 @@ import scipy.misc, os
 import numpy as np
 import tensorflow as tf
 import uabUtilreader
+import uabTileManifest
 import util_functions
+import uabPatchReaders
+import uabPatchManifest
 
 
 #class to load all the possible slices of your data    
@@ -45,11 +48,8 @@ class ImageLabelReader(object):
         # need to separate the file names into their own vectors
         
         if(isinstance(chipFiles, str)):
-            filename = os.path.join(parentDir,chipFiles) 
-            with open(filename) as file:
-                chipFiles = file.readlines()
-            
-            chipFiles = [a.strip().split(' ') for a in chipFiles]
+            # uabPatchList if the list has a sidecar (see uabPatchManifest)
+            chipFiles = uabPatchManifest.loadFileList(parentDir, chipFiles)
         self.chip_files = chipFiles
         
         if(nChannels is not list):
@@ -71,9 +71,10 @@ class ImageLabelReader(object):
         
         # need to decide whether this can be a queue based or a regular data-iterator.
         # Can only use a queue if all the files are jpg/png otherwise need to use the slower data-reader
+        # patches in shards (see uabPatchShards) have jpg/png names but no files, they go through the data-reader
         self.fileExts = [a.split('.')[-1] for a in el1]
         extExistence = [a in ['jpg','png','jpeg'] for a in self.fileExts]
-        if(all(extExistence) and isTrain == 1):
+        if(all(extExistence) and isTrain == 1 and not uabPatchReaders.isSharded(parentDir, el1[0])):
             self.isQueue = 1
 
             fnameList = []
@@ -112,7 +113,7 @@ class ImageLabelReader(object):
                 blockList = []
                 nDims = 0
                 for file in row:
-                    img = util_functions.uabUtilAllTypeLoad(os.path.join(image_dir,file))
+                    img = uabPatchReaders.loadPatch(image_dir, file)
                     if len(img.shape) == 2:
                         img = np.expand_dims(img, axis=2)
                     nDims += img.shape[2]
@@ -137,33 +138,46 @@ class ImageLabelReader(object):
     
     def readFromDiskIteratorTest(self, image_dir, chipFiles, batch_size, tile_dim, patch_size, overlap=0, padding=(0,0)):
         # this is a iterator for test
+        padding = np.array(padding)
+        doPad = (padding > 0).any()
         for row in chipFiles:
+            if type(image_dir) is list:
+                paths = [os.path.join(image_dir[cnt], file) for cnt, file in enumerate(row)]
+            else:
+                paths = [os.path.join(image_dir, file) for file in row]
+            # if the tile already has the right size, read it padded (symmetric padding is done while reading).  The
+            # channels of a tile have the same size, one header is probed per tile
+            readPadded = doPad and uabTileManifest.probeTile(paths[0])[0][:2] == tuple(tile_dim)
+
             blockList = []
             nDims = 0
-            for cnt, file in enumerate(row):
-                if type(image_dir) is list:
-                    img = util_functions.uabUtilAllTypeLoad(os.path.join(image_dir[cnt], file))
+            for path in paths:
+                if readPadded:
+                    img = util_functions.uabUtilAllTypeWindowLoad(path, -padding[0], -padding[1],
+                                                                  tile_dim[0] + padding[0]*2, tile_dim[1] + padding[1]*2)
                 else:
-                    img = util_functions.uabUtilAllTypeLoad(os.path.join(image_dir, file))
+                    img = util_functions.uabUtilAllTypeLoad(path)
                 if len(img.shape) == 2:
                     img = np.expand_dims(img, axis=2)
                 nDims += img.shape[2]
                 blockList.append(img)
             block = np.dstack(blockList).astype(np.float32)
 
-            if not np.all([np.array(tile_dim) == block.shape[:2]]):
+            if not readPadded and not np.all([np.array(tile_dim) == block.shape[:2]]):
                 block = skimage.transform.resize(block, tile_dim, order=0, preserve_range=True, mode='reflect')
 
             if self.block_mean is not None:
                 block -= self.block_mean
-        
-            if (np.array(padding) > 0).any():
-                block = uabUtilreader.pad_block(block, padding)
-                tile_dim = tile_dim + padding*2
+
+            block_dim = tile_dim
+            if doPad:
+                if not readPadded:
+                    block = uabUtilreader.pad_block(block, padding)
+                block_dim = tile_dim + padding*2
             
             ind = 0
             image_batch = np.zeros((batch_size, patch_size[0], patch_size[1], nDims))
-            for patch in uabUtilreader.patchify(block, tile_dim, patch_size, overlap=overlap):
+            for patch in uabUtilreader.patchify(block, block_dim, patch_size, overlap=overlap):
                 # print(str(ind) +': '+ str(patch.shape))
                 image_batch[ind, :, :, :] = patch
                 ind += 1
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Patch manifests: fileList.txt of the patch extractors & its binary sidecar.
+
+fileList.txt has one row per patch location with the names of the patches of every channel (TileName_y0x0_RGB0.jpg
+TileName_y0x0_RGB1.jpg ...).  The extractors stream the rows of every tile to a temporary file as the tiles are done
+(uabPatchManifestWriter) & rename it into place at the end, so fileList.txt is written once & a fileList.txt always
+lists a complete extraction.  Next to it they save fileList.npz (the sidecar), the same rows as arrays:
+    tiles       names of the tiles
+    tileIdx     [n] index in tiles of the tile of every row
+    y, x        [n] top left corner of the patch of every row
+    exts        the channel table: extension of every column of a row
+A name is tiles[tileIdx[i]] + '_y%dx%d_' + exts[c] (see uabPatchList.getName()).
+
+loadFileList() returns a uabPatchList when the sidecar is there (& not older than fileList.txt, a list edited by hand is
+read as text) instead of parsing the text into nested lists.  A uabPatchList behaves like the list of rows (len(),
+[i] -> list of names, iteration) but keeps the arrays, so selecting rows (folds, see uabCrossValMaker) or channels does
+not build any strings.
+"""
+
+import os
+import numpy as np
+
+sidecarExt = '.npz'
+
+
+def getSidecarPath(path):
+    return os.path.splitext(path)[0] + sidecarExt
+
+
+class uabPatchList(object):
+    #rows of a patch manifest as arrays
+
+    def __init__(self, tiles, tileIdx, y, x, exts):
+        self.tiles = np.asarray(tiles)
+        self.tileIdx = np.asarray(tileIdx, dtype=np.int32)
+        self.y = np.asarray(y, dtype=np.int32)
+        self.x = np.asarray(x, dtype=np.int32)
+        self.exts = np.asarray(exts)
+
+    def __len__(self):
+        return len(self.tileIdx)
+
+    def getName(self, i, c):
+        return '%s_y%dx%d_%s' % (self.tiles[self.tileIdx[i]], self.y[i], self.x[i], self.exts[c])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.select(np.arange(len(self))[i])
+        return [self.getName(i, c) for c in range(len(self.exts))]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def select(self, rows):
+        #rows -> indexes or boolean mask of the rows to keep
+        return uabPatchList(self.tiles, self.tileIdx[rows], self.y[rows], self.x[rows], self.exts)
+
+    def selectChannels(self, chans):
+        #the rows with only (& in the order of) these columns
+        return uabPatchList(self.tiles, self.tileIdx, self.y, self.x, self.exts[list(chans)])
+
+    def getTileNames(self):
+        #tile name of every row
+        return self.tiles[self.tileIdx]
+
+    def getTileRows(self):
+        #first row of every tile, in the order the tiles appear
+        _, first = np.unique(self.tileIdx, return_index=True)
+        return np.sort(first)
+
+    def save(self, path):
+        np.savez(path, tiles=self.tiles, tileIdx=self.tileIdx, y=self.y, x=self.x, exts=self.exts)
+
+
+def loadSidecar(path):
+    with np.load(path) as data:
+        return uabPatchList(data['tiles'], data['tileIdx'], data['y'], data['x'], data['exts'])
+
+
+def loadFileList(parentDir, fileList):
+    """
+    Rows of a file list
+    :param fileList: name of the file in parentDir (e.g., fileList.txt)
+    :return: uabPatchList if the list has an up to date sidecar, list of lists of names otherwise
+    """
+    path = os.path.join(parentDir, fileList)
+    sidecar = getSidecarPath(path)
+    if os.path.exists(sidecar) and os.path.getmtime(sidecar) >= os.path.getmtime(path):
+        return loadSidecar(sidecar)
+    with open(path) as file:
+        return [a.strip().split(' ') for a in file.readlines()]
+
+
+def selectRows(rows, keep):
+    #rows at the indexes in keep, a uabPatchList stays one
+    if isinstance(rows, uabPatchList):
+        return rows.select(np.asarray(keep, dtype=np.int64))
+    return [rows[i] for i in keep]
+
+
+def commitFileList(tmpPath, path, rows):
+    #rename a written list into place, then save its sidecar (rows: uabPatchList, None for a list without sidecar).  A
+    #sidecar older than its list is not used, so a list is never read with the sidecar of the previous one
+    os.replace(tmpPath, path)
+    sidecar = getSidecarPath(path)
+    if rows is None:
+        if os.path.exists(sidecar):
+            os.remove(sidecar)
+        return
+    tmpSidecar = '%s.%d.tmp%s' % (os.path.splitext(sidecar)[0], os.getpid(), sidecarExt)
+    rows.save(tmpSidecar)
+    os.replace(tmpSidecar, sidecar)
+
+
+def saveFileList(directory, fname, rows):
+    """
+    Write a file list atomically, with its sidecar if the rows are a uabPatchList
+    :param rows: uabPatchList or lists of names
+    """
+    path = os.path.join(directory, fname)
+    tmpPath = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmpPath, 'w') as file:
+        for row in rows:
+            file.write('{}\n'.format(' '.join(row)))
+    commitFileList(tmpPath, path, rows if isinstance(rows, uabPatchList) else None)
+
+
+class uabPatchManifestWriter(object):
+    """
+    Streams the rows of an extraction tile by tile, call close() once all the tiles are done:
+        manifest = uabPatchManifestWriter(directory, 'fileList.txt', fileExts)
+        for tile ...:
+            manifest.addTile(tile, coords)
+        manifest.close()
+    """
+
+    def __init__(self, directory, fname, exts):
+        self.path = os.path.join(directory, fname)
+        self.tmpPath = '%s.%d.tmp' % (self.path, os.getpid())
+        self.exts = list(exts)
+        self.tiles = []
+        self.tileIdx = []
+        self.coords = []
+        self.file = open(self.tmpPath, 'w')
+
+    def addTile(self, tile, coords):
+        #append the rows of a tile, coords -> [(y, x)] in the order of the rows
+        self.file.write(''.join(['{}\n'.format(' '.join([tile + '_y%dx%d_%s' % (y, x, ext) for ext in self.exts]))
+                                 for y, x in coords]))
+        self.file.flush()
+        self.tileIdx.append(np.full(len(coords), len(self.tiles), dtype=np.int32))
+        self.tiles.append(tile)
+        self.coords.append(np.asarray(coords, dtype=np.int32).reshape(-1, 2))
+
+    def close(self):
+        #finalize: rename the list into place & save its sidecar
+        self.file.close()
+        coords = np.concatenate(self.coords) if self.coords else np.zeros((0, 2), dtype=np.int32)
+        rows = uabPatchList(np.array(self.tiles, dtype=str), np.concatenate(self.tileIdx) if self.tileIdx else [],
+                            coords[:, 0], coords[:, 1], np.array(self.exts, dtype=str))
+        commitFileList(self.tmpPath, self.path, rows)
+        return rows
+
+    def abort(self):
+        #drop the rows, the previous list (if any) stays
+        self.file.close()
+        os.remove(self.tmpPath)
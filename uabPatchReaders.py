@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Readers of the patches of an extraction directory by fileList.txt name, whatever the extractor wrote: one file per patch
+per channel, per-tile shards (see uabPatchShards) or a virtual extraction (see uabPatchVirtual).
+
+Read patches with loadPatch(directory, name).  The reader of a directory is kept between calls so that shards & tiles
+are opened once, it is checked against the files it was opened from (inode, mtime & size of virtual.json, of the index
+of every shard) & opened again when they were rewritten, e.g., by a new extraction in the same process.
+"""
+
+import os
+import json
+import numpy as np
+import util_functions
+import uabTileCache
+import uabPatchShards
+import uabPatchVirtual
+
+
+def getStamp(path):
+    #version of a file, None if it does not exist
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+class uabPatchShardReader(object):
+    #patches of a directory by name, the shards of the tiles are opened once per version of their index
+
+    def __init__(self, directory):
+        self.directory = directory
+        #tile -> (stamp of the index, uabPatchShard), None for tiles without a shard
+        self.shards = {}
+
+    def getShard(self, tile):
+        shardPath, indexPath = uabPatchShards.getShardPaths(self.directory, tile)
+        stamp = getStamp(indexPath)
+        if tile not in self.shards or self.shards[tile][0] != stamp:
+            self.shards[tile] = (stamp, uabPatchShards.uabPatchShard(shardPath, indexPath) if stamp is not None else None)
+        return self.shards[tile][1]
+
+    def isSharded(self, name):
+        m = uabPatchShards.namePattern.match(name)
+        return m is not None and self.getShard(m.group(1)) is not None
+
+    def load(self, name):
+        m = uabPatchShards.namePattern.match(name)
+        shard = self.getShard(m.group(1)) if m is not None else None
+        if shard is None:
+            return util_functions.uabUtilAllTypeLoad(os.path.join(self.directory, name))
+        patch = shard.getPatch(int(m.group(2)), int(m.group(3)), m.group(4))
+        util_functions.uabUtilCountIO('read', patch)
+        return patch
+
+
+class uabVirtualPatchReader(object):
+    #patches of a virtual extraction by name, memory maps are opened once per tile
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, uabPatchVirtual.mapFile), 'r') as f:
+            vmap = json.load(f)
+        self.cSize = tuple(vmap['cSize'])
+        self.pad = vmap['pad']
+        self.channels = vmap['channels']
+        #path -> memory map
+        self.memmaps = {}
+        self.tileCache = uabTileCache.uabTileLRUCache(uabPatchVirtual.cacheBytes)
+
+    def isSharded(self, name):
+        #no patch of a virtual extraction is a file
+        return True
+
+    def getWindow(self, path, y, x):
+        h, w = self.cSize
+        if util_functions.uabUtilIsWindowable(path) and not path.endswith('.npy'):
+            #counted by uabUtilAllTypeWindowLoad
+            return util_functions.uabUtilAllTypeWindowLoad(path, y, x, h, w)
+        if path.endswith('.npy'):
+            if path not in self.memmaps:
+                self.memmaps[path] = np.load(path, mmap_mode='r')
+            data = self.memmaps[path]
+        else:
+            data = self.tileCache.get(path)
+            if data is None:
+                data = self.tileCache.put(path, util_functions.uabUtilAllTypeLoad(path))
+        patch = util_functions.uabUtilWindowFromArray(data, y, x, h, w)
+        util_functions.uabUtilCountIO('read', patch)
+        return patch
+
+    def load(self, name):
+        tile, y, x, ext = uabPatchShards.parsePatchName(name)
+        return self.getWindow(self.channels[ext][tile], y - self.pad, x - self.pad)
+
+
+#readers used by loadPatch(), directory -> (stamp of virtual.json, reader)
+readers = {}
+
+
+def getReader(directory):
+    #reader of the patches of a directory: virtual extraction, shards or files
+    stamp = getStamp(os.path.join(directory, uabPatchVirtual.mapFile))
+    if directory not in readers or readers[directory][0] != stamp:
+        if stamp is not None:
+            readers[directory] = (stamp, uabVirtualPatchReader(directory))
+        else:
+            readers[directory] = (stamp, uabPatchShardReader(directory))
+    return readers[directory][1]
+
+
+def loadPatch(directory, name):
+    #patch of a fileList.txt name, from the shard of its tile, the tile of a virtual extraction or its own file
+    return getReader(directory).load(name)
+
+
+def isSharded(directory, name):
+    #True if the patch has no file of its own
+    return getReader(directory).isSharded(name)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Per-tile shards of extracted patches, instead of one image file per patch per channel.
+
+A patch extractor with shards=True writes two files per tile in its directory:
+    TileName_shard.npy      [n patches, h, w, c] array, the channels of all the extracted channels one after the other
+                            (uint8 when all the channels are uint8, the common type of the channels otherwise)
+    TileName_shard.npz      index: 'coords' [n, 2] (y, x of every patch in the order of the shard) & the channel table
+                            'exts', 'chanStart', 'chanStop', 'chanNdim', 'chanDtype' (channels start:stop of the shard)
+Both are written to temporary files & renamed into place, the tile is then recorded in the journal of the extractor as
+one unit (shardUnit).  fileList.txt keeps the same names as with image files (TileName_y0x0_RGB0.jpg ...), so folds &
+readers work on it as before.  A name is resolved to its row & channels in the shard of its tile, shards are opened
+with np.load(mmap_mode='r') so only the patches that are read are paged in.
+
+Read patches with uabPatchReaders.loadPatch(directory, name): it reads from the shard of the tile if the tile has one &
+falls back to uabUtilAllTypeLoad() otherwise, so readers handle both kinds of directories (& virtual extractions, see
+uabPatchVirtual).
+"""
+
+import os
+import re
+import shutil
+import numpy as np
+import util_functions
+import uabBlockJournal
+
+shardExt = '_shard.npy'
+indexExt = '_shard.npz'
+#journal channel of a tile written as a shard
+shardUnit = 'shard'
+#patch name -> tile, y, x, extension
+namePattern = re.compile(r'^(.*)_y(\d+)x(\d+)_(.+)$')
+
+
+def parsePatchName(name):
+    m = namePattern.match(name)
+    if m is None:
+        raise ValueError('%s is not the name of a patch' % name)
+    return m.group(1), int(m.group(2)), int(m.group(3)), m.group(4)
+
+
+def getShardPaths(directory, tile):
+    return os.path.join(directory, tile + shardExt), os.path.join(directory, tile + indexExt)
+
+
+def getShardDtype(tiles):
+    dtypes = [np.asarray(t).dtype for t in tiles]
+    if all([d == np.uint8 for d in dtypes]):
+        return np.dtype(np.uint8)
+    return np.result_type(*dtypes)
+
+
+def getTmpPaths(directory, tile):
+    return tuple(['%s.%d.tmp%s' % (path[:-4], os.getpid(), path[-4:]) for path in getShardPaths(directory, tile)])
+
+
+def saveIndex(path, coords, exts, chans):
+    #chans -> (start, stop, ndim, dtype) of every channel of the shard
+    np.savez(path, coords=np.asarray(coords, dtype=np.int32).reshape(-1, 2), exts=np.array(exts),
+             chanStart=np.array([c[0] for c in chans]), chanStop=np.array([c[1] for c in chans]),
+             chanNdim=np.array([c[2] for c in chans]), chanDtype=np.array([np.dtype(c[3]).str for c in chans]))
+
+
+def commitShard(directory, tile):
+    #rename the temporary files of a shard into place, the shard last so that a shard always has its index
+    tmpShard, tmpIndex = getTmpPaths(directory, tile)
+    shardPath, indexPath = getShardPaths(directory, tile)
+    os.replace(tmpIndex, indexPath)
+    os.replace(tmpShard, shardPath)
+
+
+def writeShard(directory, tile, tiles, coords, cSize, exts):
+    """
+    Write the patches of a tile as a shard
+    :param tiles: data of every channel of the tile (2d or 3d arrays, e.g., padded tiles), in the order of exts
+    :param coords: [(y, x)] top left corners of the patches
+    :param cSize: (h, w) of the patches
+    :param exts: names of the channels (the extensions in the patch names)
+    :return: crc32 of the shard
+    """
+    h, w = cSize
+    chans = []
+    for t in tiles:
+        start = chans[-1][1] if chans else 0
+        chans.append((start, start + (t.shape[2] if t.ndim == 3 else 1), t.ndim, t.dtype))
+    tmpShard, tmpIndex = getTmpPaths(directory, tile)
+    #the patches are copied straight into the memory map of the file, the shard is never held in memory
+    shard = np.lib.format.open_memmap(tmpShard, mode='w+', dtype=getShardDtype(tiles),
+                                      shape=(len(coords), h, w, chans[-1][1]))
+    checksum = 0
+    for row, (y, x) in enumerate(coords):
+        for t, (c0, c1, _, _) in zip(tiles, chans):
+            shard[row, :, :, c0:c1] = t[y:y + h, x:x + w].reshape(h, w, c1 - c0)
+        checksum = uabBlockJournal.arrayChecksum(shard[row], checksum)
+    shard.flush()
+    util_functions.uabUtilCountIO('written', shard)
+    del shard
+    saveIndex(tmpIndex, coords, exts, chans)
+    commitShard(directory, tile)
+    return checksum
+
+
+def getShardCoords(directory, tile):
+    #[(y, x)] of the patches of a shard, in the order of the shard
+    with np.load(getShardPaths(directory, tile)[1]) as index:
+        return [(int(y), int(x)) for y, x in index['coords']]
+
+
+class uabPatchShard(object):
+    #shard of one tile, memory-mapped
+
+    def __init__(self, shardPath, indexPath):
+        self.data = np.load(shardPath, mmap_mode='r')
+        with np.load(indexPath) as index:
+            self.coords = index['coords']
+            self.chans = {}
+            for ext, c0, c1, nd, dt in zip(index['exts'], index['chanStart'], index['chanStop'], index['chanNdim'],
+                                           index['chanDtype']):
+                self.chans[str(ext)] = (int(c0), int(c1), int(nd), np.dtype(str(dt)))
+        #(y, x) -> row, repeated locations (random grids) hold the same data
+        self.rows = dict(((int(y), int(x)), row) for row, (y, x) in enumerate(self.coords))
+
+    def getPatch(self, y, x, ext):
+        c0, c1, nd, dt = self.chans[ext]
+        patch = self.data[self.rows[(y, x)], :, :, c0:c1]
+        if nd == 2:
+            patch = patch[:, :, 0]
+        return patch.astype(dt, copy=False)
+
+
+def copyPatches(srcDir, dstDir, rows, patches=None):
+    """
+    Copy the patches of some fileList.txt rows to another directory (selection of patches).  Tiles with a shard get a
+    shard with only the rows that are copied, the other patches are copied file by file
+    :param rows: lists of patch names (the rows of fileList.txt to keep)
+    :param patches: optional {name: data} of patches to save instead of copying them
+    """
+    patches = {} if patches is None else patches
+    #tile -> uabPatchShard, None for tiles without a shard
+    shards = {}
+    byTile = {}
+    for row in rows:
+        for name in row:
+            m = namePattern.match(name)
+            if m is not None and m.group(1) not in shards:
+                shardPath, indexPath = getShardPaths(srcDir, m.group(1))
+                shards[m.group(1)] = uabPatchShard(shardPath, indexPath) if os.path.exists(indexPath) else None
+            if m is not None and shards[m.group(1)] is not None:
+                tile, y, x, _ = parsePatchName(name)
+                locs = byTile.setdefault(tile, [])
+                if len(locs) == 0 or locs[-1] != (y, x):
+                    locs.append((y, x))
+            elif name in patches:
+                util_functions.uabUtilAllTypeSave(os.path.join(dstDir, name), patches[name])
+            else:
+                shutil.copyfile(os.path.join(srcDir, name), os.path.join(dstDir, name))
+    for tile, locs in byTile.items():
+        shard = shards[tile]
+        exts = sorted(shard.chans, key=lambda ext: shard.chans[ext][0])
+        data = shard.data[[shard.rows[loc] for loc in locs]]
+        for row, (y, x) in enumerate(locs):
+            for ext in exts:
+                name = tile + '_y%dx%d_%s' % (y, x, ext)
+                if name in patches:
+                    c0, c1 = shard.chans[ext][:2]
+                    data[row, :, :, c0:c1] = np.asarray(patches[name]).reshape(data.shape[1:3] + (c1 - c0,))
+        tmpShard, tmpIndex = getTmpPaths(dstDir, tile)
+        np.save(tmpShard, data)
+        util_functions.uabUtilCountIO('written', data)
+        saveIndex(tmpIndex, locs, exts, [shard.chans[ext] for ext in exts])
+        commitShard(dstDir, tile)
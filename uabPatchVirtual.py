@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Virtual patch extraction: the patches are cut from the tiles when they are read instead of being saved.
+
+uabPatchExtrVirtual (uab_DataHandlerFunctions) makes the grid of its tiles & writes fileList.txt with its sidecar as
+any extractor, plus virtual.json in its directory:
+    {'cSize': [h, w], 'pad': pad, 'channels': {extension in the patch names: {tile: path of the data of the tile}}}
+No patch is written, so changing cSize or numPixOverlap only costs a new grid.  By default the tiles are transcoded to
+the memory-map cache of the collection (uabTileCache.uabTileMemmapCache) & the paths point to those .npy copies: reading
+a patch is then a slice of a memory map.  Otherwise the paths are the tiles themselves, windows of tiffs & chunked tiles
+are read without decoding the whole tile (uabUtilAllTypeWindowLoad()), other formats are decoded once & kept in a LRU
+cache.
+
+Patches are read with uabPatchReaders.loadPatch(directory, name) as the patches of the other extractors: the name is
+resolved to its tile & (y, x) in the padded tile, i.e. the window (y - pad, x - pad, h, w) of the tile, symmetrically
+padded at the borders as in the extraction.  The data is the data of the tile: extSave only names the patches, patches
+are not re-encoded (no jpg compression).
+"""
+
+import os
+import json
+
+mapFile = 'virtual.json'
+#budget of the decoded tiles of formats that can't be read by windows
+cacheBytes = 2 * 1024**3
+
+
+def isVirtual(directory):
+    return os.path.exists(os.path.join(directory, mapFile))
+
+
+def saveMap(directory, cSize, pad, channels):
+    #channels -> {extension: {tile: path}}
+    path = os.path.join(directory, mapFile)
+    tmpPath = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmpPath, 'w') as f:
+        json.dump({'cSize': list(cSize), 'pad': pad, 'channels': channels}, f, sort_keys=True)
+    os.replace(tmpPath, path)
+
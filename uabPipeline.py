@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+Run the blocks of a collection as a dependency graph.
+
+Blocks declare the extension ids they read (uabBlock.getInputs()) and the extensions they add to the collection
+(uabBlock.getOutputs()).  A block depends on the blocks that make its inputs and on the nodes given in after=.  Blocks
+whose dependencies are done run at the same time (maxParallel > 1), each one in a process of its own.  A block can
+spread its tiles over a pool of workers itself (see uabBlock.mapTiles()), blocks that run side by side share the cpus:
+their pools get cpu_count / maxParallel processes each.  Plain functions (e.g., making the folds of the extracted
+patches) can be added as nodes too, they run in this process.
+
+Extension ids: the ids of the outputs of the blocks are those they get when the blocks are run one after the other in
+the order they were added, so they can be used as inputs of the blocks that are added later.  The collection knows
+them (in memory) while the pipeline runs, but an output is registered in the collection store only once its block
+finished, in the order the blocks were added: a block that fails leaves no extension without tiles behind.
+
+Skipping: the fingerprint of a block is a hash of its parameters (uabBlock.getParams(), without the ones that don't
+change the result such as nProc) together with the manifest records (mtime & size) of its input files for every tile.
+It is saved in the collection store when the block finishes.  A finished block with the same fingerprint is skipped.
+If only the inputs of some tiles changed, the outputs of those tiles are removed (uabBlock.removeTileOutputs()) and
+forgotten by the journal of the block, then the block runs again.  The journal is kept otherwise, so a block that was
+interrupted resumes with the tiles it had not done.  Give a uabResultCache to share the tiles across collections: the
+tiles of a block that has to run are then taken from the cache when they were made before.
+
+Example (collection -> preprocess -> extract -> fold split):
+    pipe = uabPipeline.uabPipeline(blCol)
+    pipe.add(uabPreprocClasses.uabPreprocMultChanOp([], 'GT_Divide.tif', 'Map GT to (0, 1)', [3], opDetObj))
+    pipe.add(uabPreprocClasses.uabPreprocMultChanOp([], 'RDIFF.tif', 'R - B', [0, 2], opDiffObj))  # runs alongside
+    extr = pipe.add(uab_DataHandlerFunctions.uabPatchExtr([0, 1, 2, 4], ...))                     # waits for GT_Divide
+    pipe.addFunction('folds', lambda patchDir: uabCrossValMaker.uabUtilGetFolds(patchDir, 'fileList.txt', 'force_tile'),
+                     after=[extr])
+    results = pipe.run()    # {node name: output directory of the block or return value of the function}
+"""
+
+import os
+import multiprocessing
+import multiprocessing.connection
+import uabBlockparent
+import uabTileCache
+
+
+def getContext():
+    #blocks are started by forking so that they get the collection object as it is (nothing is pickled)
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+def runBlock(block, colObj, path, cache):
+    #run a block that is not up to date.  Its journal is kept (not uabBlock.run(forcerun=1)): an interrupted block
+    #resumes & only the tiles prepareBlock() forgot are made again
+    block.runAtomic(colObj, os.path.join(path, 'state.txt'), cache)
+
+
+def runBlockNode(block, colObj, path, cache, maxWorkers):
+    #process target of a block node, its pool of workers gets its share of the cpus
+    uabBlockparent.maxWorkers = maxWorkers
+    #and its share of the budget of the tile cache.  A forked process starts with a copy of the cache of the pipeline,
+    #workerShares is still the one of the start (a pickled collection has an empty cache with its share already)
+    colObj.tileCache = colObj.tileCache.getWorkerCache()
+    runBlock(block, colObj, path, cache)
+
+
+class uabPipeline(object):
+
+    def __init__(self, colObj, maxParallel=None, cache=None):
+        #colObj -> collection the blocks run on
+        #maxParallel -> number of blocks that run at the same time, defaults to 1: every block runs in this process & its
+        #pool of workers uses all the cpus
+        #cache -> optional uabResultCache the blocks that have to run take the tiles made before from
+        self.colObj = colObj
+        self.cache = cache
+        self.maxParallel = 1 if maxParallel is None else maxParallel
+        #nodes in the order they were added: {'name', 'block', 'func', 'after'}
+        self.nodes = []
+
+    def getNode(self, name):
+        for node in self.nodes:
+            if node['name'] == name:
+                return node
+        raise KeyError('No node named %s' % name)
+
+    def addNode(self, name, block, func, after):
+        if name in [node['name'] for node in self.nodes]:
+            raise ValueError('There is already a node named %s' % name)
+        for dep in after:
+            self.getNode(dep)
+        self.nodes.append({'name': name, 'block': block, 'func': func, 'after': list(after)})
+        return name
+
+    def add(self, block, after=(), name=None):
+        """
+        Add a block
+        :param block: uabBlock (preprocessing, patch extraction, ...)
+        :param after: names of nodes to wait for besides the blocks that make the inputs of this one
+        :param name: name of the node, defaults to block.getName()
+        :return: name of the node
+        """
+        return self.addNode(block.getName() if name is None else name, block, None, after)
+
+    def addFunction(self, name, func, after=()):
+        #add a function node, it is called with the results of the nodes in after (in that order)
+        return self.addNode(name, None, func, after)
+
+    def getExtensionTable(self):
+        """
+        Extensions of the collection once all the blocks ran one after the other in the order they were added
+        :return: ([(extension, directory)] by extension id, {extension id: name of the node of the block that makes it})
+        """
+        table = [(ext, dirn) for ext, dirn, _ in self.colObj.store.getExtensions()]
+        producers = {}
+        for node in self.nodes:
+            if node['block'] is None:
+                continue
+            for ext, dirn, _ in node['block'].getOutputs():
+                if (ext, dirn) not in table:
+                    table.append((ext, dirn))
+                producers[table.index((ext, dirn))] = node['name']
+        return table, producers
+
+    def setExtensionTable(self, table):
+        #let the collection (& the blocks forked from it) resolve the ids of outputs that are not registered yet
+        self.colObj.refreshExtensions()
+        for ext, dirn in table[len(self.colObj.extDS):]:
+            self.colObj.extensions[ext] = dirn
+            self.colObj.extDS.append([ext, dirn])
+
+    def registerOutputs(self, done, table):
+        """
+        Register the outputs of the blocks that are done, in the order they were added.  Stops at the first block that is
+        not done so that the ids are the ones of the table
+        :param done: names of the nodes that are done
+        """
+        for node in self.nodes:
+            if node['name'] not in done:
+                break
+            if node['block'] is None or node.get('registered'):
+                continue
+            for ext, dirn, descr in node['block'].getOutputs():
+                self.colObj.store.registerExtension(ext, dirn, descr)
+            node['registered'] = True
+        self.setExtensionTable(table)
+
+    def getDependencies(self, node, producers):
+        deps = list(node['after'])
+        if node['block'] is not None:
+            deps += [producers[eid] for eid in node['block'].getInputs()
+                     if eid in producers and producers[eid] != node['name']]
+        return set(deps)
+
+    def getBlockPath(self, block):
+        return block.getBlockDir(block.getDirectoryPaths(self.colObj))
+
+    def getFingerprint(self, block):
+        """
+        Fingerprint of a block from its parameters & the manifest records of its inputs (nothing is decoded)
+        :return: {'params': hash of the parameters, 'tiles': {tile: ['mtime size' of every input or None]}}
+        """
+        tiles = {}
+        for tile in self.colObj.dataListForRun:
+            keys = []
+            for eid in block.getInputs():
+                rec = self.colObj.getTileRecord(tile, eid)
+                keys.append(None if rec is None else '%d %d' % (rec['mtime'], rec['nbytes']))
+            tiles[tile] = keys
+        return {'params': block.getParamsHash(), 'tiles': tiles}
+
+    def isFinished(self, path, state):
+        if state is not None:
+            return state['state'] == 'Finished'
+        #blocks that ran before the collection had a store only have their state file
+        stateFile = os.path.join(path, 'state.txt')
+        if not os.path.exists(stateFile):
+            return False
+        with open(stateFile, 'r') as f:
+            return f.readline().strip() == 'Finished'
+
+    def prepareBlock(self, node):
+        """
+        Decide whether a block has to run, removing the outputs of the tiles whose inputs changed
+        :return: (path of the block, fingerprint, True if the block has to run)
+        """
+        block = node['block']
+        path = self.getBlockPath(block)
+        fingerprint = self.getFingerprint(block)
+        state = self.colObj.store.getBlockState(path)
+        if not self.isFinished(path, state):
+            return path, fingerprint, True
+
+        old = state['fingerprint'] if state is not None else None
+        if old is None:
+            #finished before fingerprints were recorded, trust the result
+            if state is not None:
+                self.colObj.store.setBlockFingerprint(path, fingerprint)
+            return path, fingerprint, False
+        if old == fingerprint:
+            return path, fingerprint, False
+
+        if old['params'] == fingerprint['params']:
+            changed = [tile for tile, keys in fingerprint['tiles'].items() if old['tiles'].get(tile) != keys]
+        else:
+            changed = list(fingerprint['tiles'].keys())
+        print('%s: inputs or parameters changed for %d tiles' % (node['name'], len(changed)))
+        block.removeTileOutputs(self.colObj, changed)
+        block.getJournal(self.colObj).forget(changed)
+        return path, fingerprint, True
+
+    def finishBlock(self, node, path, fingerprint):
+        #pick up what the block wrote, it ran in another process
+        block = node['block']
+        for dirn in block.getOutputDirs():
+            self.colObj.invalidateTileCache(dirn)
+            self.colObj.manifest.refresh(dirn)
+        self.colObj.store.setBlockFingerprint(path, fingerprint)
+
+    def run(self):
+        """
+        Run all the nodes
+        :return: {node name: output directory of the block or return value of the function}
+        """
+        table, producers = self.getExtensionTable()
+        for node in self.nodes:
+            node['registered'] = False
+        self.colObj.deferExtensions = True
+        try:
+            return self.runNodes(table, producers)
+        finally:
+            self.colObj.deferExtensions = False
+            self.colObj.refreshExtensions()
+
+    def runNodes(self, table, producers):
+        self.setExtensionTable(table)
+        #list the inputs again, files overwritten since the collection was opened are probed again
+        inputDirs = set([self.colObj.getExtensionInfoById(eid)[1] for node in self.nodes if node['block'] is not None
+                         for eid in node['block'].getInputs()])
+        for dirn in inputDirs:
+            self.colObj.manifest.refresh(dirn)
+        deps = dict((node['name'], self.getDependencies(node, producers)) for node in self.nodes)
+        ctx = getContext()
+        #pool size of the blocks that run side by side
+        maxWorkers = max(1, multiprocessing.cpu_count() // self.maxParallel)
+        results = {}
+        pending = list(self.nodes)
+        running = {}
+        failed = []
+        while pending or running:
+            if not failed:
+                for node in [node for node in pending if deps[node['name']].issubset(results)]:
+                    if len(running) >= self.maxParallel:
+                        break
+                    pending.remove(node)
+                    if node['block'] is None:
+                        results[node['name']] = node['func'](*[results[a] for a in node['after']])
+                        continue
+                    path, fingerprint, toRun = self.prepareBlock(node)
+                    if not toRun:
+                        print('%s is up to date' % node['name'])
+                        results[node['name']] = path
+                        self.registerOutputs(results, table)
+                    elif self.maxParallel == 1:
+                        runBlock(node['block'], self.colObj, path, self.cache)
+                        self.finishBlock(node, path, fingerprint)
+                        results[node['name']] = path
+                        self.registerOutputs(results, table)
+                    else:
+                        proc = ctx.Process(target=runBlockNode,
+                                           args=(node['block'], self.colObj, path, self.cache, maxWorkers),
+                                           name=node['name'])
+                        #the blocks that run side by side share the budget of the tile cache of the collection
+                        with uabTileCache.sharedBetween(self.maxParallel):
+                            proc.start()
+                        running[proc.sentinel] = (proc, node, path, fingerprint)
+            if not running:
+                if failed or not pending:
+                    break
+                if not [node for node in pending if deps[node['name']].issubset(results)]:
+                    raise ValueError('Circular dependencies between %s' % ', '.join([node['name'] for node in pending]))
+                continue
+
+            for sentinel in multiprocessing.connection.wait(list(running.keys())):
+                proc, node, path, fingerprint = running.pop(sentinel)
+                proc.join()
+                if proc.exitcode != 0:
+                    failed.append(node['name'])
+                    continue
+                self.finishBlock(node, path, fingerprint)
+                results[node['name']] = path
+                self.registerOutputs(results, table)
+
+        if failed:
+            raise RuntimeError('Block(s) %s failed, see the errors above' % ', '.join(failed))
+        return results
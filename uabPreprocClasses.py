@@ -14,22 +14,188 @@ User must implement:
     
 Implementation notes:
 (1) A double for-loop over channels and tiles is pushed to the child class because it is conceivable that processing would occur over several tiles or channels and therefore, we cannot build this convenience into the parent class.
+(2) Streaming: blocks that make one tile-map (uabPreprocSplit, uabPreprocMultChanOp) can be given to the patch extractors in place of an extension id.  The tile is then computed in memory (computeTile()) while the patches are extracted, so it is never written & decoded again.  Blocks can take other blocks as channels too, which chains them.  Set materialize = True on a block to save its tiles (& register it in the collection) along the way.
+    rescObj = uabPreprocClasses.uabPreprocMultChanOp([], 'GT_Divide.tif', 'Map GT to (0, 1)', [3], opDetObj)
+    extrObj = uab_DataHandlerFunctions.uabPatchExtr([0, 1, 2, rescObj], ...)
+(3) Tiles larger than memory: uabPreprocBlockwiseOp runs an operator window by window with a halo of pixels around every window (e.g., uabOperTileFilter) and writes the output (.npy or .chk) as it goes, so memory does not grow with the size of the tiles.
+(4) Resampling to another ground sampling distance: uabPreprocResample (see uabResample).
+(5) Contrast stretching between percentiles: uabPreprocPercentileStretch, the percentiles come from the histograms of the collection statistics (see uabTileStats).
 """
 
 import os
+import shutil
+import multiprocessing
 import numpy as np
 import uabBlockparent
+import uabBlockJournal
+import uabBlockProfile
 from uabBlockparent import uabBlock
 import util_functions
+import uabChunkStore
+import uabTileManifest
+import uabResample
+import uabTileStats
+
+def getChannelExtension(colObj, chan):
+    #extension of a channel given to a block: an extension id or a streamed block
+    if isinstance(chan, uabPreprocClass):
+        return chan.ext
+    ext, _ = colObj.getExtensionInfoById(chan)
+    return ext
+
+def getChannelName(chan):
+    #channel in the name of a block
+    return chan.getName() if isinstance(chan, uabPreprocClass) else str(chan)
+
+def getChannelInputs(chans):
+    #extension ids read for a list of channels, streamed blocks are replaced by their own inputs
+    inputs = []
+    for chan in chans:
+        inputs += chan.getInputs() if isinstance(chan, uabPreprocClass) else [chan]
+    return inputs
+
+def getChannelSize(colObj, tile, chan):
+    #(rows, columns) of a tile for a channel, from the manifest or, for a streamed block, from the block
+    if isinstance(chan, uabPreprocClass):
+        return chan.getTileSize(colObj, tile)
+    return tuple(colObj.getTileShape(tile, chan)[:2])
+
+def hasChannelTile(colObj, tile, chan):
+    #whether the data of a tile exists or, for a streamed block, can be computed
+    if isinstance(chan, uabPreprocClass):
+        return chan.hasTile(colObj, tile)
+    return colObj.hasTileData(tile, chan)
+
+def loadChannelTile(colObj, tile, chan, pad=0, cached=False):
+    #data of a tile for a channel (an extension id or a streamed block) with symmetric padding of pad pixels
+    #cached -> the tile may be the read-only array of the tile cache of the collection (callers that don't modify it)
+    if not isinstance(chan, uabPreprocClass):
+        return colObj.loadTilePadded(tile, chan, pad, cached)
+    tileData = chan.computeTile(colObj, tile)
+    if(pad == 0):
+        return tileData
+    return util_functions.uabUtilWindowFromArray(tileData, -pad, -pad, tileData.shape[0] + 2 * pad, tileData.shape[1] + 2 * pad)
+
+# parent class for tile operations.  Has a name and an action
+# Operators used by uabPreprocMultChanOp run through runChunked(): operators that are rowwise (every output row only
+# depends on the same rows of the inputs, e.g., arithmetic) are evaluated over chunks of rows into a preallocated
+# output, so the temporaries of run() are the size of a chunk rather than of a tile.  Chain operators with then(): the
+# chain runs all of them on a chunk before going to the next chunk.
+class uabOperTileOps(object):
+    
+    #bytes of the inputs of a chunk of rows, the temporaries of run() are a few times larger
+    chunkBytes = 16 * 1024**2
+    
+    def __init__(self, defName):
+        self.defaultName = defName
+        #set rowwise = True in operators that can run on chunks of rows
+        self.rowwise = False
+        #dtype of the output, None keeps the dtype made by run()
+        self.outDtype = None
+        #pixels around an output pixel that it depends on (spatial support of filters), used by uabPreprocBlockwiseOp
+        self.halo = 0
+        
+    def getName(self):
+        raise NotImplementedError('Must be implemented by the subclass')
+    
+    def run(self, tiles):
+        raise NotImplementedError('Must be implemented by the subclass')
+    
+    def then(self, op):
+        #operator that runs this one and then op on its output
+        return uabOperTileChain([self, op])
+    
+    def getChunkRows(self, tiles):
+        rowBytes = sum([t.nbytes // max(t.shape[0], 1) for t in tiles])
+        return max(1, self.chunkBytes // max(rowBytes, 1))
+    
+    def runChunked(self, tiles, chunkRows=None):
+        """
+        Run the operator on full tiles with bounded memory
+        :param tiles: list of arrays (or memory maps) with the same number of rows
+        :param chunkRows: rows per chunk, defaults to chunkBytes worth of input rows
+        :return: output tile
+        """
+        if not self.rowwise:
+            out = self.run(tiles)
+            return out if self.outDtype is None else out.astype(self.outDtype, copy=False)
+        nRows = tiles[0].shape[0]
+        if chunkRows is None:
+            chunkRows = self.getChunkRows(tiles)
+        out = None
+        for r0 in range(0, nRows, chunkRows):
+            res = self.run([t[r0:r0 + chunkRows] for t in tiles])
+            if out is None:
+                out = np.empty((nRows,) + res.shape[1:], dtype=res.dtype if self.outDtype is None else self.outDtype)
+            out[r0:r0 + res.shape[0]] = res
+        return out
+
+class uabOperTileChain(uabOperTileOps):
+    #operators run one after the other, the output of one is the only input of the next
+    def __init__(self, ops, defName='Chain'):
+        super(uabOperTileChain, self).__init__(defName)
+        self.ops = []
+        for op in ops:
+            self.ops += op.ops if isinstance(op, uabOperTileChain) else [op]
+        self.rowwise = all([op.rowwise for op in self.ops])
+        self.outDtype = self.ops[-1].outDtype
+        self.halo = sum([op.halo for op in self.ops])
+    
+    def getName(self):
+        return '-'.join([op.getName() for op in self.ops])
+    
+    def then(self, op):
+        return uabOperTileChain(self.ops + [op])
+    
+    def run(self, tiles):
+        for op in self.ops:
+            out = op.run(tiles)
+            if op.outDtype is not None:
+                out = out.astype(op.outDtype, copy=False)
+            tiles = [out]
+        return out
+
+class uabOperTileFilter(uabOperTileOps):
+    #filter of scipy.ndimage over the rows & columns of one tile: 'uniform', 'median', 'gaussian' (size is sigma),
+    #'maximum' & 'minimum' (grey dilation & erosion).  Borders are reflected like the symmetric padding of tile windows
+    filterSupport = {'uniform': lambda size: size // 2, 'median': lambda size: size // 2,
+                     'maximum': lambda size: size // 2, 'minimum': lambda size: size // 2,
+                     'gaussian': lambda size: int(4.0 * size + 0.5)}
+    
+    def __init__(self, filterName, size, defName='Filt'):
+        super(uabOperTileFilter, self).__init__(defName)
+        if filterName not in self.filterSupport:
+            raise ValueError('Unknown filter %s' % filterName)
+        self.filterName = filterName
+        self.size = size
+        self.halo = self.filterSupport[filterName](size)
+    
+    def getName(self):
+        return '%s_%s%s' % (self.defaultName, self.filterName, util_functions.d2s(self.size, 1))
+    
+    def run(self, tiles):
+        from scipy import ndimage
+        tile = tiles[0]
+        #channels are filtered separately
+        if self.filterName == 'gaussian':
+            sigma = (self.size, self.size) + (0,) * (tile.ndim - 2)
+            return ndimage.gaussian_filter(tile, sigma, mode='reflect')
+        size = (self.size, self.size) + (1,) * (tile.ndim - 2)
+        return getattr(ndimage, '%s_filter' % self.filterName)(tile, size=size, mode='reflect')
 
 class uabPreprocClass(uabBlock):
     
+    #saving the tiles of a streamed block doesn't change them
+    nonResultParams = uabBlock.nonResultParams + ['materialize']
+    
     def __init__(self, runChannels, name, extension, description):
         super(uabPreprocClass, self).__init__(runChannels, name)
-        #extension to save this file with (e.g., _Resc.npy)
+        #extension to save this file with (e.g., _Resc.npy).  Use a '.chk' extension to save chunked & compressed tiles (see uabChunkStore)
         self.ext = extension
         #Human readable description of this process (e.g., Rescaling of the intensities in the tile by multiplying and adding a bias)
         self.descr = description
+        #when streamed into another block, also save the tiles that are computed (see computeTile())
+        self.materialize = False
     
     def blockMetaDescription(self):
         return "{}\t{}\t{}\n".format(self.ext, os.path.join(uabBlockparent.outputDirs['preproc'], self.algoName()), self.descr)
@@ -37,15 +203,67 @@ class uabPreprocClass(uabBlock):
     def getDirectoryPaths(self, colObj):
         return os.path.join(colObj.imDirectory, colObj.dataDirnames['data'], uabBlockparent.outputDirs['preproc'], self.algoName())
     
+    def getOutputDirs(self):
+        #directories (relative to the data directory of the collection) this block writes to
+        return [os.path.join(uabBlockparent.outputDirs['preproc'], self.algoName())]
+    
+    def getOutputs(self):
+        #the lines this block adds to the meta-data, [extension, directory, description]
+        return [line.split('\t') for line in self.blockMetaDescription().split('\n') if line]
+    
+    def getTileOutputPaths(self, colObj, tile):
+        return dict((ext, colObj.getDataNameByTile(dirn, tile, ext)) for ext, dirn, _ in self.getOutputs())
+    
+    def removeTileOutputs(self, colObj, tiles):
+        for tile in tiles:
+            for path in self.getTileOutputPaths(colObj, tile).values():
+                #outputs can be links to the result cache (see uabResultCache), remove the link only
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path)
+                elif os.path.lexists(path):
+                    os.remove(path)
+    
     def runAction(self, colObj):
         #handles running the preprocessing operation on the tile & updating the collection meta-data with this tile information
         self.runTilePreproc(colObj)
+        for dirn in self.getOutputDirs():
+            colObj.invalidateTileCache(dirn)
+            #tiles rewritten in place get new records (shape, mtime) before anything reads them
+            colObj.manifest.refresh(dirn)
         
         updStr = self.blockMetaDescription()
         colObj.setMetadataFile(updStr)
         
     def runTilePreproc(self, colObj):
         raise NotImplementedError('Must be implemented by the subclass')
+    
+    def getTileSize(self, colObj, tile):
+        #(rows, columns) of the output of this block for a tile, the size of its first input unless the block resizes
+        return getChannelSize(colObj, tile, self.getInputs()[0])
+    
+    def makeTile(self, colObj, tile):
+        #output of this block for one tile (in memory), implement it to let the block be streamed
+        raise NotImplementedError('%s cannot be streamed' % type(self).__name__)
+    
+    def hasTile(self, colObj, tile):
+        #whether this block can make a tile when it is streamed: all of its inputs exist
+        return all([hasChannelTile(colObj, tile, a) for a in self.getInputs()])
+    
+    def computeTile(self, colObj, tile):
+        #output of this block for one tile when it is streamed into another block.  Loaded if the block saved it before,
+        #computed otherwise & saved if self.materialize is set
+        path = os.path.join(self.getDirectoryPaths(colObj), tile + '_' + self.ext)
+        if util_functions.read_or_new_pickle(path) == 1:
+            return util_functions.uabUtilAllTypeLoad(path)
+        tileData = self.makeTile(colObj, tile)
+        if(self.materialize):
+            util_functions.uabUtilMakeDirectoryName(os.path.dirname(path))
+            util_functions.read_or_new_pickle(path, toSave=1, variable_to_save=tileData)
+            self.getJournal(colObj).record(tile, self.ext, uabBlockJournal.arrayChecksum(tileData))
+            ext, dirn, _ = self.getOutputs()[0]
+            if colObj.getExtensionIdByName(ext, dirn) is None:
+                colObj.setMetadataFile(self.blockMetaDescription())
+        return tileData
 
 #class to save one channel from a multi-channel tile
 class uabPreprocSplit(uabPreprocClass):
@@ -69,47 +287,436 @@ class uabPreprocSplit(uabPreprocClass):
             extSpl = ext.split('.')
             extUse = extSpl[0] + str(self.channelToSave) + '.' + extSpl[1]
             """
+            journal = self.getJournal(colObj)
             for tile in colObj.dataListForRun:
+                if journal.isDone(tile, self.ext):
+                    continue
                 
                 path = os.path.join(self.getDirectoryPaths(colObj), tile + '_' + self.ext)
                 code = util_functions.read_or_new_pickle(path)
                 
                 if(code == 0):
-                    im = colObj.loadTileDataByExtension(tile, tileChanId)
+                    im = colObj.loadTileDataByExtension(tile, tileChanId, cached=True)
                     assert(len(im.shape) == 3)
                     imSplit = np.squeeze(im[:,:,self.channelToSave])
                     util_functions.read_or_new_pickle(path,toSave=1, variable_to_save = imSplit)
+                else:
+                    imSplit = util_functions.uabUtilAllTypeLoad(path)
+                journal.record(tile, self.ext, uabBlockJournal.arrayChecksum(imSplit))
+    
+    def makeTile(self, colObj, tile):
+        chans = self.runChannels if type(self.runChannels) is list else [self.runChannels]
+        im = loadChannelTile(colObj, tile, chans[0], cached=True)
+        assert(len(im.shape) == 3)
+        return np.squeeze(im[:,:,self.channelToSave])
+
+def splitTileWorker(args):
+    #pool worker of uabPreprocSplitAll: decode a multi-channel tile once & save the channels that don't exist yet
+    #(tile, path of the tile, [(channel, extension, output path)]) -> (tile, [(extension, checksum)])
+    tile, srcPath, outPaths = args
+    im = util_functions.uabUtilAllTypeLoad(srcPath)
+    assert(len(im.shape) == 3)
+    checksums = []
+    for c, ext, path in outPaths:
+        imSplit = np.ascontiguousarray(im[:,:,c])
+        if util_functions.read_or_new_pickle(path) == 0:
+            util_functions.read_or_new_pickle(path, toSave=1, variable_to_save=imSplit)
+        checksums.append((ext, uabBlockJournal.arrayChecksum(imSplit)))
+    return tile, checksums
+
+#class to save all the channels of a multi-channel tile.  Same output as one uabPreprocSplit per channel, but every tile is decoded once and the tiles are processed in a pool of workers
+class uabPreprocSplitAll(uabPreprocClass):
+    def __init__(self, runChannels, extensions, descriptions, nProc=None, name = 'TileChanSplit'):
+        #runChannels is the index of the multi-channel tile-map.  extensions & descriptions have one entry per channel of that tile-map
+        super(uabPreprocSplitAll, self).__init__(runChannels, name, extensions, descriptions)
+        self.nProc = multiprocessing.cpu_count() if nProc is None else nProc
+    
+    def algoName(self):
+        return '%s_chanAll%d' % (self.name, len(self.ext))
+    
+    def channelDirName(self, c):
+        #same directories as uabPreprocSplit
+        return '%s_chan%d' % (self.name, c)
+    
+    def getOutputDirs(self):
+        return [os.path.join(uabBlockparent.outputDirs['preproc'], self.channelDirName(c)) for c in range(len(self.ext))]
+    
+    def blockMetaDescription(self):
+        return ''.join(["{}\t{}\t{}\n".format(ext, dirn, descr) for ext, dirn, descr in zip(self.ext, self.getOutputDirs(), self.descr)])
+    
+    def runTilePreproc(self, colObj):
+        outDirs = [os.path.join(colObj.imDirectory, colObj.dataDirnames['data'], dirn) for dirn in self.getOutputDirs()]
+        for dirn in outDirs:
+            util_functions.uabUtilMakeDirectoryName(dirn)
+        
+        #channels of a tile that are in the journal are done, the others are checked & made by the workers
+        journal = self.getJournal(colObj)
+        jobs = []
+        for tile in colObj.dataListForRun:
+            outPaths = [(c, ext, os.path.join(outDirs[c], tile + '_' + ext)) for c, ext in enumerate(self.ext)
+                        if not journal.isDone(tile, ext)]
+            if(len(outPaths) > 0):
+                jobs.append((tile, colObj.getTilePath(tile, self.runChannels), outPaths))
+        
+        for tile, checksums in self.mapTiles(splitTileWorker, jobs, self.nProc):
+            for ext, checksum in checksums:
+                journal.record(tile, ext, checksum)
+
+def multChanOpWorker(args):
+    #pool worker of uabPreprocMultChanOp: (tile, paths of the channels, output path, operator) -> (tile, checksum of the
+    #output or None if none of the channels exist)
+    tile, paths, outPath, opDet = args
+    if util_functions.read_or_new_pickle(outPath) == 1:
+        return tile, uabBlockJournal.arrayChecksum(util_functions.uabUtilAllTypeLoad(outPath))
+    
+    tileData = []
+    for path in paths:
+        try:
+            tileData.append(util_functions.uabUtilAllTypeLoad(path))
+        except IOError:
+            continue
+    
+    if len(tileData) == 0:
+        return tile, None
+    
+    opTile = opDet.runChunked(tileData)
+    util_functions.read_or_new_pickle(outPath, toSave=1, variable_to_save=opTile)
+    return tile, uabBlockJournal.arrayChecksum(opTile)
 
 #class to perform an operation on two tiles (e.g., difference of two)                    
 class uabPreprocMultChanOp(uabPreprocClass):
-    def __init__(self, runChannels, extension, description, chans, opDetails, name = 'MultChanOp'):
+    
+    #the channels of the operator are extension ids too
+    inputParams = uabPreprocClass.inputParams + ['opChans']
+    
+    def __init__(self, runChannels, extension, description, chans, opDetails, name = 'MultChanOp', nProc=None):
         # runChannels is an index into the list of tile-maps that exist for this collection.
         # chans are the indexes of channels to process.
-        # opDetails is a class of type operator (see uabPreProcClasses.py)
+        # opDetails is a class of type operator (see uabOperTileOps)
+        # nProc is the number of processes the tiles are spread over (defaults to the number of cpus)
         super(uabPreprocMultChanOp, self).__init__(runChannels, name, extension, description)
         self.opChans = chans
         self.opDet = opDetails
+        self.nProc = multiprocessing.cpu_count() if nProc is None else nProc
     
     def algoName(self):
-        return '%s_chans%s_%s' % (self.name, '-'.join([str(a) for a in self.opChans]), self.opDet.getName())
+        return '%s_chans%s_%s' % (self.name, '-'.join([getChannelName(a) for a in self.opChans]), self.opDet.getName())
+    
+    def getInputs(self):
+        return getChannelInputs(self.opChans)
+    
+    def hasTile(self, colObj, tile):
+        #the operator runs on the channels that exist, like multChanOpWorker()
+        return any([hasChannelTile(colObj, tile, chan) for chan in self.opChans])
+    
+    def makeTile(self, colObj, tile):
+        tileData = []
+        for chan in self.opChans:
+            try:
+                tileData.append(loadChannelTile(colObj, tile, chan))
+            except IOError:
+                continue
+        if len(tileData) == 0:
+            raise IOError('No data for tile %s' % tile)
+        return self.opDet.runChunked(tileData)
         
     def runTilePreproc(self, colObj):
         #for each tile, apply the operation (e.g., rescaling).  Check whether this exists otherwise, call the tile operator
+        #tiles in the journal are done, the workers check whether the others exist
+        journal = self.getJournal(colObj)
+        if any([isinstance(chan, uabPreprocClass) for chan in self.opChans]):
+            #streamed blocks as channels need the collection, these tiles are made in this process
+            for tile in colObj.dataListForRun:
+                path = os.path.join(self.getDirectoryPaths(colObj), tile + '_' + self.ext)
+                if journal.isDone(tile, self.ext) or not self.hasTile(colObj, tile):
+                    continue
+                with uabBlockProfile.timeTile(tile):
+                    if util_functions.read_or_new_pickle(path) == 1:
+                        opTile = util_functions.uabUtilAllTypeLoad(path)
+                    else:
+                        opTile = self.makeTile(colObj, tile)
+                        util_functions.read_or_new_pickle(path, toSave=1, variable_to_save=opTile)
+                journal.record(tile, self.ext, uabBlockJournal.arrayChecksum(opTile))
+            return
+        
+        jobs = []
         for tile in colObj.dataListForRun:
-            path = os.path.join(self.getDirectoryPaths(colObj), tile + '_' + self.ext)
-            code = util_functions.read_or_new_pickle(path)
-            
-            if(code == 0):
-                # get a list of all the tiles to operate on based on the specified channels to run on
-                tileData = []
-                for tileChanId in self.opChans:
-                    try:
-                        tileData.append(colObj.loadTileDataByExtension(tile, tileChanId))
-                    except IOError:
-                        continue
-
-                if len(tileData) == 0:
+            if not journal.isDone(tile, self.ext):
+                path = os.path.join(self.getDirectoryPaths(colObj), tile + '_' + self.ext)
+                # the tiles to operate on based on the specified channels to run on
+                jobs.append((tile, [colObj.getTilePath(tile, tileChanId) for tileChanId in self.opChans], path, self.opDet))
+        
+        for tile, checksum in self.mapTiles(multChanOpWorker, jobs, self.nProc):
+            if checksum is not None:
+                journal.record(tile, self.ext, checksum)
+
+
+def blockwiseWorker(args):
+    #pool worker of uabPreprocBlockwiseOp: (tile, paths of the channels, output path, operator, window size, halo) ->
+    #(tile, checksum of the output or None if a channel is missing)
+    tile, paths, outPath, opDet, window, halo = args
+    if util_functions.read_or_new_pickle(outPath) == 1:
+        return tile, outputChecksum(openBlockwiseOutput(outPath), window[0])
+    if not all([util_functions.read_or_new_pickle(path) == 1 for path in paths]):
+        return tile, None
+    
+    #formats that can't be read by window are decoded once
+    sources = [None if util_functions.uabUtilIsWindowable(path) else util_functions.uabUtilAllTypeLoad(path)
+               for path in paths]
+    shape = uabTileManifest.probeTile(paths[0])[0] if sources[0] is None else sources[0].shape
+    tmpPath = '%s.%d.tmp' % (outPath, os.getpid())
+    out = None
+    for y in range(0, shape[0], window[0]):
+        for x in range(0, shape[1], window[1]):
+            h, w = min(window[0], shape[0] - y), min(window[1], shape[1] - x)
+            inputs = []
+            for path, src in zip(paths, sources):
+                if src is None:
+                    inputs.append(util_functions.uabUtilAllTypeWindowLoad(path, y - halo, x - halo, h + 2 * halo, w + 2 * halo))
+                else:
+                    inputs.append(util_functions.uabUtilWindowFromArray(src, y - halo, x - halo, h + 2 * halo, w + 2 * halo))
+            res = opDet.run(inputs)[halo:halo + h, halo:halo + w]
+            if opDet.outDtype is not None:
+                res = res.astype(opDet.outDtype, copy=False)
+            if out is None:
+                out = createBlockwiseOutput(tmpPath, outPath, (shape[0], shape[1]) + res.shape[2:], res.dtype, window)
+            out[y:y + h, x:x + w] = res
+            util_functions.uabUtilCountIO('written', res)
+    checksum = outputChecksum(out, window[0])
+    if isinstance(out, np.memmap):
+        out.flush()
+    del out
+    os.replace(tmpPath, outPath)
+    return tile, checksum
+
+def createBlockwiseOutput(tmpPath, outPath, shape, dtype, window):
+    #output written window by window: a memory-mapped npy or a chunked tile with chunks of the size of the windows
+    if outPath.endswith('.' + uabChunkStore.chunkExt):
+        return uabChunkStore.uabChunkedArray.create(tmpPath, shape, dtype, chunks=window)
+    return np.lib.format.open_memmap(tmpPath, mode='w+', dtype=dtype, shape=shape)
+
+def openBlockwiseOutput(path):
+    if path.endswith('.' + uabChunkStore.chunkExt):
+        return uabChunkStore.uabChunkedArray(path)
+    return np.load(path, mmap_mode='r')
+
+def outputChecksum(arr, rows):
+    #crc32 of a tile read by bands of rows, same as uabBlockJournal.arrayChecksum() of the whole tile
+    checksum = 0
+    for y in range(0, arr.shape[0], rows):
+        checksum = uabBlockJournal.arrayChecksum(arr[y:y + rows, 0:arr.shape[1]], checksum)
+    return checksum
+
+#class to run an operator on tiles window by window (with a halo around every window for operators with spatial support), for tiles that don't fit in memory
+class uabPreprocBlockwiseOp(uabPreprocMultChanOp):
+    
+    #the windows don't change the result as long as the halo covers the support of the operator
+    nonResultParams = uabPreprocMultChanOp.nonResultParams + ['window']
+    
+    def __init__(self, runChannels, extension, description, chans, opDetails, window=(1024, 1024), halo=None, nProc=None, name = 'BlockwiseOp'):
+        # extension must be .npy or .chk, the output is written window by window
+        # window is the size of the windows the tiles are processed by.  Inputs should be npy, chk or tif (with tifffile) so that only the windows are read, other formats are decoded in full once per tile
+        # halo is the number of pixels read around every window, defaults to the support of the operator (opDetails.halo)
+        super(uabPreprocBlockwiseOp, self).__init__(runChannels, extension, description, chans, opDetails, name, nProc)
+        if extension.split('.')[-1] not in ['npy', uabChunkStore.chunkExt]:
+            raise ValueError('Blockwise outputs must be .npy or .%s' % uabChunkStore.chunkExt)
+        self.window = tuple(window)
+        self.halo = opDetails.halo if halo is None else halo
+    
+    def hasTile(self, colObj, tile):
+        #the windows of all the channels are needed, like blockwiseWorker()
+        return all([hasChannelTile(colObj, tile, chan) for chan in self.opChans])
+    
+    def runTilePreproc(self, colObj):
+        if any([isinstance(chan, uabPreprocClass) for chan in self.opChans]):
+            #streamed blocks are computed in memory, there is nothing to read by window
+            return super(uabPreprocBlockwiseOp, self).runTilePreproc(colObj)
+        journal = self.getJournal(colObj)
+        jobs = []
+        for tile in colObj.dataListForRun:
+            if not journal.isDone(tile, self.ext):
+                path = os.path.join(self.getDirectoryPaths(colObj), tile + '_' + self.ext)
+                jobs.append((tile, [colObj.getTilePath(tile, tileChanId) for tileChanId in self.opChans], path,
+                             self.opDet, self.window, self.halo))
+        
+        for tile, checksum in self.mapTiles(blockwiseWorker, jobs, self.nProc):
+            if checksum is not None:
+                journal.record(tile, self.ext, checksum)
+
+def resampleWorker(args):
+    #pool worker of uabPreprocResample: (tile, path of the tile, output path, factor, mode) -> (tile, checksum of the
+    #output or None if the tile doesn't exist)
+    tile, srcPath, outPath, factor, mode = args
+    if util_functions.read_or_new_pickle(outPath) == 1:
+        return tile, uabBlockJournal.arrayChecksum(util_functions.uabUtilAllTypeLoad(outPath))
+    if util_functions.read_or_new_pickle(srcPath) == 0:
+        return tile, None
+    if util_functions.uabUtilIsWindowable(srcPath):
+        #only the rows of a band are read at a time
+        shape, dtype = uabTileManifest.probeTile(srcPath)
+        readRows = lambda y0, y1: util_functions.uabUtilAllTypeWindowLoad(srcPath, y0, 0, y1 - y0, shape[1])
+    else:
+        data = util_functions.uabUtilAllTypeLoad(srcPath)
+        shape, dtype = data.shape, data.dtype
+        readRows = lambda y0, y1: data[y0:y1]
+    out = uabResample.resampleTile(readRows, shape, np.dtype(dtype), factor, mode)
+    util_functions.read_or_new_pickle(outPath, toSave=1, variable_to_save=out)
+    return tile, uabBlockJournal.arrayChecksum(out)
+
+#class to resample the tiles of a tile-map to another ground sampling distance (e.g., to train at half resolution)
+class uabPreprocResample(uabPreprocClass):
+    def __init__(self, runChannels, extension, description, factor, isLabel=False, mode=None, nProc=None, name = 'Resample'):
+        # runChannels is the index of the tile-map to resample
+        # factor is the target ground sampling distance over the one of the tiles, e.g., 2 turns 0.3m tiles into 0.6m tiles (half the rows & columns)
+        # isLabel -> labels (GT) are resampled by majority (integer factors) or nearest label, images by area average (integer factors) or linear filter.  mode overrides this choice (see uabResample)
+        super(uabPreprocResample, self).__init__(runChannels, name, extension, description)
+        self.factor = factor
+        if mode is None:
+            if isLabel:
+                mode = 'majority' if uabResample.isIntegerFactor(factor) else 'nearest'
+            else:
+                mode = 'area' if uabResample.isIntegerFactor(factor) else 'linear'
+        self.mode = mode
+        self.nProc = multiprocessing.cpu_count() if nProc is None else nProc
+    
+    def algoName(self):
+        return '%s_chan%s_f%s_%s' % (self.name, getChannelName(self.getChannel()), util_functions.d2s(self.factor, 3), self.mode)
+    
+    def getChannel(self):
+        return self.runChannels[0] if type(self.runChannels) is list else self.runChannels
+    
+    def getInputs(self):
+        return getChannelInputs([self.getChannel()])
+    
+    def getTileSize(self, colObj, tile):
+        h, w = getChannelSize(colObj, tile, self.getChannel())
+        return uabResample.getOutputSize(h, self.factor), uabResample.getOutputSize(w, self.factor)
+    
+    def makeTile(self, colObj, tile):
+        data = loadChannelTile(colObj, tile, self.getChannel())
+        return uabResample.resampleTile(lambda y0, y1: data[y0:y1], data.shape, data.dtype, self.factor, self.mode)
+    
+    def runTilePreproc(self, colObj):
+        journal = self.getJournal(colObj)
+        if isinstance(self.getChannel(), uabPreprocClass):
+            #a streamed block as the channel is computed in this process
+            for tile in colObj.dataListForRun:
+                path = os.path.join(self.getDirectoryPaths(colObj), tile + '_' + self.ext)
+                if journal.isDone(tile, self.ext) or not self.hasTile(colObj, tile):
                     continue
+                with uabBlockProfile.timeTile(tile):
+                    if util_functions.read_or_new_pickle(path) == 1:
+                        out = util_functions.uabUtilAllTypeLoad(path)
+                    else:
+                        out = self.makeTile(colObj, tile)
+                        util_functions.read_or_new_pickle(path, toSave=1, variable_to_save=out)
+                journal.record(tile, self.ext, uabBlockJournal.arrayChecksum(out))
+            return
+        
+        jobs = []
+        for tile in colObj.dataListForRun:
+            if not journal.isDone(tile, self.ext):
+                path = os.path.join(self.getDirectoryPaths(colObj), tile + '_' + self.ext)
+                jobs.append((tile, colObj.getTilePath(tile, self.getChannel()), path, self.factor, self.mode))
+        
+        for tile, checksum in self.mapTiles(resampleWorker, jobs, self.nProc):
+            if checksum is not None:
+                journal.record(tile, self.ext, checksum)
+
+def stretchValues(data, lo, hi, outRange, outDtype):
+    #affine map of [lo, hi] to outRange, clipped
+    scale = (outRange[1] - outRange[0]) / float(hi - lo) if hi > lo else 0.0
+    out = (data.astype(np.float32 if data.dtype.itemsize < 8 else np.float64) - lo) * scale + outRange[0]
+    return uabResample.castOutput(np.clip(out, min(outRange), max(outRange)), outDtype)
 
-                opTile = self.opDet.run(tileData)
-                util_functions.read_or_new_pickle(path, toSave=1, variable_to_save=opTile)
+def stretchWorker(args):
+    #pool worker of uabPreprocPercentileStretch: (tile, path of the tile, output path, low value, high value, output
+    #range, output dtype) -> (tile, checksum of the output or None if the tile doesn't exist)
+    tile, srcPath, outPath, lo, hi, outRange, outDtype = args
+    if util_functions.read_or_new_pickle(outPath) == 1:
+        return tile, uabBlockJournal.arrayChecksum(util_functions.uabUtilAllTypeLoad(outPath))
+    if util_functions.read_or_new_pickle(srcPath) == 0:
+        return tile, None
+    if util_functions.uabUtilIsWindowable(srcPath):
+        shape, dtype = uabTileManifest.probeTile(srcPath)
+        readRows = lambda y0, y1: util_functions.uabUtilAllTypeWindowLoad(srcPath, y0, 0, y1 - y0, shape[1])
+    else:
+        data = util_functions.uabUtilAllTypeLoad(srcPath)
+        shape, dtype = data.shape, data.dtype
+        readRows = lambda y0, y1: data[y0:y1]
+    #uint8 tiles go through a look-up table, others are mapped band by band
+    lut = stretchValues(np.arange(256, dtype=np.uint8), lo, hi, outRange, outDtype) if np.dtype(dtype) == np.uint8 else None
+    out = np.empty(shape, dtype=outDtype)
+    for y in range(0, shape[0], uabTileStats.chunkRows):
+        rows = readRows(y, min(shape[0], y + uabTileStats.chunkRows))
+        out[y:y + rows.shape[0]] = lut[rows] if lut is not None else stretchValues(rows, lo, hi, outRange, outDtype)
+    util_functions.read_or_new_pickle(outPath, toSave=1, variable_to_save=out)
+    return tile, uabBlockJournal.arrayChecksum(out)
+
+#class to stretch the contrast of a tile-map: values between two percentiles are mapped linearly to an output range, values outside are clipped
+class uabPreprocPercentileStretch(uabPreprocClass):
+    def __init__(self, runChannels, extension, description, percentiles=(2, 98), outRange=(0, 255), outDtype=np.uint8, perTile=False, nProc=None, name = 'PctStretch'):
+        # runChannels is the index of a single-channel tile-map (split multi-channel tiles first)
+        # percentiles are taken from the histogram of the whole collection (collection statistics of meta.npy, computed for the tiles that are not cached yet, see uabTileStats) or of every tile if perTile is set
+        super(uabPreprocPercentileStretch, self).__init__(runChannels, name, extension, description)
+        self.percentiles = tuple(percentiles)
+        self.outRange = tuple(outRange)
+        self.outDtype = np.dtype(outDtype)
+        self.perTile = perTile
+        self.nProc = multiprocessing.cpu_count() if nProc is None else nProc
+    
+    def algoName(self):
+        return '%s_chan%s_p%s-%s_r%s-%s_%s%s' % (self.name, self.getChannel(), util_functions.d2s(self.percentiles[0], 1),
+                                                util_functions.d2s(self.percentiles[1], 1),
+                                                util_functions.d2s(self.outRange[0], 1),
+                                                util_functions.d2s(self.outRange[1], 1), self.outDtype.name,
+                                                '_tile' if self.perTile else '')
+    
+    def getChannel(self):
+        return self.runChannels[0] if type(self.runChannels) is list else self.runChannels
+    
+    def getInputs(self):
+        return [self.getChannel()]
+    
+    def getContentParams(self, colObj):
+        #the limits taken from the whole collection change the tiles as well
+        params = super(uabPreprocPercentileStretch, self).getContentParams(colObj)
+        if not self.perTile:
+            limits = self.getLimits(colObj)
+            params['limits'] = list(limits.values())[0] if limits else None
+        return params
+    
+    def getLimits(self, colObj):
+        #{tile: (low value, high value)} from the cached histograms
+        eid = self.getChannel()
+        if not self.perTile:
+            stats = colObj.getChannelStats(eid, nProc=self.nProc)[eid]
+            limits = uabTileStats.histPercentiles(stats['hist'], (stats['hist_edges'][0], stats['hist_edges'][-1]), self.percentiles)
+            return dict((tile, tuple(limits)) for tile in colObj.dataListForRun)
+        meta = colObj.getMetaDataInfo([eid], nProc=self.nProc)
+        ext, _ = colObj.getExtensionInfoById(eid)
+        limits = {}
+        for tile in colObj.dataListForRun:
+            part = meta['tile_stats'][ext].get(tile)
+            if part is not None and part['count'] > 0:
+                limits[tile] = tuple(uabTileStats.histPercentiles(part['hist'], meta['hist_range'][ext], self.percentiles))
+        return limits
+    
+    def runTilePreproc(self, colObj):
+        journal = self.getJournal(colObj)
+        limits = None
+        jobs = []
+        for tile in colObj.dataListForRun:
+            if journal.isDone(tile, self.ext):
+                continue
+            if limits is None:
+                limits = self.getLimits(colObj)
+            if tile not in limits:
+                continue
+            path = os.path.join(self.getDirectoryPaths(colObj), tile + '_' + self.ext)
+            jobs.append((tile, colObj.getTilePath(tile, self.getChannel()), path, limits[tile][0], limits[tile][1],
+                         self.outRange, self.outDtype))
+        
+        for tile, checksum in self.mapTiles(stretchWorker, jobs, self.nProc):
+            if checksum is not None:
+                journal.record(tile, self.ext, checksum)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Resampling of tiles by a scale factor (target ground sampling distance / ground sampling distance of the tile).
+
+Images:
+    integer factor  -> area average: the sum over every factor x factor block (np.add.reduceat, so a partial block at
+                       the bottom/right border is averaged over the pixels it has), divided by the number of pixels
+    other factors   -> separable linear (triangle) filter, widened by the factor when downscaling so that it averages
+                       over the footprint of an output pixel (as PIL's bilinear resize).  Up-sampling is bilinear
+Labels:
+    'majority'      -> most frequent label of every factor x factor block (integer factors only, ties go to the
+                       smallest label)
+    'nearest'       -> label at the center of every output pixel
+
+The output of a tile of size (h, w) has size (ceil(h / factor), ceil(w / factor)).  Tiles are processed by bands of
+output rows (see resampleTile()), only the input rows of a band are read at a time & the float temporaries stay small.
+Integer outputs are rounded to the nearest value & clipped to the range of their dtype.
+"""
+
+import numpy as np
+
+#bytes of the float temporaries of a band
+bandBytes = 64 * 1024**2
+
+
+def isIntegerFactor(factor):
+    return factor >= 1 and abs(factor - round(factor)) < 1e-9
+
+
+def getOutputSize(size, factor):
+    return int(np.ceil(size / float(factor) - 1e-9))
+
+
+def castOutput(data, dtype):
+    #float result -> dtype of the input
+    dtype = np.dtype(dtype)
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        return np.clip(np.rint(data), info.min, info.max).astype(dtype)
+    if dtype == np.bool_:
+        return data >= 0.5
+    return data.astype(dtype, copy=False)
+
+
+def areaBand(rows, k):
+    #area average of a band of rows (a multiple of k rows, except at the bottom of the tile) by integer factor k
+    acc = np.add.reduceat(rows.astype(np.float32 if rows.dtype.itemsize < 8 else np.float64), np.arange(0, rows.shape[0], k),
+                          axis=0)
+    acc = np.add.reduceat(acc, np.arange(0, rows.shape[1], k), axis=1)
+    countY = np.minimum(k, rows.shape[0] - np.arange(0, rows.shape[0], k))
+    countX = np.minimum(k, rows.shape[1] - np.arange(0, rows.shape[1], k))
+    counts = (countY[:, None] * countX[None, :]).reshape(countY.shape + countX.shape + (1,) * (rows.ndim - 2))
+    return acc / counts
+
+
+def majorityBand(rows, k):
+    #most frequent label of every k x k block of a band of rows
+    starts = (np.arange(0, rows.shape[0], k), np.arange(0, rows.shape[1], k))
+    best, bestCount = None, None
+    for label in np.unique(rows):
+        count = np.add.reduceat(np.add.reduceat((rows == label).astype(np.int32), starts[0], axis=0), starts[1], axis=1)
+        if best is None:
+            best = np.full(count.shape, label, dtype=rows.dtype)
+            bestCount = count
+        else:
+            better = count > bestCount
+            best[better] = label
+            bestCount = np.maximum(count, bestCount)
+    return best
+
+
+def nearestIndexes(size, factor):
+    #input index at the center of every output pixel
+    return np.minimum(((np.arange(getOutputSize(size, factor)) + 0.5) * factor).astype(np.int64), size - 1)
+
+
+def linearWeights(size, factor):
+    """
+    Taps of the separable linear filter along one axis
+    :return: (indexes, weights), two arrays of shape (output size, taps).  Output pixel i is
+             sum_t weights[i, t] * input[indexes[i, t]], indexes are clipped to the tile (edge pixels repeat)
+    """
+    scale = max(float(factor), 1.0)
+    nOut = getOutputSize(size, factor)
+    centers = (np.arange(nOut) + 0.5) * factor
+    taps = int(np.ceil(2 * scale)) + 1
+    first = np.floor(centers - scale).astype(np.int64)
+    idx = first[:, None] + np.arange(taps)[None, :]
+    weights = np.maximum(0, 1 - np.abs((idx + 0.5 - centers[:, None]) / scale))
+    weights /= weights.sum(axis=1, keepdims=True)
+    return np.clip(idx, 0, size - 1), weights.astype(np.float32)
+
+
+def applyTaps(data, idx, weights, axis):
+    #sum_t weights[:, t] * data[idx[:, t]] along axis
+    shape = [1] * data.ndim
+    shape[axis] = idx.shape[0]
+    out = None
+    for t in range(idx.shape[1]):
+        term = np.take(data, idx[:, t], axis=axis) * weights[:, t].reshape(shape)
+        out = term if out is None else out + term
+    return out
+
+
+def resampleTile(readRows, shape, dtype, factor, mode):
+    """
+    Resample a tile band by band
+    :param readRows: function (y0, y1) -> rows y0:y1 of the tile (e.g., a window reader or a slice of a memory map)
+    :param shape: shape of the tile
+    :param dtype: dtype of the tile, also the dtype of the output
+    :param factor: scale factor, > 1 makes the tile smaller
+    :param mode: 'area' or 'linear' for images, 'majority' or 'nearest' for labels
+    :return: resampled tile
+    """
+    h, w = shape[0], shape[1]
+    outH, outW = getOutputSize(h, factor), getOutputSize(w, factor)
+    out = np.empty((outH, outW) + tuple(shape[2:]), dtype=dtype)
+    rowBytes = max(1, w * int(np.prod(shape[2:], dtype=np.int64)) * 8)
+    if mode in ['area', 'majority']:
+        if not isIntegerFactor(factor):
+            raise ValueError('%s resampling needs an integer factor' % mode)
+        k = int(round(factor))
+        band = max(1, bandBytes // (rowBytes * k))
+        for o0 in range(0, outH, band):
+            o1 = min(outH, o0 + band)
+            rows = readRows(o0 * k, min(h, o1 * k))
+            if mode == 'area':
+                out[o0:o1] = castOutput(areaBand(rows, k), dtype)
+            else:
+                out[o0:o1] = majorityBand(rows, k)
+    elif mode == 'nearest':
+        iy, ix = nearestIndexes(h, factor), nearestIndexes(w, factor)
+        band = max(1, bandBytes // rowBytes)
+        for o0 in range(0, outH, band):
+            o1 = min(outH, o0 + band)
+            y0, y1 = iy[o0], iy[o1 - 1] + 1
+            out[o0:o1] = np.take(readRows(y0, y1)[iy[o0:o1] - y0], ix, axis=1)
+    elif mode == 'linear':
+        idxY, wY = linearWeights(h, factor)
+        idxX, wX = linearWeights(w, factor)
+        band = max(1, bandBytes // (rowBytes * (idxY.shape[1] + 1)))
+        for o0 in range(0, outH, band):
+            o1 = min(outH, o0 + band)
+            y0, y1 = idxY[o0:o1].min(), idxY[o0:o1].max() + 1
+            rows = readRows(y0, y1).astype(np.float32 if np.dtype(dtype).itemsize < 8 else np.float64)
+            cols = applyTaps(rows, idxY[o0:o1] - y0, wY[o0:o1], 0)
+            out[o0:o1] = castOutput(applyTaps(cols, idxX, wX, 1), dtype)
+    else:
+        raise ValueError('Unknown resampling mode %s' % mode)
+    return out
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of the tiles made by blocks, shared by all the collections (and users) of a results path.
+
+The key of the outputs of a tile is a hash of the block class, the parameters that change the content of its outputs
+(uabBlock.getContentParams(): the parameters of the fingerprint without the names of the outputs & the extension ids of
+the collection), the formats of its outputs and the contents of its input files for that tile.  Inputs are hashed once
+per file version: the hashes are kept in the collection store by path, mtime & size, and the outputs taken from or put
+into the cache get theirs recorded as well, so a chain of blocks never hashes intermediate tiles twice.  Keys don't
+depend on the collection, on the names of the extensions or on where the files are, so the same preprocessing on the
+same data is done at most once, and a tile whose input changed gets a new key instead of a stale result.
+
+Layout (default directory: [resPath]/ResultCache):
+    objects/[key[:2]]/[key]/
+        [n][format]             one file (or chunk store directory) per output of the tile, by position (e.g., 0.tif)
+        entry.json              block, parameters & [{'file', 'hash', 'checksum'}] of the outputs
+Entries are written to a temporary directory & renamed into place, the first writer of a key wins.  The outputs a block
+made are hard linked into the cache, or copied when the cache is on another file system.  Cached files are made
+read-only, and so are the outputs that share them.  Outputs taken from the cache are linked into the output directories
+of the blocks ('hard' links, falling back to symbolic links across file systems, or 'symlink').  Blocks only write
+outputs that don't exist, remove an output (uabBlock.removeTileOutputs()) before it is remade, never write to it.
+
+Blocks take part by returning the output paths of a tile from getTileOutputPaths() (all preprocessing blocks do).  Pass
+a cache to uabBlock.run() or to uabPipeline:
+    cache = uabResultCache.uabResultCache()
+    rescObj.run(blCol, cache=cache)
+"""
+
+import os
+import json
+import stat
+import errno
+import shutil
+import hashlib
+import uabRepoPaths
+import util_functions
+import uabBlockJournal
+
+entryFile = 'entry.json'
+
+
+def hashPath(path, blockSize=1 << 20):
+    #sha1 of the content of a file, or of the relative names & contents of the files in a directory (chunk stores)
+    h = hashlib.sha1()
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for fileName in sorted(files):
+                full = os.path.join(root, fileName)
+                h.update(os.path.relpath(full, path).encode('utf-8') + b'\0')
+                h.update(hashPath(full, blockSize).encode('utf-8'))
+        return h.hexdigest()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blockSize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def makeReadOnly(path):
+    paths = [path]
+    if os.path.isdir(path):
+        paths = [os.path.join(root, fileName) for root, _, files in os.walk(path) for fileName in files]
+    for p in paths:
+        os.chmod(p, stat.S_IMODE(os.stat(p).st_mode) & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+def copyPath(src, dst):
+    #copy of a file or of a directory (chunk stores)
+    if os.path.isdir(src):
+        shutil.copytree(src, dst)
+    else:
+        shutil.copy2(src, dst)
+
+
+def outputFormat(ext):
+    #format of the files of an extension, e.g., '.tif' for 'R_Half.tif'
+    return os.path.splitext(ext)[1]
+
+
+def removePath(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+class uabResultCache(object):
+
+    def __init__(self, cacheDir=None, link='hard'):
+        #cacheDir -> directory of the cache, defaults to ResultCache in uabRepoPaths.resPath
+        #link -> 'hard' or 'symlink', how cached files are put in the output directories
+        if link not in ['hard', 'symlink']:
+            raise ValueError('Unknown link type %s' % link)
+        self.cacheDir = os.path.join(uabRepoPaths.resPath, 'ResultCache') if cacheDir is None else cacheDir
+        self.link = link
+
+    def getEntryDir(self, key):
+        return os.path.join(self.cacheDir, 'objects', key[:2], key)
+
+    def getFileHash(self, colObj, path):
+        #content hash of a file, from the collection store if this version of the file was hashed before
+        st = os.stat(path)
+        store = getattr(colObj, 'store', None)
+        h = store.getFileHash(path, st.st_mtime_ns, st.st_size) if store is not None else None
+        if h is None:
+            h = hashPath(path)
+            if store is not None:
+                store.setFileHashes({path: (h, st.st_mtime_ns, st.st_size)})
+        return h
+
+    def recordFileHashes(self, colObj, hashes):
+        #hashes -> {path: hash}, recorded for the current version of the files
+        store = getattr(colObj, 'store', None)
+        if store is None or len(hashes) == 0:
+            return
+        records = {}
+        for path, h in hashes.items():
+            st = os.stat(path)
+            records[path] = (h, st.st_mtime_ns, st.st_size)
+        store.setFileHashes(records)
+
+    def getTileKey(self, block, colObj, tile, params=None):
+        """
+        Key of the outputs of a tile
+        :param params: block.getContentParams(colObj), to compute them once for all the tiles
+        :return: hex string, None if an input of the tile is missing
+        """
+        inputs = []
+        for eid in block.getInputs():
+            path = colObj.getTilePath(tile, eid)
+            if not os.path.exists(path):
+                return None
+            inputs.append(self.getFileHash(colObj, path))
+        if params is None:
+            params = block.getContentParams(colObj)
+        formats = [outputFormat(ext) for ext in block.getTileOutputPaths(colObj, tile)]
+        key = {'block': type(block).__name__, 'params': params, 'formats': formats, 'inputs': inputs}
+        return hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def storePath(src, dst):
+        try:
+            if os.path.isdir(src):
+                shutil.copytree(src, dst, copy_function=os.link)
+            else:
+                os.link(src, dst)
+            return
+        except OSError as e:
+            #copytree() gathers the errors of the files in a shutil.Error
+            if not isinstance(e, shutil.Error) and e.errno not in [errno.EXDEV, errno.EPERM, errno.EMLINK]:
+                raise
+            removePath(dst)
+        copyPath(src, dst)
+
+    def linkPath(self, src, dst):
+        if self.link == 'hard':
+            try:
+                if os.path.isdir(src):
+                    shutil.copytree(src, dst, copy_function=os.link)
+                else:
+                    os.link(src, dst)
+                return
+            except OSError as e:
+                if e.errno not in [errno.EXDEV, errno.EPERM, errno.EMLINK]:
+                    raise
+                removePath(dst)
+        os.symlink(os.path.abspath(src), dst)
+
+    def fetch(self, block, colObj, tiles):
+        """
+        Link the cached outputs of tiles into the output directories of a block & record them in its journal
+        :param tiles: tiles to look up, the ones whose outputs exist already are left alone
+        :return: {tile: key} of the tiles that were not in the cache (key None if an input is missing)
+        """
+        journal = block.getJournal(colObj)
+        missing = {}
+        nFound = 0
+        params = None
+        for tile in tiles:
+            outPaths = block.getTileOutputPaths(colObj, tile)
+            if all([os.path.exists(path) for path in outPaths.values()]):
+                continue
+            if params is None:
+                params = block.getContentParams(colObj)
+            key = self.getTileKey(block, colObj, tile, params)
+            entryDir = self.getEntryDir(key) if key is not None else None
+            if entryDir is None or not os.path.exists(os.path.join(entryDir, entryFile)):
+                missing[tile] = key
+                continue
+            with open(os.path.join(entryDir, entryFile), 'r') as f:
+                entry = json.load(f)
+            hashes = {}
+            for (ext, path), output in zip(outPaths.items(), entry['outputs']):
+                if not os.path.exists(path):
+                    util_functions.uabUtilMakeDirectoryName(os.path.dirname(path))
+                    self.linkPath(os.path.join(entryDir, output['file']), path)
+                    hashes[path] = output['hash']
+                journal.record(tile, ext, output['checksum'])
+            self.recordFileHashes(colObj, hashes)
+            nFound += 1
+        if nFound > 0:
+            print('%s: %d tiles taken from the result cache' % (block.getName(), nFound))
+        return missing
+
+    def put(self, block, colObj, keys):
+        """
+        Add the outputs a block made for some tiles to the cache
+        :param keys: {tile: key} as returned by fetch(), tiles with a missing output are skipped
+        """
+        journal = block.getJournal(colObj)
+        for tile, key in keys.items():
+            if key is None:
+                continue
+            outPaths = block.getTileOutputPaths(colObj, tile)
+            if not all([os.path.exists(path) for path in outPaths.values()]):
+                continue
+            entryDir = self.getEntryDir(key)
+            if os.path.exists(entryDir):
+                continue
+            tmpDir = '%s.%d.tmp' % (entryDir, os.getpid())
+            util_functions.uabUtilMakeDirectoryName(tmpDir)
+            entry = {'block': block.getName(), 'params': block.getParams(), 'outputs': []}
+            hashes = {}
+            try:
+                for n, (ext, path) in enumerate(outPaths.items()):
+                    #the checksum of the journal if the block recorded one, else the crc32 of the saved data
+                    checksum = journal.getChecksum(tile, ext)
+                    if checksum is None:
+                        checksum = '%08x' % uabBlockJournal.arrayChecksum(util_functions.uabUtilAllTypeLoad(path))
+                    hashes[path] = hashPath(path)
+                    cached = os.path.join(tmpDir, '%d%s' % (n, outputFormat(ext)))
+                    entry['outputs'].append({'file': os.path.basename(cached), 'hash': hashes[path], 'checksum': checksum})
+                    #the output of the block is shared by a hard link (it becomes read-only as well), copied if the cache
+                    #is on another file system
+                    self.storePath(path, cached)
+                    makeReadOnly(cached)
+                with open(os.path.join(tmpDir, entryFile), 'w') as f:
+                    json.dump(entry, f, sort_keys=True)
+                os.rename(tmpDir, entryDir)
+            except OSError:
+                #another process stored this key first or the cache is full, the outputs of the block are still there
+                shutil.rmtree(tmpDir, ignore_errors=True)
+            self.recordFileHashes(colObj, hashes)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic collections for testing & benchmarking the pipeline without the real datasets.
+
+makeSyntheticCollection() writes a collection laid out like Inria in uabRepoPaths.dataPath:
+    [colN]/data/Original_Tiles/
+        austin1_RGB.tif         image with nChannels channels (uint8)
+        austin1_GT.tif          building mask with values 0 & 255
+        chicago1_RGB.tif
+        ...
+Tiles are named city + tile number so that the cross-validation helpers (uabCrossValMaker) work on them.  The images
+are noise textured ground with roads & buildings (rectangles and L-shapes with roof colors), the GT marks the building
+pixels.  Everything is drawn from a seeded random generator so a collection can be remade identically.
+
+useTemporaryRepo() points uabRepoPaths (data, results, models & evaluation) to a fresh temporary directory so that
+benchmarks never touch the real datasets.
+"""
+
+import os
+import shutil
+import tempfile
+import numpy as np
+import uabRepoPaths
+import util_functions
+
+defaultCities = ('austin', 'chicago', 'kitsap', 'tyrol-w', 'vienna')
+#formats that imageio can write for a number of channels
+channelFormats = {'png': (1, 2, 3, 4), 'jpg': (1, 3)}
+
+
+def useTemporaryRepo(parentDir=None):
+    """
+    Point all the paths of uabRepoPaths to a new temporary directory
+    :param parentDir: where to make the temporary directory (None: system default)
+    :return: the temporary directory, remove it with removeTemporaryRepo()
+    """
+    root = tempfile.mkdtemp(prefix='uab_', dir=parentDir)
+    uabRepoPaths.parentDir = root
+    uabRepoPaths.dataPath = os.path.join(root, 'data')
+    uabRepoPaths.resPath = os.path.join(root, 'Results')
+    uabRepoPaths.modelPath = os.path.join(root, 'Models')
+    uabRepoPaths.evalPath = os.path.join(root, 'Eval')
+    for path in [uabRepoPaths.dataPath, uabRepoPaths.resPath, uabRepoPaths.modelPath, uabRepoPaths.evalPath]:
+        util_functions.uabUtilMakeDirectoryName(path)
+    return root
+
+
+def removeTemporaryRepo(root):
+    shutil.rmtree(root, ignore_errors=True)
+
+
+def makeBuildingMask(rng, tileSize, density=0.15, sizeRange=(8, 60)):
+    """
+    Draw a building mask: axis aligned rectangles, a third of them with a second wing (L-shape)
+    :param density: approximate fraction of building pixels
+    :param sizeRange: min & max side of a building in pixels
+    :return: boolean array of size tileSize
+    """
+    h, w = tileSize
+    mask = np.zeros((h, w), dtype=bool)
+    meanArea = ((sizeRange[0] + sizeRange[1]) / 2.0) ** 2
+    nBuildings = max(1, int(density * h * w / meanArea))
+    sides = rng.randint(sizeRange[0], sizeRange[1] + 1, size=(nBuildings, 2))
+    ys = rng.randint(0, h, size=nBuildings)
+    xs = rng.randint(0, w, size=nBuildings)
+    for (bh, bw), y, x in zip(sides, ys, xs):
+        mask[y:y + bh, x:x + bw] = True
+        if rng.rand() < 1 / 3.0:
+            mask[y + bh // 2:y + bh // 2 + bh, x:x + max(sizeRange[0], bw // 3)] = True
+    return mask
+
+
+def makeImage(rng, mask, nChannels):
+    """
+    Draw an image that goes with a building mask
+    :return: uint8 array (h, w, nChannels), or (h, w) if nChannels is 1
+    """
+    h, w = mask.shape
+    #ground: smooth noise between grass and asphalt (upsampled low resolution noise)
+    low = rng.rand(h // 16 + 2, w // 16 + 2)
+    ground = np.kron(low, np.ones((16, 16)))[:h, :w]
+    grass = np.array([70, 100, 50, 140], dtype=np.float32)
+    asphalt = np.array([110, 110, 105, 60], dtype=np.float32)
+    chans = [grass[c % 4] + (asphalt[c % 4] - grass[c % 4]) * ground for c in range(nChannels)]
+    img = np.stack(chans, axis=-1)
+
+    #roads: a few horizontal & vertical strips
+    road = np.zeros((h, w), dtype=bool)
+    for pos in rng.randint(0, h, size=max(1, h // 400)):
+        road[pos:pos + 12, :] = True
+    for pos in rng.randint(0, w, size=max(1, w // 400)):
+        road[:, pos:pos + 12] = True
+    img[road] = np.array([90 + 10 * (c % 2) for c in range(nChannels)], dtype=np.float32)
+
+    #roofs: one of a few colors per connected stripe of rows, close enough to look like separate buildings
+    roofColors = rng.randint(120, 230, size=(8, nChannels)).astype(np.float32)
+    roofIdx = (np.arange(h)[:, None] // 32 + np.arange(w)[None, :] // 32) % len(roofColors)
+    img[mask] = roofColors[roofIdx[mask]]
+
+    img += rng.normal(0, 6, size=img.shape).astype(np.float32)
+    img = np.clip(img, 0, 255).astype(np.uint8)
+    if nChannels == 1:
+        img = img[:, :, 0]
+    return img
+
+
+def getTileNames(nTiles, cities=defaultCities):
+    #city + number, numbers count up per city as in Inria
+    return ['%s%d' % (cities[i % len(cities)], i // len(cities) + 1) for i in range(nTiles)]
+
+
+def makeSyntheticCollection(colN, nTiles=10, tileSize=(1000, 1000), nChannels=3, imExt='RGB.tif', gtExt='GT.tif',
+                            cities=defaultCities, density=0.15, seed=0, overwrite=False):
+    """
+    Write a synthetic collection to uabRepoPaths.dataPath
+    :param colN: name of the collection
+    :param nTiles: number of tiles
+    :param tileSize: size (h, w) of a tile
+    :param nChannels: number of channels of the image files
+    :param imExt: extension (postfix & format) of the image files, e.g., 'RGB.tif', 'RGB.png', 'RGB.npy'
+    :param gtExt: extension of the GT files, None to make a collection without GT
+    :param cities: names used as prefixes of the tiles
+    :param density: approximate fraction of building pixels
+    :param seed: seed of the random generator
+    :param overwrite: if True, an existing collection of that name is removed first
+    :return: the names of the tiles
+    """
+    fmt = imExt.split('.')[-1]
+    if fmt in channelFormats and nChannels not in channelFormats[fmt]:
+        raise ValueError('Cannot save %d channels as %s' % (nChannels, fmt))
+
+    colDir = os.path.join(uabRepoPaths.dataPath, colN)
+    if os.path.exists(colDir):
+        if not overwrite:
+            raise IOError('Collection %s exists already' % colN)
+        shutil.rmtree(colDir)
+    origDir = os.path.join(colDir, 'data', 'Original_Tiles')
+    util_functions.uabUtilMakeDirectoryName(origDir)
+
+    rng = np.random.RandomState(seed)
+    tileNames = getTileNames(nTiles, cities)
+    for tile in tileNames:
+        mask = makeBuildingMask(rng, tileSize, density)
+        util_functions.uabUtilAllTypeSave(os.path.join(origDir, tile + '_' + imExt), makeImage(rng, mask, nChannels))
+        if gtExt is not None:
+            util_functions.uabUtilAllTypeSave(os.path.join(origDir, tile + '_' + gtExt),
+                                              mask.astype(np.uint8) * 255)
+    return tileNames
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Caches for the tile data of a collection.
+
+uabTileMemmapCache: every tile channel is decoded once and transcoded to an uncompressed .npy in the meta-data
+directory of the collection (meta_data/tile_cache/).  Later loads return a read-only np.memmap of that file, so
+repeated accesses cost page-cache reads instead of TIF/JPG decodes.  Each cached file has a sidecar (.src) with the
+mtime & size of the source file; the cached copy is remade as soon as those don't match anymore.
+
+uabTileLRUCache: in-memory least-recently-used cache of decoded tiles with a byte budget.  uabCollection keeps one and
+loadTileDataByExtension() goes through it, so blocks that run one after the other on the same collection object don't
+decode the same tiles again.  Cached arrays are shared between callers and therefore read-only, callers get a copy
+unless they ask for the cached array (loadTileDataByExtension(..., cached=True)).
+"""
+
+import os
+import shutil
+import contextlib
+from collections import OrderedDict
+import numpy as np
+import util_functions
+
+
+class uabTileMemmapCache(object):
+
+    cacheDirname = 'tile_cache'
+
+    def __init__(self, metaDir):
+        self.cacheDir = os.path.join(metaDir, uabTileMemmapCache.cacheDirname)
+
+    def getCachePath(self, dirn, fileName):
+        #one sub-directory per data directory, nested directories are flattened
+        return os.path.join(self.cacheDir, dirn.replace(os.sep, '__'), fileName + '.npy')
+
+    @staticmethod
+    def sourceKey(srcPath):
+        st = os.stat(srcPath)
+        return '%d %d' % (st.st_mtime_ns, st.st_size)
+
+    def isValid(self, cachePath, key):
+        try:
+            with open(cachePath + '.src', 'r') as f:
+                return f.read().strip() == key and os.path.exists(cachePath)
+        except IOError:
+            return False
+
+    def load(self, srcPath, dirn):
+        """
+        Load a tile as a read-only memory map, transcoding it first if needed
+        :param srcPath: path to the original data of the tile
+        :param dirn: data directory of the tile (used to organize the cache)
+        :return: np.memmap of the tile
+        """
+        try:
+            key = uabTileMemmapCache.sourceKey(srcPath)
+        except OSError:
+            raise IOError('Problem loading this data tile')
+        if srcPath.endswith('.npy'):
+            #already uncompressed, map the source itself
+            return np.load(srcPath, mmap_mode='r')
+
+        cachePath = self.getCachePath(dirn, os.path.basename(srcPath))
+        if not self.isValid(cachePath, key):
+            data = util_functions.uabUtilAllTypeLoad(srcPath)
+            util_functions.uabUtilMakeDirectoryName(os.path.dirname(cachePath))
+            #write to temporary files & rename so that concurrent readers never see a partial file
+            tmpPath = '%s.%d.tmp.npy' % (cachePath[:-4], os.getpid())
+            np.save(tmpPath, np.ascontiguousarray(data))
+            os.replace(tmpPath, cachePath)
+            with open(cachePath + '.%d.tmp' % os.getpid(), 'w') as f:
+                f.write(key)
+            os.replace(cachePath + '.%d.tmp' % os.getpid(), cachePath + '.src')
+        return np.load(cachePath, mmap_mode='r')
+
+    def clear(self, dirn=None):
+        #remove the cached copies of a data directory (or of all of them)
+        path = self.cacheDir if dirn is None else os.path.join(self.cacheDir, dirn.replace(os.sep, '__'))
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+
+
+#number of processes the objects pickled now are sent to, see sharedBetween()
+workerShares = 1
+
+
+@contextlib.contextmanager
+def sharedBetween(nProc):
+    #the caches pickled inside this context (e.g., the jobs sent to a pool of nProc processes) get 1/nProc of the budget
+    global workerShares
+    prev = workerShares
+    workerShares = max(1, nProc)
+    try:
+        yield
+    finally:
+        workerShares = prev
+
+
+class uabTileLRUCache(object):
+
+    def __init__(self, maxBytes):
+        #maxBytes -> budget for the cached arrays, 0 disables the cache
+        self.maxBytes = maxBytes
+        self.curBytes = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        #returns the cached array or None
+        arr = self.entries.get(key)
+        if arr is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return arr
+
+    def put(self, key, arr):
+        #cache an array, evicting the least recently used ones to stay within the budget.  Returns the array read-only
+        arr.setflags(write=False)
+        if arr.nbytes > self.maxBytes:
+            return arr
+        if key in self.entries:
+            self.curBytes -= self.entries.pop(key).nbytes
+        while self.curBytes + arr.nbytes > self.maxBytes:
+            _, old = self.entries.popitem(last=False)
+            self.curBytes -= old.nbytes
+            self.evictions += 1
+        self.entries[key] = arr
+        self.curBytes += arr.nbytes
+        return arr
+
+    def invalidate(self, match=lambda key: True):
+        #drop the entries whose key matches, e.g., all the tiles of a directory that is being rewritten
+        for key in [k for k in self.entries if match(k)]:
+            self.curBytes -= self.entries.pop(key).nbytes
+
+    def getWorkerCache(self):
+        #empty cache with the share of the budget of one of the processes this one is pickled for
+        return uabTileLRUCache(self.maxBytes // workerShares)
+
+    def getStats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self.entries), 'bytes': self.curBytes, 'maxBytes': self.maxBytes}
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent manifest of the tile files of a collection.
+
+For every file in a data directory of the collection (Original_Tiles or the output directory of a preprocessing block)
+the manifest records:
+    tile, ext, dir, shape, dtype, nbytes (file size), mtime
+The shape and dtype are obtained by reading the header of the file only (numpy or uabChunkStore header, tifffile/PIL
+for images), so building the manifest never decodes pixel data.  The manifest is saved in the meta-data directory of
+the collection and refreshed incrementally: a directory is listed & every file in it is stat'ed once per session (on
+first use), a file is re-probed only when its mtime or size changed, so tiles overwritten in place are picked up.  Files
+that can't be probed (not tiles, truncated or corrupt files) are skipped.  A file that is not in the records (e.g., no
+GT for a test tile) only makes the directory be listed again if the directory changed (its mtime) since it was listed,
+so looking up missing files costs one stat of the directory each.
+"""
+
+import os
+import time
+import pickle
+import numpy as np
+import util_functions
+import uabChunkStore
+
+try:
+    import tifffile
+except ImportError:
+    tifffile = None
+
+#a directory listed less than this after its last change may get files in the same mtime tick, it is listed again
+racyNs = 2 * 10**9
+
+#PIL mode -> (number of bands, dtype)
+pilModes = {'L': (1, np.uint8), 'RGB': (3, np.uint8), 'RGBA': (4, np.uint8), 'LA': (2, np.uint8),
+            'CMYK': (4, np.uint8), 'I;16': (1, np.uint16), 'I;16B': (1, np.uint16), 'I': (1, np.int32),
+            'F': (1, np.float32), '1': (1, np.bool_)}
+
+
+def splitTileName(fileName):
+    #file name -> (tile name, extension).  Separates at the last underscore as in uabCollection.getImLists()
+    parts = fileName.split('_')
+    return '_'.join(parts[:-1]), parts[-1]
+
+
+def probeNpy(path):
+    with open(path, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+    return tuple(shape), np.dtype(dtype).str
+
+
+def probeTiff(path):
+    with tifffile.TiffFile(path) as tif:
+        page = tif.pages[0]
+        return tuple(page.shape), np.dtype(page.dtype).str
+
+
+def probePil(path):
+    from PIL import Image
+    with Image.open(path) as im:
+        if im.mode not in pilModes:
+            raise IOError('Unsupported mode %s' % im.mode)
+        bands, dtype = pilModes[im.mode]
+        shape = (im.size[1], im.size[0]) if bands == 1 else (im.size[1], im.size[0], bands)
+    return shape, np.dtype(dtype).str
+
+
+def probeTile(path):
+    """
+    Get shape and dtype of a tile without decoding the pixel data
+    :param path: path to the file
+    :return: shape (tuple), dtype (numpy dtype string)
+    """
+    ext = path.split('.')[-1].lower()
+    if ext == uabChunkStore.chunkExt:
+        return uabChunkStore.probe(path)
+    probes = []
+    if ext == 'npy':
+        probes.append(probeNpy)
+    if ext in ['tif', 'tiff'] and tifffile is not None:
+        probes.append(probeTiff)
+    probes.append(probePil)
+    for probe in probes:
+        try:
+            return probe(path)
+        except Exception:
+            continue
+    #no header reader understands this file, fall back to decoding it
+    data = util_functions.uabUtilAllTypeLoad(path)
+    return tuple(data.shape), data.dtype.str
+
+
+class uabTileManifest(object):
+
+    manifestFile = 'manifest.pkl'
+
+    def __init__(self, dataDir, metaDir):
+        #dataDir -> directory that holds Original_Tiles & the preprocessing outputs
+        #metaDir -> directory where the manifest is saved
+        self.dataDir = dataDir
+        self.path = os.path.join(metaDir, uabTileManifest.manifestFile)
+        #records -> {dirn: {fileName: record}}
+        self.records = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'rb') as f:
+                    saved = pickle.load(f)
+                self.records = saved['records']
+            except Exception:
+                #unreadable manifest, it is rebuilt from scratch
+                pass
+        #{dirn: (mtime of the directory, time of the listing)} of the directories listed by this object
+        self.listed = {}
+
+    def save(self):
+        tmpPath = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tmpPath, 'wb') as f:
+            pickle.dump({'records': self.records}, f)
+        os.replace(tmpPath, self.path)
+
+    def refresh(self, dirn, force=False):
+        """
+        Bring the records of a data directory up to date
+        :param dirn: directory relative to the data directory (e.g., 'Original_Tiles')
+        :param force: if True, probe every file again even if its mtime & size are unchanged
+        :return: the records of this directory {fileName: record}
+        """
+        fullDir = os.path.join(self.dataDir, dirn)
+        if not os.path.isdir(fullDir):
+            self.records[dirn] = {}
+            return self.records[dirn]
+
+        listedAt = int(time.time() * 1e9)
+        dirMtime = os.stat(fullDir).st_mtime_ns
+        old = {} if force else self.records.get(dirn, {})
+        new = {}
+        changed = dirn not in self.records
+        for entry in os.scandir(fullDir):
+            if entry.name.startswith('.') or '_' not in entry.name or '.' not in entry.name:
+                continue
+            st = entry.stat()
+            rec = old.get(entry.name)
+            if rec is None or rec['mtime'] != st.st_mtime_ns or rec['nbytes'] != st.st_size:
+                try:
+                    shape, dtype = probeTile(entry.path)
+                except (IOError, ValueError):
+                    #not a tile, or a truncated/corrupt file
+                    continue
+                tile, ext = splitTileName(entry.name)
+                rec = {'tile': tile, 'ext': ext, 'dir': dirn, 'shape': shape, 'dtype': dtype,
+                       'nbytes': st.st_size, 'mtime': st.st_mtime_ns}
+                changed = True
+            new[entry.name] = rec
+        changed = changed or len(new) != len(self.records.get(dirn, {}))
+        self.records[dirn] = new
+        self.listed[dirn] = (dirMtime, listedAt)
+        if changed or force:
+            self.save()
+        return new
+
+    def isListed(self, dirn):
+        #True if no file was added to or removed from the directory since this object listed it
+        if dirn not in self.listed:
+            return False
+        dirMtime, listedAt = self.listed[dirn]
+        try:
+            st = os.stat(os.path.join(self.dataDir, dirn))
+        except OSError:
+            return False
+        return st.st_mtime_ns == dirMtime and listedAt - dirMtime > racyNs
+
+    def getRecords(self, dirn):
+        #records of a directory, listed once per session
+        if dirn not in self.listed:
+            return self.refresh(dirn)
+        return self.records[dirn]
+
+    def getRecord(self, dirn, tile, ext):
+        """
+        Record of the file of a tile.  If it is unknown, the directory is listed again if it changed since it was listed
+        :return: record dictionary or None if the file doesn't exist
+        """
+        fileName = tile + '_' + ext
+        rec = self.getRecords(dirn).get(fileName)
+        if rec is None and not self.isListed(dirn):
+            rec = self.refresh(dirn).get(fileName)
+        return rec
+
+    def getTileNames(self, dirn):
+        #sorted names of the tiles in a directory
+        return sorted(set([rec['tile'] for rec in self.getRecords(dirn).values()]))
+
+    def getExtensions(self, dirn, tile):
+        #extensions of the files of one tile in a directory
+        return [rec['ext'] for rec in self.getRecords(dirn).values() if rec['tile'] == tile]
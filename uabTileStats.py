@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Channel statistics of the tiles in a collection.
+
+Each tile is read once (all the requested channels in one go) inside a worker process and reduced to a small partial
+result: pixel count, mean, sum of squared deviations (M2), min, max and a 256-bin histogram.  Partial results
+are merged with the pairwise (Chan/Welford) update so the collection-level mean/std are exact, and they are kept per
+tile so that adding tiles to a collection only requires processing the new ones.
+
+Histogram ranges:
+    uint8       -> one bin per value
+    other ints  -> 256 equal bins over the full range of the dtype
+    floats      -> 256 equal bins between the collection min and max.  The range is unknown before the first pass, so
+                   the first time a float channel is computed its tiles are read a second time for the histograms
+                   (the exception to reading a tile once).  Later tiles are binned into the stored range in one pass,
+                   with out-of-range values clipped into the end bins.
+
+Percentiles (e.g., for contrast stretching, see uabPreprocClasses.uabPreprocPercentileStretch) are read from the
+histograms with histPercentiles(), so they never need a sort of the pixels.
+
+Class counts: the pixel count of every value of a ground truth tile (np.bincount), used for the class balance of tiles.
+"""
+
+import multiprocessing
+import numpy as np
+from tqdm import tqdm
+import util_functions
+
+histBins = 256
+#number of rows reduced at a time, bounds the size of the float64 temporaries
+chunkRows = 512
+
+
+def emptyStats():
+    return {'count': 0, 'mean': 0.0, 'm2': 0.0, 'min': np.inf, 'max': -np.inf, 'hist': None}
+
+
+def dtypeHistRange(dtype):
+    #fixed histogram range for a dtype, None if it has to be derived from the data (floats)
+    dtype = np.dtype(dtype)
+    if dtype == np.uint8:
+        return (0, 256)
+    elif np.issubdtype(dtype, np.integer) or dtype == np.bool_:
+        info = np.iinfo(dtype) if dtype != np.bool_ else np.iinfo(np.uint8)
+        return (int(info.min), int(info.max) + 1)
+    else:
+        return None
+
+
+def chunkHistogram(chunk, histRange):
+    if chunk.dtype == np.uint8:
+        return np.bincount(chunk.ravel(), minlength=histBins)
+    chunk = np.clip(chunk, histRange[0], np.nextafter(histRange[1], histRange[0]))
+    return np.histogram(chunk, bins=histBins, range=histRange)[0]
+
+
+def mergeStats(a, b):
+    #pairwise update of two partial results, the hists must share the same range
+    if b['count'] == 0:
+        return dict(a)
+    if a['count'] == 0:
+        return dict(b)
+    n = a['count'] + b['count']
+    delta = b['mean'] - a['mean']
+    out = {'count': n,
+           'mean': a['mean'] + delta * b['count'] / n,
+           'm2': a['m2'] + b['m2'] + delta ** 2 * a['count'] * b['count'] / n,
+           'min': min(a['min'], b['min']),
+           'max': max(a['max'], b['max'])}
+    if a['hist'] is not None and b['hist'] is not None:
+        out['hist'] = a['hist'] + b['hist']
+    else:
+        out['hist'] = None
+    return out
+
+
+def arrayStats(img, histRange=None, doStats=True):
+    #partial result of a full array, reduced over row chunks
+    assert len(img.shape) == 2
+    stats = emptyStats()
+    hist = np.zeros(histBins, dtype=np.int64) if histRange is not None else None
+    for r in range(0, img.shape[0], chunkRows):
+        chunk = img[r:r + chunkRows]
+        if doStats:
+            cf = chunk.astype(np.float64)
+            cMean = cf.mean()
+            stats = mergeStats(stats, {'count': cf.size, 'mean': cMean, 'm2': np.sum((cf - cMean) ** 2),
+                                       'min': cf.min(), 'max': cf.max(), 'hist': None})
+        if hist is not None:
+            hist += chunkHistogram(chunk, histRange)
+    stats['hist'] = hist
+    stats['hist_range'] = histRange
+    return stats
+
+
+def tileStatsWorker(args):
+    #pool worker: (tile, [(extName, path, histRange, doStats), ...]) -> (tile, {extName: partial})
+    tile, jobs = args
+    out = {}
+    for extName, path, histRange, doStats in jobs:
+        try:
+            img = util_functions.uabUtilAllTypeLoad(path)
+        except IOError:
+            #this channel doesn't exist for this tile (e.g., no GT for the test tiles)
+            out[extName] = emptyStats()
+            continue
+        if histRange is None:
+            histRange = dtypeHistRange(img.dtype)
+        out[extName] = arrayStats(img, histRange, doStats)
+        out[extName]['dtype'] = img.dtype.str
+    return tile, out
+
+
+def classCountWorker(args):
+    #pool worker: (tile, path) -> (tile, pixel count of every class value or None if the GT doesn't exist)
+    tile, path = args
+    try:
+        gt = util_functions.uabUtilAllTypeLoad(path)
+    except IOError:
+        return tile, None
+    return tile, np.bincount(np.asarray(gt, dtype=np.int64).ravel())
+
+
+def runTileJobs(worker, jobList, nProc=None, desc=None):
+    #run one job per tile in a process pool, the worker returns (tile, result).  Returns {tile: result}
+    if nProc is None:
+        nProc = multiprocessing.cpu_count()
+    nProc = max(1, min(nProc, len(jobList)))
+    results = {}
+    if nProc == 1:
+        for job in tqdm(jobList, desc=desc):
+            tile, res = worker(job)
+            results[tile] = res
+    else:
+        pool = multiprocessing.Pool(nProc)
+        try:
+            for tile, res in tqdm(pool.imap_unordered(worker, jobList), total=len(jobList), desc=desc):
+                results[tile] = res
+        finally:
+            pool.close()
+            pool.join()
+    return results
+
+
+def runStatsJobs(jobList, nProc=None, desc=None):
+    #run the channel statistics jobs of all the tiles, returns {tile: {extName: partial}}
+    return runTileJobs(tileStatsWorker, jobList, nProc, desc)
+
+
+def histPercentiles(hist, histRange, percentiles):
+    """
+    Percentiles of the values counted by a histogram of histBins bins
+    :param hist: counts of the bins
+    :param histRange: range of the histogram
+    :param percentiles: list of percentiles in [0, 100]
+    :return: list of values.  With one bin per integer value (uint8) these are values of the data, otherwise they are
+             interpolated linearly inside the bin
+    """
+    hist = np.asarray(hist, dtype=np.float64)
+    cdf = np.cumsum(hist)
+    total = cdf[-1]
+    width = (histRange[1] - histRange[0]) / float(len(hist))
+    out = []
+    for p in percentiles:
+        if total == 0:
+            out.append(float(histRange[0]))
+            continue
+        #at least one value, the 0th percentile is in the first bin that is not empty
+        target = max(total * p / 100.0, np.nextafter(0, 1))
+        idx = min(int(np.searchsorted(cdf, target, side='left')), len(hist) - 1)
+        if width == 1:
+            out.append(float(histRange[0] + idx))
+            continue
+        before = cdf[idx - 1] if idx > 0 else 0.0
+        frac = (target - before) / hist[idx] if hist[idx] > 0 else 0.0
+        out.append(float(histRange[0] + (idx + frac) * width))
+    return out
+
+
+def summarizeStats(partials, histRange):
+    """
+    Merge the per-tile partial results of one channel into collection-level statistics
+    :param partials: iterable of partial results made by arrayStats()
+    :param histRange: range of the histogram
+    :return: dictionary with count, mean, std, min, max, hist and hist_edges
+    """
+    total = emptyStats()
+    for part in partials:
+        total = mergeStats(total, part)
+    n = total['count']
+    summary = {'count': n,
+               'mean': total['mean'],
+               'std': np.sqrt(total['m2'] / n) if n > 0 else 0.0,
+               'min': total['min'],
+               'max': total['max'],
+               'hist': total['hist']}
+    if histRange is not None:
+        summary['hist_edges'] = np.linspace(histRange[0], histRange[1], histBins + 1)
+    else:
+        summary['hist_edges'] = None
+    return summary
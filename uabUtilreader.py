@@ -106,8 +106,8 @@ def patchify(block, tile_dim, patch_size, overlap=0, insert_dim=False):
     max_h = tile_dim[0] - patch_size[0]
     max_w = tile_dim[1] - patch_size[1]
     if max_h > 0 and max_w > 0:
-        h_step = np.ceil(tile_dim[0] / (patch_size[0] - overlap))
-        w_step = np.ceil(tile_dim[1] / (patch_size[1] - overlap))
+        h_step = int(np.ceil(tile_dim[0] / (patch_size[0] - overlap)))
+        w_step = int(np.ceil(tile_dim[1] / (patch_size[1] - overlap)))
     else:
         h_step = 1
         w_step = 1
@@ -12,6 +12,11 @@ Note: if you want to do some custom augmentation, this would also be the place t
 Default
 [a] Extract every possible tile at regular intervals with minimal overlap.  The amount of overlap is an input to the patch extractor class
 [b] saves extracted patches using the same file-extension (e.g., tif) as that in the collection files.  If you want this to change, then input a list of extensions into the constructor in the same order as the channels defined in runChannels.
+[c] runChannels can hold preprocessing blocks (e.g., uabPreprocMultChanOp) in place of extension ids.  Their tiles are computed in memory & extracted right away, see uabPreprocClasses.
+[d] shards=True writes the patches of every tile into a single array (one shard per tile) instead of one file per patch per channel.  fileList.txt is the same, read the patches with uabPatchReaders.loadPatch(), see uabPatchShards.
+[e] fileList.txt is streamed tile by tile & renamed into place once all the tiles are done, with a binary sidecar (fileList.npz) that readers & uabCrossValMaker load instead of the text, see uabPatchManifest.
+[f] uabPatchExtrVirtual only writes the grid & where the tiles of every channel are, the patches are cut from memory-mapped tiles when they are read, see uabPatchVirtual.
+[g] extractors that keep only some locations of the grid (e.g., bohaoCustom uabPatchExtrClassSelect, uabPatchExtrPurge) select them on the whole tiles with extractSelected() & write the selected patches only, in a pool of processes over the tiles.
 
 [Note: The default is an extractor that does not sample the tile densely.  This is because the FCNs already see many shifted copies of the data, so seeing more is not very beneficial.]
 
@@ -25,21 +30,125 @@ Instructions for overloading
 """
 
 import util_functions, os
+import functools
+import multiprocessing
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 import tensorflow as tf
 from tqdm import tqdm
 import uabBlockparent
+import uabPreprocClasses
+import uabBlockJournal
+import uabBlockProfile
 import uabUtilreader
+import uabPatchShards
+import uabPatchManifest
+import uabPatchVirtual
+import uabTileCache
 from uabBlockparent import uabBlock
 
+def savePatchGroup(group):
+    # write the patches [(path, patch)] of one location, runs in the thread pool of uabPatchExtr
+    for fPath, chipDat in group:
+        util_functions.read_or_new_pickle(fPath, toSave=1, variable_to_save=chipDat)
+
+def getPatchViews(cIm, cSize):
+    # views[y, x] is the patch with its top left corner at (y, x), a view of the tile made with stride tricks (nothing is copied)
+    cIm = np.asarray(cIm)
+    h, w = cSize
+    return np.lib.stride_tricks.as_strided(cIm, shape=(cIm.shape[0] - h + 1, cIm.shape[1] - w + 1, h, w) + cIm.shape[2:],
+                                           strides=cIm.strides[:2] + cIm.strides, writeable=False)
+
+def writePatchGroups(pool, directory, tilename, todo, coords, existing):
+    """
+    Write the patches of the channels of a tile, the patches of a location are encoded & written together by a pool of threads
+    :param todo: [(extension, views made by getPatchViews())] of the channels to write
+    :param existing: names of the files in the directory, the patches written before an interruption are not written again
+    :return: checksum of the patches of every channel of todo
+    """
+    checksums = [0] * len(todo)
+    futures = []
+    for x1, x2 in coords:
+        group = []
+        for cnt, (ext, views) in enumerate(todo):
+            chipDat = views[x1, x2]
+            checksums[cnt] = uabBlockJournal.arrayChecksum(chipDat, checksums[cnt])
+            finNm = tilename + '_y%dx%d_%s' % (x1, x2, ext)
+            if finNm not in existing:
+                group.append((os.path.join(directory, finNm), chipDat))
+        if len(group) > 0:
+            futures.append(pool.submit(savePatchGroup, group))
+    for future in futures:
+        future.result()
+    return checksums
+
+def loadTileSource(source, pad):
+    # padded tile of a channel from its path, or from a function that returns it (streamed channels, see getTileSources())
+    if callable(source):
+        return source()
+    data = util_functions.uabUtilAllTypeLoad(source)
+    if pad == 0:
+        return data
+    return util_functions.uabUtilWindowFromArray(data, -pad, -pad, data.shape[0] + 2 * pad, data.shape[1] + 2 * pad)
+
+def writeTilePatches(directory, tilename, tiles, coords, cSize, fileExts, shards, done, existing=()):
+    """
+    Write the patches of a tile at some locations, in a process of its own or not (no collection needed)
+    :param tiles: padded tile of every channel, None for the channels that are done
+    :param done: whether each unit of the journal is done (one per channel, or only the shard)
+    :param existing: names of the patches written before an interruption of a unit that is not done, not written again
+    :return: [(unit, checksum)] of the units written
+    """
+    if shards:
+        if done[0]:
+            return []
+        if len(coords) == 0:
+            return [(uabPatchShards.shardUnit, 0)]
+        return [(uabPatchShards.shardUnit, uabPatchShards.writeShard(directory, tilename, tiles, coords, cSize, fileExts))]
+    checksums = []
+    for ext, tile, isDone in zip(fileExts, tiles, done):
+        if isDone:
+            continue
+        checksum = 0
+        for y, x in coords:
+            chipDat = tile[y:y + cSize[0], x:x + cSize[1]]
+            checksum = uabBlockJournal.arrayChecksum(chipDat, checksum)
+            finNm = tilename + '_y%dx%d_%s' % (y, x, ext)
+            if finNm not in existing:
+                util_functions.uabUtilAllTypeSave(os.path.join(directory, finNm), chipDat)
+        checksums.append((ext, checksum))
+    return checksums
+
+def selectPatchesWorker(args):
+    """
+    Pool worker of uabPatchExtr.extractSelected(): load the padded tiles of a tile, select its locations & write the
+    patches of those only
+    :param args: (tile, sources of the channels, pad, coords, cSize, directory, extensions, shards, done, existing,
+                 select), with select(tiles, coords, cSize) -> (selected coords, tiles to cut the patches from) a
+                 picklable function & existing the names of the patches of the tile in the directory
+    :return: (tile, selected coords, [(unit, checksum)])
+    """
+    tilename, sources, pad, coords, cSize, directory, fileExts, shards, done, existing, select = args
+    tiles = [loadTileSource(source, pad) for source in sources]
+    selected, tiles = select(tiles, coords, cSize)
+    if not shards:
+        tiles = [None if isDone else tile for tile, isDone in zip(tiles, done)]
+    return tilename, selected, writeTilePatches(directory, tilename, tiles, selected, cSize, fileExts, shards, done,
+                                                existing)
+
 class uabPatchExtr(uabBlock):
     
     fname = 'fileList.txt'
     #verbStep = 10
     
+    # the number of threads doesn't change the patches
+    nonResultParams = uabBlock.nonResultParams + ['nThreads']
+
     def __init__(self, runChannels, name='Reg', cSize=(224,224), numPixOverlap=0, pad=0, extSave=None,
-                 isTrain=False, gtInd=-1):
+                 isTrain=False, gtInd=-1, nThreads=None, shards=False):
         super(uabPatchExtr, self).__init__(runChannels, name)
+        # threads that encode & write the patches
+        self.nThreads = min(8, multiprocessing.cpu_count()) if nThreads is None else nThreads
         #chip size
         self.chipExtrSize = cSize
         #numPixOverlap -> number of pixels to overlap the patches by.  If = 0, then extract tiles such that the first patch starts on row 1 and the final patch ends on the final row (& dito for columns)
@@ -49,6 +158,8 @@ class uabPatchExtr(uabBlock):
         self.saveExts = extSave
         self.isTrain = isTrain
         self.gtInd = gtInd
+        # shards -> write one shard per tile instead of one file per patch
+        self.shards = shards
     
     def extrName(self):
         return ''
@@ -61,10 +172,17 @@ class uabPatchExtr(uabBlock):
         else:
             strName = ''
                 
+        if self.shards:
+            strName += '_shard'
+                
         return 'chipExtr%s_cSz%dx%d_pad%d%s' % (self.name, self.chipExtrSize[0], self.chipExtrSize[1], self.pad, strName)
     
     def getDirectoryPaths(self, colObj):
         return uabBlock.getBlockDir(os.path.join(uabBlockparent.outputDirs['patchExt'], colObj.colName, self.algoName()))
+
+    def getInputs(self):
+        #streamed preprocessing blocks in runChannels read their own inputs
+        return uabPreprocClasses.getChannelInputs(self.runChannels)
     
     def makeGrid(self, tileSz):
         #this function should be changed in the subclass if desired.
@@ -93,67 +211,204 @@ class uabPatchExtr(uabBlock):
         Y,X = np.meshgrid(patchGridY,patchGridX)
         return list(zip(Y.flatten(),X.flatten()))
 
-    def runAction(self, colObj):
-        # function to extract the chips from the tiles
-
-        gridList = self.makeGrid([colObj.tileSize[0]+self.pad, colObj.tileSize[1]+self.pad])
+    def getPatchViews(self, cIm):
+        # views[y, x] is the patch with its top left corner at (y, x), see getPatchViews()
+        return getPatchViews(cIm, self.chipExtrSize)
 
-        directory = self.getDirectoryPaths(colObj)
-        # extract chips for all the specified extensions
-
-        # precompute extensions
+    def getFileExts(self, colObj):
+        # extensions in the names of the patches of every channel
         fileExts = []
         for cnt, chanId in enumerate(self.runChannels):
-            ext, _ = colObj.getExtensionInfoById(chanId)
+            ext = uabPreprocClasses.getChannelExtension(colObj, chanId)
             if (self.saveExts is not None):
                 sExt = ext.split('.')
                 fileExts.append(sExt[0] + '.' + self.saveExts[cnt])
             else:
                 fileExts.append(ext)
+        return fileExts
+
+    def getTileSources(self, colObj, tilename):
+        # paths of the tiles of the channels, streamed channels are computed by a function (in this process)
+        sources = []
+        for chanId in self.runChannels:
+            if isinstance(chanId, uabPreprocClasses.uabPreprocClass):
+                sources.append(functools.partial(uabPreprocClasses.loadChannelTile, colObj, tilename, chanId, self.pad, cached=True))
+            else:
+                sources.append(colObj.getTilePath(tilename, chanId))
+        return sources
+
+    def extractSelected(self, colObj, select, nProc=None, tiles=None):
+        """
+        Extract the patches of the locations of the grid picked by select (see selectPatchesWorker()) from the tiles, in a
+        pool of processes over the tiles.  The locations are selected on the tiles before anything is written
+        :param tiles: tiles to extract from, defaults to colObj.dataListForRun.  The others are not loaded & get no patch
+        :return: (number of locations of the grid in all the tiles, number of selected locations)
+        """
+        tileSize = uabPreprocClasses.getChannelSize(colObj, colObj.dataListForRun[0], self.runChannels[0])
+        gridList = self.makeGrid([tileSize[0]+self.pad, tileSize[1]+self.pad])
+        coords = [(int(coordList[0]), int(coordList[1])) for coordList in gridList]
 
-        f_temp = []
-        for i in range(len(fileExts)):
-            f_temp.append([])
-        for ind, tilename in enumerate(tqdm(colObj.dataListForRun)):
+        directory = self.getDirectoryPaths(colObj)
+        fileExts = self.getFileExts(colObj)
+        units = [uabPatchShards.shardUnit] if self.shards else fileExts
+
+        # the tiles whose units are all in the journal are not loaded, their selected locations are the ones of their
+        # shard or of their patches in the directory (listed once)
+        journal = self.getJournal(colObj)
+        existing = {}
+        for name in os.listdir(directory):
+            m = uabPatchShards.namePattern.match(name)
+            if m is not None:
+                existing.setdefault(m.group(1), set()).add(name)
+        order = dict((loc, cnt) for cnt, loc in enumerate(coords))
+        jobs = []
+        runTiles = set(colObj.dataListForRun if tiles is None else tiles)
+        tiles = []
+        selected = {}
+        for tilename in colObj.dataListForRun:
             if self.isTrain:
-                # check if gt exists for this tile
-                try:
-                    colObj.loadTileDataByExtension(tilename, self.runChannels[self.gtInd])
-                except IOError:
-                    # skip this if there's not enough channels
+                # check if gt exists for this tile, skip this if there's not enough channels
+                if not uabPreprocClasses.hasChannelTile(colObj, tilename, self.runChannels[self.gtInd]):
                     continue
-            for cnt, (ext, chanId) in enumerate(zip(fileExts, self.runChannels)):
-                cIm = colObj.loadTileDataByExtension(tilename, chanId)
-                if self.pad > 0:
-                    cIm = np.pad(cIm, ((self.pad, self.pad), (self.pad, self.pad)), 'symmetric')
-                nDims = cIm.shape
-                for coordList in gridList:
-                    # extract patches for all the channels at coordinate location.
-                    # This is done so that the file containing patch names can have all
-                    # the extracted patches of one location on a single line
-                    x1 = int(coordList[0])
-                    x2 = int(coordList[1])
-                    finNm = tilename + '_y%dx%d_%s' % (x1, x2, ext)
-
-                    fPath = os.path.join(directory, finNm)
-                    isExt = util_functions.read_or_new_pickle(fPath, toLoad=0)
-                    if (isExt == 0):
-                        # extract a patch from the image
-                        if (len(nDims) == 2):
-                            chipDat = cIm[x1:x1 + self.chipExtrSize[0], x2:x2 + self.chipExtrSize[1]]
-                        else:
-                            chipDat = cIm[x1:x1 + self.chipExtrSize[0], x2:x2 + self.chipExtrSize[1], :]
+            tiles.append(tilename)
+            if tilename not in runTiles:
+                selected[tilename] = []
+                continue
+            done = [journal.isDone(tilename, unit) for unit in units]
+            if all(done):
+                if self.shards:
+                    selected[tilename] = uabPatchShards.getShardCoords(directory, tilename)
+                else:
+                    names = existing.get(tilename, set())
+                    locs = set([uabPatchShards.parsePatchName(name)[1:3] for name in names if name.endswith('_' + fileExts[0])])
+                    selected[tilename] = sorted(locs, key=order.get)
+                continue
+            jobs.append((tilename, self.getTileSources(colObj, tilename), self.pad, coords, self.chipExtrSize, directory,
+                         fileExts, self.shards, done, existing.get(tilename, set()), select))
+
+        # streamed channels need the collection, their tiles are made in this process
+        if any([isinstance(chanId, uabPreprocClasses.uabPreprocClass) for chanId in self.runChannels]):
+            nProc = 1
+        for tilename, tileCoords, checksums in self.mapTiles(selectPatchesWorker, jobs, nProc):
+            selected[tilename] = tileCoords
+            for unit, checksum in checksums:
+                journal.record(tilename, unit, checksum)
+
+        # rows in the order of the tiles of the collection
+        manifest = uabPatchManifest.uabPatchManifestWriter(directory, uabPatchExtr.fname, fileExts)
+        try:
+            for tilename in tiles:
+                manifest.addTile(tilename, selected[tilename])
+            manifest.close()
+        except BaseException:
+            manifest.abort()
+            raise
+        return len(coords) * len(tiles), sum([len(tileCoords) for tileCoords in selected.values()])
+
+    def runAction(self, colObj):
+        # function to extract the chips from the tiles
 
-                        util_functions.read_or_new_pickle(fPath, toSave=1, variable_to_save=chipDat)
+        tileSize = uabPreprocClasses.getChannelSize(colObj, colObj.dataListForRun[0], self.runChannels[0])
+        gridList = self.makeGrid([tileSize[0]+self.pad, tileSize[1]+self.pad])
 
-                    f_temp[cnt].append(finNm)
+        directory = self.getDirectoryPaths(colObj)
+        # extract chips for all the specified extensions
 
-            with open(os.path.join(directory, uabPatchExtr.fname), 'w') as file:
-                for i in range(len(f_temp[0])):
-                    s = []
-                    for j in range(len(f_temp)):
-                        s.append(f_temp[j][i])
-                    file.write('{}\n'.format(' '.join(s)))
+        # precompute extensions
+        fileExts = self.getFileExts(colObj)
+
+        # (tile, channel) units done before an interruption are in the journal, their patches are not checked again
+        journal = self.getJournal(colObj)
+        # patches written before an interruption of a unit that is not in the journal, listed once instead of a stat per patch
+        existing = set(os.listdir(directory))
+        coords = [(int(coordList[0]), int(coordList[1])) for coordList in gridList]
+
+        # the rows of every tile are appended to the list as the tile is done, it is renamed into place at the end
+        manifest = uabPatchManifest.uabPatchManifestWriter(directory, uabPatchExtr.fname, fileExts)
+        # tile-major: all the channels of a tile are loaded once, the patches of a location are encoded & written together by a pool of threads
+        pool = ThreadPoolExecutor(self.nThreads)
+        try:
+            for ind, tilename in enumerate(tqdm(colObj.dataListForRun)):
+                if self.isTrain:
+                    # check if gt exists for this tile, skip this if there's not enough channels
+                    if not uabPreprocClasses.hasChannelTile(colObj, tilename, self.runChannels[self.gtInd]):
+                        continue
+                with uabBlockProfile.timeTile(tilename):
+                    if self.shards:
+                        # all the channels of the tile go in one shard, a single unit of the journal
+                        if not journal.isDone(tilename, uabPatchShards.shardUnit):
+                            tiles = [uabPreprocClasses.loadChannelTile(colObj, tilename, chanId, self.pad, cached=True) for chanId in self.runChannels]
+                            checksum = uabPatchShards.writeShard(directory, tilename, tiles, coords, self.chipExtrSize, fileExts)
+                            journal.record(tilename, uabPatchShards.shardUnit, checksum)
+                    else:
+                        todo = []
+                        for ext, chanId in zip(fileExts, self.runChannels):
+                            if not journal.isDone(tilename, ext):
+                                todo.append((ext, self.getPatchViews(uabPreprocClasses.loadChannelTile(colObj, tilename, chanId, self.pad, cached=True))))
+                        checksums = writePatchGroups(pool, directory, tilename, todo, coords, existing)
+                        for (ext, _), checksum in zip(todo, checksums):
+                            journal.record(tilename, ext, checksum)
+                manifest.addTile(tilename, coords)
+            manifest.close()
+        except BaseException:
+            manifest.abort()
+            raise
+        finally:
+            pool.shutdown()
+
+
+class uabPatchExtrVirtual(uabPatchExtr):
+    # writes the grid (fileList.txt & its sidecar) and the paths of the tiles, no patch.  Read the patches with uabPatchReaders.loadPatch()
+
+    # the patches read are the same whether the tiles are memory-mapped copies or not
+    nonResultParams = uabPatchExtr.nonResultParams + ['memmapTiles']
+
+    def __init__(self, runChannels, name='Virtual', cSize=(224,224), numPixOverlap=0, pad=0, extSave=None,
+                 isTrain=False, gtInd=-1, memmapTiles=True):
+        super(uabPatchExtrVirtual, self).__init__(runChannels, name, cSize, numPixOverlap, pad, extSave, isTrain, gtInd)
+        # memmapTiles -> point to copies of the tiles in the memory-map cache of the collection (transcoded now if needed) instead of the tiles
+        self.memmapTiles = memmapTiles
+
+    def extrName(self):
+        # the overlap only changes the grid, every grid gets its own directory
+        return 'ov%d' % self.numPixOverlap
+
+    def runAction(self, colObj):
+        for chanId in self.runChannels:
+            if isinstance(chanId, uabPreprocClasses.uabPreprocClass):
+                raise ValueError('Virtual extraction reads the tiles of the channels, %s is not saved' % chanId.getName())
+
+        tileSize = uabPreprocClasses.getChannelSize(colObj, colObj.dataListForRun[0], self.runChannels[0])
+        gridList = self.makeGrid([tileSize[0]+self.pad, tileSize[1]+self.pad])
+        coords = [(int(coordList[0]), int(coordList[1])) for coordList in gridList]
+        directory = self.getDirectoryPaths(colObj)
+
+        fileExts = self.getFileExts(colObj)
+
+        cache = colObj.memmapCache
+        if self.memmapTiles and cache is None:
+            cache = uabTileCache.uabTileMemmapCache(os.path.join(colObj.imDirectory, colObj.dataDirnames['meta']))
+        channels = dict((ext, {}) for ext in fileExts)
+        manifest = uabPatchManifest.uabPatchManifestWriter(directory, uabPatchExtr.fname, fileExts)
+        try:
+            for tilename in tqdm(colObj.dataListForRun):
+                if self.isTrain:
+                    # check if gt exists for this tile, skip this if there's not enough channels
+                    if not uabPreprocClasses.hasChannelTile(colObj, tilename, self.runChannels[self.gtInd]):
+                        continue
+                for ext, chanId in zip(fileExts, self.runChannels):
+                    path = colObj.getTilePath(tilename, chanId)
+                    if self.memmapTiles and not path.endswith('.npy'):
+                        dirn = colObj.getExtensionInfoById(chanId)[1]
+                        cache.load(path, dirn)
+                        path = cache.getCachePath(dirn, os.path.basename(path))
+                    channels[ext][tilename] = os.path.abspath(path)
+                manifest.addTile(tilename, coords)
+            uabPatchVirtual.saveMap(directory, self.chipExtrSize, self.pad, channels)
+            manifest.close()
+        except BaseException:
+            manifest.abort()
+            raise
 
 
 class uabPatchExtrRand(uabBlock):
@@ -161,9 +416,14 @@ class uabPatchExtrRand(uabBlock):
 
     # verbStep = 10
 
+    # the number of threads doesn't change the patches
+    nonResultParams = uabBlock.nonResultParams + ['nThreads']
+
     def __init__(self, runChannels, name='Rand', cSize=(224, 224), numPerTile=100, pad=0, extSave=None,
-                 isTrain=False, gtInd=-1):
+                 isTrain=False, gtInd=-1, shards=False, nThreads=None):
         super(uabPatchExtrRand, self).__init__(runChannels, name)
+        # threads that encode & write the patches
+        self.nThreads = min(8, multiprocessing.cpu_count()) if nThreads is None else nThreads
         # chip size
         self.chipExtrSize = cSize
         self.numPerTile = numPerTile
@@ -172,6 +432,8 @@ class uabPatchExtrRand(uabBlock):
         self.saveExts = extSave
         self.isTrain = isTrain
         self.gtInd = gtInd
+        # shards -> write one shard per tile instead of one file per patch
+        self.shards = shards
 
     def extrName(self):
         return ''
@@ -183,6 +445,8 @@ class uabPatchExtrRand(uabBlock):
             strName = '_' + strName
         else:
             strName = ''
+        if self.shards:
+            strName += '_shard'
 
         return 'chipExtr%s_cSz%dx%d_pad%d%s' % (
         self.name, self.chipExtrSize[0], self.chipExtrSize[1], self.pad, strName)
@@ -191,6 +455,9 @@ class uabPatchExtrRand(uabBlock):
         return uabBlock.getBlockDir(
             os.path.join(uabBlockparent.outputDirs['patchExt'], colObj.colName, self.algoName()))
 
+    def getInputs(self):
+        return uabPreprocClasses.getChannelInputs(self.runChannels)
+
     def makeGrid(self, tileSz, numPerTile):
         # this function should be changed in the subclass if desired.
         # Default behavior is to extract chips at fixed locations.
@@ -201,17 +468,19 @@ class uabPatchExtrRand(uabBlock):
         maxIm0 = tileSz[0] - self.chipExtrSize[0]
         maxIm1 = tileSz[1] - self.chipExtrSize[1]
 
+        # rows from the bound of the rows & columns from the bound of the columns, patches of non-square tiles fit
         patchGridX = []
         patchGridY = []
         for i in range(numPerTile):
-            patchGridX.append(np.random.randint(maxIm0))
-            patchGridY.append(np.random.randint(maxIm1))
+            patchGridX.append(np.random.randint(maxIm1))
+            patchGridY.append(np.random.randint(maxIm0))
         return list(zip(patchGridY, patchGridX))
 
     def runAction(self, colObj):
         # function to extract the chips from the tiles
 
-        gridList = self.makeGrid([colObj.tileSize[0] + self.pad, colObj.tileSize[1] + self.pad], self.numPerTile)
+        tileSize = uabPreprocClasses.getChannelSize(colObj, colObj.dataListForRun[0], self.runChannels[0])
+        gridList = self.makeGrid([tileSize[0] + self.pad, tileSize[1] + self.pad], self.numPerTile)
 
         directory = self.getDirectoryPaths(colObj)
         # extract chips for all the specified extensions
@@ -219,53 +488,60 @@ class uabPatchExtrRand(uabBlock):
         # precompute extensions
         fileExts = []
         for cnt, chanId in enumerate(self.runChannels):
-            ext, _ = colObj.getExtensionInfoById(chanId)
+            ext = uabPreprocClasses.getChannelExtension(colObj, chanId)
             if (self.saveExts is not None):
                 sExt = ext.split('.')
                 fileExts.append(sExt[0] + '.' + self.saveExts[cnt])
             else:
                 fileExts.append(ext)
 
-        f_temp = []
-        for i in range(len(fileExts)):
-            f_temp.append([])
-        for ind, tilename in enumerate(tqdm(colObj.dataListForRun)):
-            if self.isTrain:
-                # check if gt exists for this tile
-                try:
-                    colObj.loadTileDataByExtension(tilename, self.runChannels[self.gtInd])
-                except IOError:
-                    # skip this if there's not enough channels
-                    continue
-            for cnt, (ext, chanId) in enumerate(zip(fileExts, self.runChannels)):
-                cIm = colObj.loadTileDataByExtension(tilename, chanId)
-                if self.pad > 0:
-                    cIm = np.pad(cIm, ((self.pad, self.pad), (self.pad, self.pad)), 'symmetric')
-                nDims = cIm.shape
-                for coordList in gridList:
-                    # extract patches for all the channels at coordinate location.
-                    # This is done so that the file containing patch names can have all
-                    # the extracted patches of one location on a single line
-                    x1 = int(coordList[0])
-                    x2 = int(coordList[1])
-                    finNm = tilename + '_y%dx%d_%s' % (x1, x2, ext)
-
-                    fPath = os.path.join(directory, finNm)
-                    isExt = util_functions.read_or_new_pickle(fPath, toLoad=0)
-                    if (isExt == 0):
-                        # extract a patch from the image
-                        if (len(nDims) == 2):
-                            chipDat = cIm[x1:x1 + self.chipExtrSize[0], x2:x2 + self.chipExtrSize[1]]
+        # (tile, channel) units or shards written before an interruption are in the journal
+        journal = self.getJournal(colObj)
+        coords = [(int(coordList[0]), int(coordList[1])) for coordList in gridList]
+        # the random locations of the units written before an interruption are only in the names of their patches,
+        # the directory is listed once
+        existing = set(os.listdir(directory))
+        written = {}
+        if not self.shards:
+            for name in existing:
+                m = uabPatchShards.namePattern.match(name)
+                if m is not None:
+                    written.setdefault((m.group(1), m.group(4)), []).append((int(m.group(2)), int(m.group(3))))
+
+        manifest = uabPatchManifest.uabPatchManifestWriter(directory, uabPatchExtr.fname, fileExts)
+        # tile-major like uabPatchExtr: all the channels of a tile are loaded once, its patches are written by a pool of threads
+        pool = ThreadPoolExecutor(self.nThreads)
+        try:
+            for ind, tilename in enumerate(tqdm(colObj.dataListForRun)):
+                if self.isTrain:
+                    # check if gt exists for this tile, skip this if there's not enough channels
+                    if not uabPreprocClasses.hasChannelTile(colObj, tilename, self.runChannels[self.gtInd]):
+                        continue
+                with uabBlockProfile.timeTile(tilename):
+                    if self.shards:
+                        if journal.isDone(tilename, uabPatchShards.shardUnit):
+                            # the random locations of a shard written before an interruption
+                            tileCoords = uabPatchShards.getShardCoords(directory, tilename)
                         else:
-                            chipDat = cIm[x1:x1 + self.chipExtrSize[0], x2:x2 + self.chipExtrSize[1], :]
-
-                        util_functions.read_or_new_pickle(fPath, toSave=1, variable_to_save=chipDat)
-
-                    f_temp[cnt].append(finNm)
-
-            with open(os.path.join(directory, uabPatchExtr.fname), 'w') as file:
-                for i in range(len(f_temp[0])):
-                    s = []
-                    for j in range(len(f_temp)):
-                        s.append(f_temp[j][i])
-                    file.write('{}\n'.format(' '.join(s)))
+                            tileCoords = coords
+                            tiles = [uabPreprocClasses.loadChannelTile(colObj, tilename, chanId, self.pad, cached=True) for chanId in self.runChannels]
+                            checksum = uabPatchShards.writeShard(directory, tilename, tiles, coords, self.chipExtrSize, fileExts)
+                            journal.record(tilename, uabPatchShards.shardUnit, checksum)
+                    else:
+                        # the channels that are not done yet get the locations of the ones that are
+                        doneExts = [ext for ext in fileExts if journal.isDone(tilename, ext)]
+                        tileCoords = sorted(written.get((tilename, doneExts[0]), [])) if doneExts else coords
+                        todo = []
+                        for ext, chanId in zip(fileExts, self.runChannels):
+                            if ext not in doneExts:
+                                todo.append((ext, getPatchViews(uabPreprocClasses.loadChannelTile(colObj, tilename, chanId, self.pad, cached=True), self.chipExtrSize)))
+                        checksums = writePatchGroups(pool, directory, tilename, todo, tileCoords, existing)
+                        for (ext, _), checksum in zip(todo, checksums):
+                            journal.record(tilename, ext, checksum)
+                manifest.addTile(tilename, tileCoords)
+            manifest.close()
+        except BaseException:
+            manifest.abort()
+            raise
+        finally:
+            pool.shutdown()
@@ -23,14 +23,21 @@ server/
                 preproc_result1/
                     [In the preproc object, both a postfix & an extension are specified to append to the tilename during this action]
                     TileName_preprocExtension.extension
+                    [extensions ending with .chk are directories of compressed chunks that can be read window-by-window, see uabChunkStore]
                 preproc_result2/
         meta_data/
+            collection.db
+                store (SQLite) that is updated each time a new channel is made using preprocessing, see uabCollectionStore
             collection.txt
-                file that is updated each time a new channel is made using preprocessing
+                human readable listing of collection.db
             colTileNames.txt
                 file that contains the name of each tile in the collection without extensions
-            mean_values.npy
-                file that contains the mean value of each channel
+            manifest.pkl
+                shape, dtype, size & mtime of every tile file, see uabTileManifest
+            tile_cache/
+                uncompressed .npy copies of the tiles, only made if the collection is opened with memmapCache=True
+            meta.npy
+                file that contains the statistics (mean, std, min, max, histogram) of each channel, see uabTileStats
         
         collectionMeta.txt
             a user-made file that specifies information of interest about this collection (e.g., data-resolution)
@@ -43,11 +50,10 @@ Future work:
 """
 
 
-import os, glob, pickle
+import os, pickle
 import numpy as np
-from tqdm import tqdm
 import uabRepoPaths
-import util_functions, uabPreprocClasses
+import util_functions, uabPreprocClasses, uabTileStats, uabTileManifest, uabTileCache, uabCollectionStore
 
 class uabCollection(object):
     
@@ -59,13 +65,36 @@ class uabCollection(object):
     tileNamesFile = 'colTileNames.txt'
     metaInfoFile = 'meta.npy'                       # file to store all meta information
     
-    def __init__(self, colN, splitChans = 1):
+    #default budget of the in-memory tile cache
+    cacheBytes = 2 * 1024**3
+
+    def __init__(self, colN, splitChans = 1, memmapCache = False, cacheBytes = None):
         #full path to data directory
         self.colName = colN
         self.imDirectory = os.path.join(uabRepoPaths.dataPath, self.colName)
         
         #make the meta-data directory
         util_functions.uabUtilMakeDirectoryName(os.path.join(self.imDirectory, uabCollection.dataDirnames['meta']))
+
+        #shapes, dtypes & mtimes of all the tile files.  Use this rather than loading a tile to learn about it
+        self.manifest = uabTileManifest.uabTileManifest(os.path.join(self.imDirectory, uabCollection.dataDirnames['data']),
+                                                        os.path.join(self.imDirectory, uabCollection.dataDirnames['meta']))
+
+        #extensions, directories & block states of this collection (replaces reading collection.txt)
+        self.store = uabCollectionStore.uabCollectionStore(os.path.join(self.imDirectory, uabCollection.dataDirnames['meta']),
+                                                           legacyFile=self.getMetadataTiles())
+
+        #if set, tiles are transcoded once to .npy in the meta-data directory & loaded as memory maps afterwards
+        if(memmapCache):
+            self.memmapCache = uabTileCache.uabTileMemmapCache(os.path.join(self.imDirectory, uabCollection.dataDirnames['meta']))
+        else:
+            self.memmapCache = None
+
+        #set by uabPipeline while it runs blocks: the outputs of the blocks are registered by the pipeline, not by the blocks
+        self.deferExtensions = False
+
+        #decoded tiles shared by all the blocks that run on this collection object, keyed by (tile, ext, directory)
+        self.tileCache = uabTileCache.uabTileLRUCache(uabCollection.cacheBytes if cacheBytes is None else cacheBytes)
         
         #list of the names of tiles for this collection.  DO NOT MODIFY
         self.tileList = self.getImLists('orig')
@@ -82,8 +111,7 @@ class uabCollection(object):
         self.setExtensions(splitChans)
         
         #get tile size
-        im = self.loadTileDataByExtension(self.tileList[0], 0)
-        self.tileSize = im.shape
+        self.tileSize = self.getTileShape(self.tileList[0], 0)
         
         #get tile tile-mean
         #self.colMean = self.computeTrainingMean()
@@ -92,35 +120,31 @@ class uabCollection(object):
     
     def getImLists(self, colDir = 'orig', forcerun = 0):
         #returns the name of all the tiles in the dataDirectory.  Removes extensions
+        #set forcerun = 1 to remake the list from the current content of the directory
         colFileName = os.path.join(self.imDirectory, uabCollection.dataDirnames['meta'], uabCollection.tileNamesFile)
-        if(os.path.exists(colFileName) or forcerun == 1):
+        if(os.path.exists(colFileName) and forcerun == 0):
             with open(colFileName, 'r') as file:
                 return [a.strip() for a in file.readlines()]
         else:
-            filenames = glob.glob(os.path.join(self.imDirectory, uabCollection.dataDirnames['data'], uabCollection.colDirnames[colDir], '*.*'))
-            tilenames = sorted(list(set(['_'.join(a.split(os.sep)[-1].split('_')[:-1]) for a in filenames])))
+            tilenames = self.manifest.getTileNames(uabCollection.colDirnames[colDir])
             with open(colFileName, 'w') as file:
                 file.write('\n'.join(tilenames))
             
             return tilenames
     
     def getMetadataTiles(self, readcontents = 0):
-        # returns path for the metadata of all the tiles.
-        # set readcontents = 1 if you want to load the information otherwise returns path
+        # returns path for the (human readable listing of the) metadata of all the tiles.
+        # set readcontents = 1 if you want to load the information [extension, directory, description] from the store otherwise returns path
         metDatPath = os.path.join(self.imDirectory, uabCollection.dataDirnames['meta'],uabCollection.metaFilename)
         if(readcontents == 1):
-            with open(metDatPath) as f:
-                datLines = f.readlines()
-                linesByTabs = [line.split('\t') for line in datLines if len(line) > 0]
-            return linesByTabs
+            return [list(a) for a in self.store.getExtensions()]
         else:
             return metDatPath
     
     def setExtensions(self, doSplit=1):
-        #function that reads the meta-data file to get all the processed tiles and outputs a dictionary that associates preproc names to extensions
-        #if that file doesn't exist, it is made here
-        metFileName = self.getMetadataTiles()
-        if os.path.exists(metFileName):
+        #function that reads the meta-data store to get all the processed tiles and outputs a dictionary that associates preproc names to extensions
+        #if the store is empty, it is filled here
+        if self.store.hasExtensions():
             metaContents = self.getMetadataTiles(readcontents=1)
             exts = [a[:2] for a in metaContents]
             self.extensions = {}
@@ -130,10 +154,8 @@ class uabCollection(object):
         else:
             #this file doesn't exist & the RGB mapping hasn't happened yet so call that here.  If there are additional files to RGB, those remained in Original_Tiles until futher notice and should be specified as such here
             #(1) get all the extensions in the original directory
-            allFileTypes = glob.glob(os.path.join(self.imDirectory, uabCollection.dataDirnames['data'], uabCollection.colDirnames['orig'],  self.tileList[0]+'*'))
-
             # make RGB channel at the first place
-            exts = list(set([a.split('_')[-1] for a in allFileTypes]))
+            exts = list(set(self.manifest.getExtensions(uabCollection.colDirnames['orig'], self.tileList[0])))
             for ext_ in exts:
                 if 'RGB' in ext_ or 'rgb' in ext_:
                     idx = exts.index(ext_)
@@ -152,14 +174,14 @@ class uabCollection(object):
                 kk = list(self.extensions.keys())
                 allChans = list(range(len(kk)))
                 for chanId in allChans:
-                    data = self.loadTileDataByExtension(self.tileList[0], chanId)
-                    if(len(data.shape) == 3):
-                        #this input is multi-channel so split it.  This also takes care of writing to the meta data file
+                    shape = self.getTileShape(self.tileList[0], chanId)
+                    if(len(shape) == 3):
+                        #this input is multi-channel so split it.  Each tile is decoded once for all the channels.  This also takes care of writing to the meta data file
                         extParts = kk[chanId].split('.')
-                        for c in range(data.shape[-1]):
-                            extPref = extParts[0] + str(c) + '.' + extParts[1]
-                            splitObj = uabPreprocClasses.uabPreprocSplit(chanId, extPref , 'Channel %s Layer %d' % (extParts[0], c), c)
-                            splitObj.run(self, forcerun=1)
+                        extPrefs = [extParts[0] + str(c) + '.' + extParts[1] for c in range(shape[-1])]
+                        descrs = ['Channel %s Layer %d' % (extParts[0], c) for c in range(shape[-1])]
+                        splitObj = uabPreprocClasses.uabPreprocSplitAll(chanId, extPrefs, descrs)
+                        splitObj.run(self, forcerun=1)
                     else:
                         extName = kk[chanId]
                         extLocation = self.extensions[extName]
@@ -170,67 +192,154 @@ class uabCollection(object):
     
     def readMetadata(self):
         #call this function to get a human readable output of the meta-data relating to the tiles that have been preprocessed
-        metFileName = self.getMetadataTiles()
-        if os.path.exists(metFileName):
-            metaContents = self.getMetadataTiles(readcontents=1)
+        if self.store.hasExtensions():
+            metaContents = self.refreshExtensions()
             print('Description:  these are all the preprocessed tiles available for this dataset.  Use the indexes output on the start of each line to select this tile-type when going to patch extraction in the following step')
-            self.extDS = []
-            self.extensions = {}
             for cnt, a in enumerate(metaContents):
-                self.extensions[a[0]] = a[1]
-                self.extDS.append([a[0], a[1]])
                 print(('[%d] %s: %s, [ext: %s]' % (cnt, a[2].strip(), a[1].strip(), a[0].strip())))
         else:
             print('This file has not yet been created')
     
+    def refreshExtensions(self):
+        #reload the mapping of extension ids from the store, e.g., after other processes registered extensions
+        #returns the [extension, directory, description] of every id
+        metaContents = self.getMetadataTiles(readcontents=1)
+        self.extDS = []
+        self.extensions = {}
+        for a in metaContents:
+            self.extensions[a[0]] = a[1]
+            self.extDS.append([a[0], a[1]])
+        return metaContents
+    
+    def __getstate__(self):
+        #the cached tiles are not sent to other processes.  They get an empty cache with a share of the budget, split
+        #between the processes of the pool that this is pickled for (see uabTileCache.sharedBetween())
+        state = dict(self.__dict__)
+        state['tileCache'] = self.tileCache.getWorkerCache()
+        return state
+    
     def setMetadataFile(self, updString):
-        #update the metadata file
-        metFileName = self.getMetadataTiles()
-        with open(metFileName,'a+') as file:
-            file.write(updString)
+        #update the metadata store.  updString holds one or more lines of "extension\tdirectory\tdescription"
+        #registering an extension that exists already only updates its description
+        if self.deferExtensions:
+            #a uabPipeline is running the blocks, it registers their outputs once they are done
+            return
+        for line in updString.split('\n'):
+            a = line.split('\t')
+            if(len(a) >= 2):
+                self.store.registerExtension(a[0], a[1], a[2] if len(a) > 2 else '')
+
+    def getExtensionIdByName(self, ext, dirn=None):
+        #id of an extension (e.g., 'GT_Divide.tif'), None if it doesn't exist
+        return self.store.getExtensionId(ext, dirn)
             
     def getExtensionInfoById(self, extId):
         #From the meta-data list, get the extension that corresponds to the number extId
         #output: extension, path to extension data
         return self.extDS[extId][0], self.extDS[extId][1]
     
-    def loadTileDataByExtension(self, tile, extId):
+    def loadTileDataByExtension(self, tile, extId, cached=False):
         #specify extension ID according to the meta data
+        #with the memory-map cache enabled, the tile is a read-only np.memmap (nothing is read into memory until it is
+        #used), callers that modify the tile copy it first
+        #cached -> return the array shared through the tile cache without copying it, it is read-only.  By default the
+        #caller gets its own copy that it can modify
         ext, dirn = self.getExtensionInfoById(extId)
         tileDataPath = self.getDataNameByTile(dirn, tile, ext)
-        return util_functions.uabUtilAllTypeLoad(tileDataPath)
+        if(self.memmapCache is not None):
+            return self.memmapCache.load(tileDataPath, dirn)
+        key = (tile, ext, dirn)
+        data = self.tileCache.get(key)
+        if(data is None):
+            data = util_functions.uabUtilAllTypeLoad(tileDataPath)
+            if not cached:
+                #the cache keeps the decoded array, the caller gets it writable if it doesn't fit in the cache anyway
+                if data.nbytes > self.tileCache.maxBytes:
+                    return data
+                self.tileCache.put(key, data.copy())
+                return data
+            data = self.tileCache.put(key, data)
+        return data if cached else data.copy()
+
+    def hasTileData(self, tile, extId):
+        #check whether the data of a tile exists (from the manifest, nothing is loaded)
+        return self.getTileRecord(tile, extId) is not None
+
+    def invalidateTileCache(self, dirn):
+        #forget the cached tiles of a directory, call this when its files are rewritten
+        self.tileCache.invalidate(lambda key: key[2] == dirn)
     
+    def loadTileWindow(self, tile, extId, y, x, h, w):
+        #load the window [y:y+h, x:x+w] of a tile by the extension ID, decoding only that region when the format allows
+        #parts of the window outside of the tile are symmetrically padded, e.g., y = x = -pad gives the padded tile
+        ext, dirn = self.getExtensionInfoById(extId)
+        tileDataPath = self.getDataNameByTile(dirn, tile, ext)
+        if(self.memmapCache is not None):
+            return util_functions.uabUtilWindowFromArray(self.memmapCache.load(tileDataPath, dirn), y, x, h, w)
+        return util_functions.uabUtilAllTypeWindowLoad(tileDataPath, y, x, h, w)
+
+    def loadTilePadded(self, tile, extId, pad, cached=False):
+        #load a whole tile with symmetric padding of pad pixels on every side (cached: see loadTileDataByExtension())
+        if(pad == 0):
+            return self.loadTileDataByExtension(tile, extId, cached)
+        shape = self.getTileShape(tile, extId)
+        return self.loadTileWindow(tile, extId, -pad, -pad, shape[0] + 2 * pad, shape[1] + 2 * pad)
+
     def getDataNameByTile(self, dirn, tileName, ext):
         #convenience function to associate tile name with corresponding data
         return os.path.join(self.imDirectory, uabCollection.dataDirnames['data'], dirn, tileName + '_' + ext)
 
+    def getTilePath(self, tile, extId):
+        #full path of the data of a tile by the extension ID
+        ext, dirn = self.getExtensionInfoById(extId)
+        return self.getDataNameByTile(dirn, tile, ext)
+
+    def getTileRecord(self, tile, extId):
+        #manifest record (shape, dtype, nbytes, mtime, ...) of the data of a tile by the extension ID, None if missing
+        ext, dirn = self.getExtensionInfoById(extId)
+        return self.manifest.getRecord(dirn, tile, ext)
+
+    def getTileShape(self, tile, extId):
+        #shape of the data of a tile, read from the manifest
+        rec = self.getTileRecord(tile, extId)
+        if rec is None:
+            raise IOError('Problem loading this data tile')
+        return rec['shape']
+
     def getChannelMeans(self, extId):
         """
-        Get means of channels given by extension ids, metainfo has to exist for this function
+        Get means of channels given by extension ids, answered from the statistics cached in meta.npy.  Statistics of
+        channels or tiles that are not in the cache yet are computed first
         :param extId: id of extensions to calculate channel mean, can be a int or list
         :return: np array of meta data
         """
-        metaInfoName = os.path.join(self.imDirectory, uabCollection.dataDirnames['meta'], uabCollection.metaInfoFile)
-        if not os.path.exists(metaInfoName):
-            self.getMetaDataInfo(extId)
-        means = np.zeros(len(extId))
-
-        with open(metaInfoName, 'rb') as f:
-            meta = pickle.load(f)
-        mean_info = meta['mean']
+        if type(extId) is not list:
+            extId = [extId]
+        stats = self.getChannelStats(extId)
+        return np.array([stats[eid]['mean'] for eid in extId])
 
-        for cnt, eid in enumerate(extId):
-            means[cnt] = mean_info[eid]
-
-        return means
+    def getChannelStats(self, extId, nProc=None):
+        """
+        Get the statistics (count, mean, std, min, max, hist, hist_edges) of channels given by extension ids
+        :param extId: id of extensions, can be a int or list
+        :param nProc: number of worker processes, defaults to the number of cpus
+        :return: a dictionary of statistics with extension ids as keys
+        """
+        if type(extId) is not list:
+            extId = [extId]
+        meta = self.getMetaDataInfo(extId, nProc=nProc)
+        return {eid: meta['stats'][self.getExtensionInfoById(eid)[0]] for eid in extId}
 
-    def getMetaDataInfo(self, extId, class_info='background,building', forcerun=False):
+    def getMetaDataInfo(self, extId, class_info='background,building', forcerun=False, nProc=None):
         """
         Write info to meta.npy, meta data include tile numbers; city list; class num; class info, tile dimension,
-        and channel means
-        :param extId: id of extensions to calculate channel mean, can be a int or list
+        and channel statistics.  The per-tile partial statistics are kept in the file so only tiles and channels that
+        are not in there yet get processed (see uabTileStats).  Tiles are read once, except for float channels computed
+        for the first time: their histogram range is the collection min & max, so they are read again for the histograms
+        :param extId: id of extensions to calculate channel statistics, can be a int or list
         :param class_info: description of classes, split by ','
         :param forcerun: if True, the meta file will be remade
+        :param nProc: number of worker processes, defaults to the number of cpus
         :return: a dictionary of meta data
         """
         metaInfoName = os.path.join(self.imDirectory, uabCollection.dataDirnames['meta'], uabCollection.metaInfoFile)
@@ -240,45 +349,128 @@ class uabCollection(object):
                 meta = pickle.load(f)
         else:
             meta = {}
-            # get tile numbers
-            tile_names = self.getImLists()
-            tile_num = len(tile_names)
-            meta['tile_num'] = tile_num
-
-            # get city list
-            from string import digits
-            remove_digits = str.maketrans('', '', digits)
-            city_names = [s.translate(remove_digits) for s in tile_names]
-            city_names = list(set(city_names))
-            meta['city_names'] = city_names
-
             # get class num and class info
             class_info = class_info.split(',')
-            class_num = len(class_info)
-            meta['class_num'] = class_num
+            meta['class_num'] = len(class_info)
             meta['class_info'] = class_info
+        for key in ['mean', 'stats', 'tile_stats', 'hist_range']:
+            meta.setdefault(key, {})
+
+        # get tile numbers
+        tile_names = self.getImLists()
+        meta['tile_num'] = len(tile_names)
+
+        # get city list
+        from string import digits
+        remove_digits = str.maketrans('', '', digits)
+        meta['city_names'] = list(set([s.translate(remove_digits) for s in tile_names]))
 
-            # get channel mean
-            if type(extId) is not list:
-                extId = [extId]
-            means = {}
-            for ext in extId:
-                # load a tile to get shape info
-                img = self.loadTileDataByExtension(tile_names[0], ext)
-                shape_info = img.shape
-                assert len(shape_info) == 2
-                channel_mean = 0
-                for tile in tqdm(tile_names):
-                    img = self.loadTileDataByExtension(tile, ext)
-                    channel_mean += np.mean(img)
-                means[ext] = channel_mean/tile_num
-            meta['mean'] = means
+        # get channel statistics, only for the (tile, channel) pairs that are not cached yet
+        if type(extId) is not list:
+            extId = [extId]
+        extNames = {eid: self.getExtensionInfoById(eid)[0] for eid in extId}
+        jobList = []
+        for tile in tile_names:
+            jobs = []
+            for eid, extName in extNames.items():
+                if tile not in meta['tile_stats'].setdefault(extName, {}):
+                    jobs.append((extName, self.getTilePath(tile, eid), meta['hist_range'].get(extName), True))
+            if len(jobs) > 0:
+                jobList.append((tile, jobs))
+
+        if len(jobList) > 0:
+            results = uabTileStats.runStatsJobs(jobList, nProc, desc='Channel statistics')
+            for tile, res in results.items():
+                for extName, part in res.items():
+                    meta['tile_stats'][extName][tile] = part
+                    if extName not in meta['hist_range'] and part['hist'] is not None:
+                        meta['hist_range'][extName] = part['hist_range']
+
+            # float channels seen for the first time: second pass to histogram them over the collection range
+            eidByName = dict((v, k) for k, v in extNames.items())
+            histJobs = {}
+            for extName in extNames.values():
+                if extName in meta['hist_range']:
+                    continue
+                parts = meta['tile_stats'][extName]
+                lo = min([p['min'] for p in parts.values() if p['count'] > 0] + [np.inf])
+                hi = max([p['max'] for p in parts.values() if p['count'] > 0] + [-np.inf])
+                if lo > hi:
+                    continue
+                histRange = (float(lo), float(hi) if hi > lo else float(lo) + 1.0)
+                meta['hist_range'][extName] = histRange
+                for tile, p in parts.items():
+                    if p['count'] > 0 and p['hist'] is None:
+                        histJobs.setdefault(tile, []).append(
+                            (extName, self.getTilePath(tile, eidByName[extName]), histRange, False))
+            if len(histJobs) > 0:
+                results = uabTileStats.runStatsJobs(list(histJobs.items()), nProc, desc='Channel histograms')
+                for tile, res in results.items():
+                    for extName, part in res.items():
+                        meta['tile_stats'][extName][tile]['hist'] = part['hist']
+
+            for eid, extName in extNames.items():
+                parts = [meta['tile_stats'][extName][t] for t in tile_names if t in meta['tile_stats'][extName]]
+                meta['stats'][extName] = uabTileStats.summarizeStats(parts, meta['hist_range'].get(extName))
+                meta['mean'][eid] = meta['stats'][extName]['mean']
 
             # save file
             with open(metaInfoName, 'wb') as f:
                 pickle.dump(meta, f)
         return meta
 
+    def getClassCounts(self, extId, tiles=None, nProc=None, forcerun=False):
+        """
+        Get the number of pixels of every class in the ground truth tiles.  Counts are computed in a single pass per tile
+        (np.bincount) in a process pool and stored in the meta-data store, only new or modified tiles are recomputed
+        :param extId: id of the ground truth extension
+        :param tiles: tiles to get counts of, defaults to all the tiles
+        :param nProc: number of worker processes, defaults to the number of cpus
+        :param forcerun: if True, recompute all the counts
+        :return: dictionary {tile: np array of counts indexed by class value}, tiles without ground truth are left out
+        """
+        ext, dirn = self.getExtensionInfoById(extId)
+        if tiles is None:
+            tiles = self.tileList
+        stored = {} if forcerun else self.store.getClassCounts(ext, dirn)
+
+        jobs = []
+        mtimes = {}
+        for tile in tiles:
+            rec = self.getTileRecord(tile, extId)
+            if rec is None:
+                continue
+            mtimes[tile] = rec['mtime']
+            if tile not in stored or stored[tile][1] != rec['mtime']:
+                jobs.append((tile, self.getTilePath(tile, extId)))
+        if len(jobs) > 0:
+            results = uabTileStats.runTileJobs(uabTileStats.classCountWorker, jobs, nProc, desc='Class counts')
+            new = dict((tile, (counts, mtimes[tile])) for tile, counts in results.items() if counts is not None)
+            self.store.setClassCounts(ext, dirn, new)
+            stored.update(new)
+
+        tiles = [tile for tile in tiles if tile in mtimes and tile in stored]
+        nClass = max([len(stored[tile][0]) for tile in tiles] + [0])
+        counts = {}
+        for tile in tiles:
+            counts[tile] = np.zeros(nClass, dtype=np.int64)
+            counts[tile][:len(stored[tile][0])] = stored[tile][0]
+        return counts
+
+    def getClassProportions(self, extId, tiles=None, perTile=False):
+        """
+        Get the proportion of pixels of every class in the ground truth tiles (see getClassCounts())
+        :param extId: id of the ground truth extension
+        :param tiles: tiles to use, defaults to all the tiles
+        :param perTile: if True, return the proportions of each tile
+        :return: np array of proportions indexed by class value or {tile: proportions} if perTile
+        """
+        counts = self.getClassCounts(extId, tiles)
+        if perTile:
+            return dict((tile, c / max(c.sum(), 1)) for tile, c in counts.items())
+        total = np.sum(list(counts.values()), axis=0)
+        return total / max(total.sum(), 1)
+
     def getAllTileByDirAndExt(self, extId):
         """
         Return a list of tiles as well as the parent directory
@@ -324,68 +516,4 @@ class uabCollection(object):
         code = uabUtilSubm.read_or_new_pickle(fOutput, toLoad, 0)
         
         return code
-    
-    def computeTrainingMean(self, forceRun=0):
-        #computes the mean RGB value of the pixels in training
-        
-        resDir = os.path.join(self.getResultsDir(), 'collectionInfo','training')
-        fname = self.colName+'_mean'
-        rgb = uabUtilSubm.read_or_new_pickle(os.path.join(resDir, fname), toLoad=1)
-        
-        if(not(isinstance(rgb, np.ndarray))):
-            #make the directory for the results
-            try:
-                os.makedirs(resDir)
-            except:
-                pass
-            
-            rgb = np.zeros((1,3))
-            ind = 0
-            for tilename in self.tileTrList:
-                cIm = self.loadTileData('training' + uabUtilSubm.sl + tilename)
-                cr = cIm.reshape(cIm.shape[0]*cIm.shape[1],cIm.shape[2])
-                rgb += np.mean(cr, axis=0)
-                ind += 1
-                if(np.mod(ind,10) == 0):
-                    print 'Finished tile %d' % (ind)
-            
-            rgb /= len(self.tileTrList)
-            
-            uabUtilSubm.read_or_new_pickle(os.path.join(resDir, fname), toSave=1,variable_to_save=rgb)
-        
-        return rgb
-    
-    def computeClassProportions(self, forceRun=0):
-        #computes the class proportions of the pixels in training
-        resDir = os.path.join(self.getResultsDir(), 'collectionInfo','training')
-        fname = self.colName+'_classProps'
-        cprops = uabUtilSubm.read_or_new_pickle(os.path.join(resDir, fname), toLoad=1)
-        
-        if(not(isinstance(cprops, np.ndarray))):
-            #make the directory for the results
-            try:
-                os.makedirs(resDir)
-            except:
-                pass
-            
-            cprops = np.zeros(2)
-            ind = 0
-            totalPixels = np.prod(self.tileSize)
-            for tilename in self.tileTrList:
-                cIm = self.loadGTdata('training' + uabUtilSubm.sl + tilename)
-                cIm[cIm != 0] = 1
-                numTarget = sum(cIm.flatten())
-                cprops[0] += (totalPixels - numTarget) / totalPixels
-                cprops[1] += numTarget / totalPixels
-                
-                ind += 1
-                if(np.mod(ind,10) == 0):
-                    print 'Finished tile %d' % (ind)
-            
-            cprops /= len(self.tileTrList)
-            
-            uabUtilSubm.read_or_new_pickle(os.path.join(resDir, fname), toSave=1,variable_to_save=cprops)
-            
-        return cprops
-            
 """     
\ No newline at end of file
@@ -8,15 +8,28 @@ some globally utile functions
 """
 
 import os
+import threading
 from sys import platform
 from math import factorial
 import imageio
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+import uabChunkStore
 
 sl = os.path.sep
 
+#files & bytes (size of the arrays) that went through uabUtilAllTypeLoad, uabUtilAllTypeWindowLoad and uabUtilAllTypeSave
+#in this process, see uabBlockProfile
+ioCounters = {'files_read': 0, 'bytes_read': 0, 'files_written': 0, 'bytes_written': 0}
+
+ioLock = threading.Lock()
+
+def uabUtilCountIO(key, arr):
+    with ioLock:
+        ioCounters['files_' + key] += 1
+        ioCounters['bytes_' + key] += int(getattr(arr, 'nbytes', 0))
+
 if platform == 'win32':
     #this is the top-level directory with data & results obviously should be changed
     parentDir = 'Y:\\data\\'
@@ -46,7 +59,7 @@ def read_or_new_pickle(path, toLoad = 0, toSave = 0, variable_to_save = []):
         #race condition
         raise NameError('Cannot run function this way')
     
-    if path and os.path.isfile(path):    
+    if path and (os.path.isfile(path) or (uabChunkStore.isChunked(path) and uabChunkStore.exists(path))):
         #if the file exists and you wanted to load it
         if(toLoad == 1):
             return uabUtilAllTypeLoad(path)
@@ -64,23 +77,158 @@ def read_or_new_pickle(path, toLoad = 0, toSave = 0, variable_to_save = []):
 def uabUtilAllTypeLoad(fileName):
     #handles the loading of a file of all types in python
     try:
-        if fileName[-3:] != 'npy':
+        if uabChunkStore.isChunked(fileName):
+            outP = uabChunkStore.load(fileName)
+        elif fileName[-3:] != 'npy':
             #outP = scipy.misc.imread(fileName)
             outP = imageio.imread(fileName)
         else:
             outP = np.load(fileName)
         
+        uabUtilCountIO('read', outP)
         return outP
     except Exception: # so many things could go wrong, can't be more specific.
         raise IOError('Problem loading this data tile')
 
 def uabUtilAllTypeSave(fileName, variable_to_save):
     #handles the loading of a file of all types in python
-    if fileName[-3:] != 'npy':
+    if uabChunkStore.isChunked(fileName):
+        uabChunkStore.save(fileName, variable_to_save)
+    elif fileName[-3:] != 'npy':
         #scipy.misc.imsave(fileName, variable_to_save)
         imageio.imwrite(fileName, variable_to_save)
     else:
         np.save(fileName, variable_to_save) 
+    uabUtilCountIO('written', variable_to_save)
+
+def uabUtilSymmetricIndex(start, length, size):
+    #indexes of a window [start, start+length) into an axis of the given size.  Indexes that fall outside of the axis
+    #are mirrored the same way as np.pad(..., 'symmetric')
+    idx = np.arange(start, start + length) % (2 * size)
+    return np.where(idx < size, idx, 2 * size - 1 - idx)
+
+
+def uabUtilWindowFromArray(arr, y, x, h, w):
+    #window of an (memory-mapped) array with virtual symmetric padding at the borders.  Only the rows & columns
+    #inside the window are touched
+    iy = uabUtilSymmetricIndex(y, h, arr.shape[0])
+    ix = uabUtilSymmetricIndex(x, w, arr.shape[1])
+    y0, y1, x0, x1 = iy.min(), iy.max() + 1, ix.min(), ix.max() + 1
+    region = np.asarray(arr[y0:y1, x0:x1])
+    if y0 == y and y1 == y + h and x0 == x and x1 == x + w:
+        return region
+    return region[np.ix_(iy - y0, ix - x0)]
+
+
+def uabUtilWindowSums(arr, ys, xs, h, w):
+    #sums of arr over the windows [y:y+h, x:x+w] (one per entry of ys & xs) from its summed-area table, O(1) per window
+    #counts of a mask fit in int32 (half the memory of int64 for large tiles)
+    if arr.dtype == np.bool_ and arr.size < 2**31:
+        dtype = np.int32
+    else:
+        dtype = np.int64 if arr.dtype.kind in 'biu' else np.float64
+    sat = np.zeros((arr.shape[0] + 1, arr.shape[1] + 1), dtype=dtype)
+    np.cumsum(arr, axis=0, dtype=dtype, out=sat[1:, 1:])
+    np.cumsum(sat[1:, 1:], axis=1, out=sat[1:, 1:])
+    ys, xs = np.asarray(ys, dtype=np.int64), np.asarray(xs, dtype=np.int64)
+    return sat[ys + h, xs + w] - sat[ys, xs + w] - sat[ys + h, xs] + sat[ys, xs]
+
+class uabTiffRegionReader(object):
+    #reads rectangular regions of a tiff by decoding only the strips/tiles that intersect them (needs tifffile)
+
+    def __init__(self, page):
+        self.page = page
+        self.shape = page.shape
+
+    def __getitem__(self, key):
+        ys, xs = key
+        page = self.page
+        H, W = self.shape[0], self.shape[1]
+        y0, y1 = max(ys.start, 0), min(ys.stop, H)
+        x0, x1 = max(xs.start, 0), min(xs.stop, W)
+        if page.planarconfig != 1 and len(self.shape) == 3:
+            #separate planes are rare for our data, decode everything
+            return page.asarray()[y0:y1, x0:x1]
+
+        if page.is_tiled:
+            th, tw = page.tilelength, page.tilewidth
+            nx = -(-W // tw)
+            segs = [ty * nx + tx for ty in range(y0 // th, -(-y1 // th)) for tx in range(x0 // tw, -(-x1 // tw))]
+        else:
+            rps = min(page.rowsperstrip, H)
+            segs = list(range(y0 // rps, -(-y1 // rps)))
+
+        nChan = self.shape[2] if len(self.shape) == 3 else 1
+        out = np.zeros((y1 - y0, x1 - x0, nChan), dtype=page.dtype)
+        fh = page.parent.filehandle
+        for i in segs:
+            offset, count = page.dataoffsets[i], page.databytecounts[i]
+            data = None
+            if count > 0:
+                fh.seek(offset)
+                data = fh.read(count)
+            seg, index, segShape = page.decode(data, i, jpegtables=page.jpegtables)
+            if seg is None:
+                continue
+            seg = seg.reshape(segShape)[0]
+            sy, sx = index[2], index[3]
+            # intersect the segment with the region
+            a0, a1 = max(sy, y0), min(sy + seg.shape[0], y1)
+            b0, b1 = max(sx, x0), min(sx + seg.shape[1], x1)
+            if a1 > a0 and b1 > b0:
+                out[a0 - y0:a1 - y0, b0 - x0:b1 - x0] = seg[a0 - sy:a1 - sy, b0 - sx:b1 - sx]
+        if len(self.shape) == 2:
+            out = out[:, :, 0]
+        return out
+
+
+def uabUtilIsWindowable(fileName):
+    #whether uabUtilAllTypeWindowLoad() reads windows of this file without decoding all of it
+    ext = fileName.split('.')[-1].lower()
+    if ext in [uabChunkStore.chunkExt, 'npy']:
+        return True
+    if ext in ['tif', 'tiff']:
+        try:
+            import tifffile
+            return True
+        except ImportError:
+            return False
+    return False
+
+def uabUtilAllTypeWindowLoad(fileName, y, x, h, w):
+    """
+    Load the window [y:y+h, x:x+w] of a tile without decoding all of it.  Parts of the window that are outside of the
+    tile are filled by symmetric padding (as np.pad(..., 'symmetric')), so negative y/x are allowed
+    npy files are memory mapped, chunked tiles (.chk, see uabChunkStore) only decompress the chunks in the window, tiffs
+    are read strip/tile-wise if tifffile is installed.  Other formats are fully decoded and cropped
+    :param fileName: path to the tile
+    :param y, x: top left corner of the window
+    :param h, w: size of the window
+    :return: the window as a numpy array
+    """
+    out = None
+    try:
+        if uabChunkStore.isChunked(fileName):
+            out = uabUtilWindowFromArray(uabChunkStore.uabChunkedArray(fileName), y, x, h, w)
+        elif fileName[-3:] == 'npy':
+            out = uabUtilWindowFromArray(np.load(fileName, mmap_mode='r'), y, x, h, w)
+        elif fileName.split('.')[-1].lower() in ['tif', 'tiff']:
+            try:
+                import tifffile
+            except ImportError:
+                tifffile = None
+            if tifffile is not None:
+                with tifffile.TiffFile(fileName) as tif:
+                    out = uabUtilWindowFromArray(uabTiffRegionReader(tif.pages[0]), y, x, h, w)
+    except IOError:
+        raise
+    except Exception:
+        raise IOError('Problem loading this data tile')
+    if out is None:
+        #counted by uabUtilAllTypeLoad
+        return uabUtilWindowFromArray(uabUtilAllTypeLoad(fileName), y, x, h, w)
+    uabUtilCountIO('read', out)
+    return out
 
 def d2s(decimal, ndigs=5):
     #input decimal, returns it as a string with the dot replaced by a 'p'